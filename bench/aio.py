@@ -0,0 +1,56 @@
+""" Benchmark: latency of small requests, made while a large file is being parsed.
+
+Parses a large file and NSMALL small files concurrently, with aio.aparse_vgm()
+(chunked, so small files interleave with the large one) and with vgm.parse_vgm()
+called directly from a coroutine (which blocks the event loop).
+
+Usage: python -m bench.aio [path.vgm]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from vgmviz import aio, vgm
+
+DEFAULT_PATH = 'data/bell.vgm'
+NSMALL = 20
+
+
+async def blocking_parse(path):
+    return vgm.parse_vgm(path)
+
+
+async def run(name, parse, big, small):
+    t0 = time.perf_counter()
+    latencies = []
+
+    async def timed(path):
+        await parse(path)
+        latencies.append(time.perf_counter() - t0)
+
+    big_task = asyncio.create_task(parse(big))
+    await asyncio.sleep(0)
+    await asyncio.gather(*[timed(path) for path in small])
+    await big_task
+    total = time.perf_counter() - t0
+    print(f'{name:>12}: small requests median {statistics.median(latencies) * 1e3:7.1f} ms, '
+          f'total {total:.2f}s')
+
+
+def main(path=DEFAULT_PATH):
+    events = [vgm.YM2612Port0(0x28, 0xF0), vgm.Wait16Bit(735)] * 100
+    with tempfile.TemporaryDirectory() as tmp:
+        small = []
+        for i in range(NSMALL):
+            small.append(os.path.join(tmp, f'{i}.vgm'))
+            vgm.write_vgm(small[-1], events)
+
+        asyncio.run(run('blocking', blocking_parse, path, small))
+        asyncio.run(run('aparse_vgm', aio.aparse_vgm, path, small))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
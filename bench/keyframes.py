@@ -0,0 +1,62 @@
+""" Benchmark: random seeks into YM2612 register state, with and without keyframes,
+and sampling parameters at 60 fps (per-frame seeks vs param_frames()).
+
+Usage: python -m bench.keyframes [path.vgm]
+"""
+import random
+import sys
+import time
+
+from vgmviz import vgm
+from vgmviz.keyframes import Keyframes, param_frames
+
+DEFAULT_PATH = 'data/bell.vgm'
+NSEEK = 1000
+
+
+def bench(name, time_events, seeks, **kwargs):
+    t0 = time.perf_counter()
+    keyframes = Keyframes(time_events, **kwargs)
+    build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    states = [keyframes.state_at(t) for t in seeks]
+    seek = time.perf_counter() - t0
+
+    print(f'{name:>24}: build {build:.3f}s, {keyframes.nbytes:>8} bytes, '
+          f'{len(seeks) / seek:.0f} seeks/sec')
+    return states
+
+
+def main(path=DEFAULT_PATH):
+    header, events = vgm.parse_vgm(path)
+    time_events = vgm.keep_type(vgm.timed_from_linear(events),
+                                [vgm.YM2612Port0, vgm.YM2612Port1])
+
+    rng = random.Random(0)
+    seeks = [rng.randrange(header.nsamp) for _ in range(NSEEK)]
+
+    reference = bench('no keyframes', time_events, seeks, spacing=None)
+    for spacing in [44100, 4410, 735]:
+        states = bench(f'spacing={spacing}', time_events, seeks, spacing=spacing)
+        assert all((a == b).all() for a, b in zip(states, reference))
+    bench('spacing=735, 64KB budget', time_events, seeks, spacing=735,
+          max_bytes=0x10000)
+
+    # 60 fps frames
+    keyframes = Keyframes(time_events)
+    t0 = time.perf_counter()
+    per_frame = [keyframes.params_at(k * 735) for k in range(-(-header.nsamp // 735))]
+    seek = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    frames = param_frames(time_events, header.nsamp)
+    resample = time.perf_counter() - t0
+
+    assert all((a == b).all() for a, b in zip(per_frame, frames))
+    print(f'{len(frames)} frames at 60 fps: params_at() per frame {seek:.3f}s, '
+          f'param_frames() {resample:.3f}s')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,78 @@
+""" Benchmark: memory and window lookups for a song looped NLOOPS times.
+
+Compares copying the loop body (then re-timing it) against
+ym2612.LoopedEventIndex, a view over the TimedEventIndex of one play-through.
+
+Usage: python -m bench.loop [path.vgm]
+"""
+import gc
+import random
+import sys
+import time
+import tracemalloc
+
+from vgmviz import columnar, vgm, ym2612
+from vgmviz.vgm import TimedEvent
+
+DEFAULT_PATH = 'data/bell.vgm'
+NLOOPS = 8
+NWINDOW = 200
+
+
+def copied(unpacked, header, loop_index):
+    body = unpacked[loop_index:]
+    out = list(unpacked)
+    for k in range(1, NLOOPS):
+        out += [TimedEvent(t + k * header.loop_nsamp, e) for t, e in body]
+    return ym2612.TimedEventIndex(out)
+
+
+def view(unpacked, header, index, offsets):
+    return ym2612.LoopedEventIndex.from_header(index, header, NLOOPS, offsets)
+
+
+def measure(name, func, *args):
+    gc.collect()
+    tracemalloc.start()
+    out = func(*args)
+    gc.collect()
+    nbytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:>16}: {len(out)} events, {nbytes / 1e6:.2f} MB extra')
+    return out
+
+
+def bench_windows(name, index, windows):
+    t0 = time.perf_counter()
+    for begin, end in windows:
+        index.bound_ev_time(begin, end)
+    print(f'{name:>16}: {(time.perf_counter() - t0) / len(windows) * 1e3:.2f} ms/window')
+
+
+def main(path=DEFAULT_PATH):
+    header, events = vgm.parse_vgm(path)
+    unpacked = vgm.keep_type(
+        vgm.map_ev(vgm.timed_from_linear(events), ym2612.ev_unpack),
+        [ym2612.UnpackedEvent])
+    index = ym2612.TimedEventIndex(unpacked)
+
+    # File offsets of the same events, to find the loop start.
+    _, table = columnar.parse_vgm(path)
+    offsets = columnar.keep_type(columnar.timed_from_linear(table),
+                                 [vgm.YM2612Port0, vgm.YM2612Port1])['offset']
+    assert len(offsets) == len(unpacked)
+
+    looped = measure('LoopedEventIndex', view, unpacked, header, index, offsets)
+    full = measure('copied', copied, unpacked, header, looped.loop_index)
+
+    rng = random.Random(0)
+    windows = [(t, t + 44100) for t in
+               (rng.randrange(looped.duration) for _ in range(NWINDOW))]
+    for begin, end in windows[:10]:
+        assert looped.bound_ev_time(begin, end) == full.bound_ev_time(begin, end)
+    bench_windows('copied', full, windows)
+    bench_windows('LoopedEventIndex', looped, windows)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,53 @@
+""" Benchmark: memory used by a parsed VGM file (bytes/event).
+
+Compares vgm.timed_from_linear(vgm.parse_body()) (one dataclass + TimedEvent
+per command) against columnar.EventTable (one structured-array row per command).
+
+Usage: python -m bench.memory [path.vgm]
+"""
+import gc
+import sys
+import tracemalloc
+
+from vgmviz import vgm, columnar
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import VgmHeader, ENDIAN
+
+DEFAULT_PATH = 'data/bell.vgm'
+
+
+def measure(name, func, *args):
+    gc.collect()
+    tracemalloc.start()
+    out = func(*args)
+    gc.collect()
+    nbytes, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{name:>12}: {len(out)} events, {nbytes / 1e6:.1f} MB '
+          f'({nbytes / len(out):.1f} bytes/event), peak {peak / 1e6:.1f} MB')
+    return out
+
+
+def objects(ptr, header):
+    return vgm.timed_from_linear(vgm.parse_body(ptr, header))
+
+
+def table(ptr, header):
+    return columnar.EventTable(ptr, columnar.timed_from_linear(
+        columnar.parse_body(ptr, header)))
+
+
+def main(path=DEFAULT_PATH):
+    with open(path, 'rb') as f:
+        ptr = Pointer(f.read(), 0, ENDIAN)
+    header = VgmHeader.decode(ptr)
+
+    before = measure('objects', objects, ptr, header)
+    after = measure('EventTable', table, ptr, header)
+    assert before[:1000] == list(after[:1000])
+    assert before[-1000:] == list(after[-1000:])
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,36 @@
+""" Benchmark: cataloging throughput (files/min), reading only the header and GD3 tag
+(vgm.read_metadata()) vs parsing the whole file (columnar.parse_vgm()).
+
+Usage: python -m bench.metadata [path.vgm]
+"""
+import sys
+import time
+
+from vgmviz import vgm, columnar
+
+DEFAULT_PATH = 'data/bell.vgm'
+
+
+def bench(name, func, path, min_time=1.0) -> float:
+    n = 0
+    t0 = time.perf_counter()
+    while True:
+        func(path)
+        n += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            break
+
+    per_min = n / elapsed * 60
+    print(f'{name:>16}: {per_min:12,.0f} files/min')
+    return per_min
+
+
+def main(path=DEFAULT_PATH):
+    full = bench('parse_vgm', columnar.parse_vgm, path)
+    meta = bench('read_metadata', vgm.read_metadata, path)
+    print(f'{"speedup":>16}: {meta / full:.0f}x')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,56 @@
+""" Benchmark: file size and parse time of a re-encoded file,
+with vgm.linear_from_timed() vs optimize.optimize_linear().
+
+Usage: python -m bench.optimize [path.vgm]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from vgmviz import vgm, columnar, optimize
+
+DEFAULT_PATH = 'data/bell.vgm'
+
+
+def bench(name, path):
+    t0 = time.perf_counter()
+    columnar.parse_vgm(path)
+    parse = time.perf_counter() - t0
+
+    nbytes = os.path.getsize(path)
+    print(f'{name:>10}: {nbytes:>8} bytes, columnar parse {parse:.3f}s')
+    return nbytes
+
+
+def main(path=DEFAULT_PATH):
+    header, events = vgm.parse_vgm(path)
+    time_events = vgm.timed_from_linear(events)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, 'plain.vgm')
+        opt_path = os.path.join(tmp, 'opt.vgm')
+
+        # Same header and GD3 tag as the optimized file (without the loop).
+        vgm.save_vgm(plain_path, vgm.reencode_vgm(
+            vgm.load_vgm(path), vgm.linear_from_timed(time_events)))
+
+        t0 = time.perf_counter()
+        optimize.optimize_vgm(path, opt_path, verify=False)
+        encode = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        optimize.verify_equivalent(path, opt_path)
+        verify = time.perf_counter() - t0
+
+        original = bench('original', path)
+        plain = bench('plain', plain_path)
+        opt = bench('optimized', opt_path)
+
+    print(f'optimize_vgm {encode:.3f}s, verify_equivalent {verify:.3f}s')
+    print(f'saved {original - opt} bytes vs original ({opt / original:.1%}), '
+          f'{plain - opt} bytes vs plain ({opt / plain:.1%})')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
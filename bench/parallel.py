@@ -0,0 +1,54 @@
+""" Benchmark: parallel.parse_body_parallel() against serial decoding.
+
+Compares vgm.timed_from_linear(vgm.parse_body()) (serial objects),
+columnar.parse_body() (NumPy table, no objects per event),
+and parse_body_parallel() with 1 to os.cpu_count() threads.
+
+Usage: python -m bench.parallel [path.vgm]
+"""
+import os
+import sys
+import time
+
+from vgmviz import columnar, parallel, vgm
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import VgmHeader, ENDIAN
+
+DEFAULT_PATH = 'data/bell.vgm'
+
+
+def serial(ptr, header):
+    return vgm.timed_from_linear(vgm.parse_body(ptr, header))
+
+
+def table(ptr, header):
+    return columnar.timed_from_linear(columnar.parse_body(ptr, header))
+
+
+def bench(name, func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func(*args)
+        best = min(best, time.perf_counter() - t0)
+    print(f'{name:>12}: {len(out)} events in {best:.3f}s')
+    return out
+
+
+def main(path=DEFAULT_PATH):
+    with open(path, 'rb') as f:
+        ptr = Pointer(f.read(), 0, ENDIAN)
+    header = VgmHeader.decode(ptr)
+
+    expected = bench('serial', serial, ptr, header)
+    bench('columnar', table, ptr, header)
+
+    ncpu = os.cpu_count() or 1
+    workers = sorted({1, 2, ncpu})
+    for n in workers:
+        out = bench(f'{n} threads', parallel.parse_body_parallel, ptr, header, n)
+        assert out == expected
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
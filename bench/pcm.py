@@ -0,0 +1,40 @@
+""" Benchmark: DAC output of a whole song, replayed in Python (synth.dac_stream())
+vs vectorized over the columnar event table (pcm.dac_stream()).
+
+Usage: python -m bench.pcm [path.vgm]
+"""
+import sys
+import time
+
+import numpy as np
+
+from vgmviz import columnar, vgm, pcm, synth
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import VgmHeader, ENDIAN
+
+DEFAULT_PATH = 'data/bell.vgm'
+
+
+def main(path=DEFAULT_PATH):
+    ptr = Pointer(vgm.load_vgm(path), 0, ENDIAN)
+    header = VgmHeader.decode(ptr)
+    time_events = vgm.timed_from_linear(vgm.parse_body(ptr, header))
+    table = columnar.parse_body(ptr, header)
+
+    t0 = time.perf_counter()
+    expected = synth.dac_stream(time_events, header.nsamp)
+    replay = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    out = pcm.dac_stream(ptr, table, header.nsamp)
+    vectorized = time.perf_counter() - t0
+
+    assert np.array_equal(out, expected, equal_nan=True)
+    nwrites = len(pcm.pcm_writes(ptr, table))
+    print(f'{nwrites} DAC writes, {header.nsamp} samples')
+    print(f'  python replay: {replay:.3f}s')
+    print(f'     vectorized: {vectorized:.3f}s ({replay / vectorized:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
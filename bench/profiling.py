@@ -0,0 +1,44 @@
+""" Benchmark: overhead of vgmviz.profiling on vgm.parse_body() and
+columnar.parse_body(), with no Profiler active vs with one active.
+
+Usage: python -m bench.profiling [path.vgm]
+"""
+import contextlib
+import sys
+import time
+
+from vgmviz import vgm, columnar
+from vgmviz.pointer import Pointer
+from vgmviz.profiling import Profiler
+from vgmviz.vgm import VgmHeader, ENDIAN
+
+DEFAULT_PATH = 'data/bell.vgm'
+
+
+def bench(name, func, ptr, header, context, repeat=3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        with context():
+            t0 = time.perf_counter()
+            func(ptr, header)
+            best = min(best, time.perf_counter() - t0)
+
+    print(f'{name:>24}: {best:.3f}s')
+    return best
+
+
+def main(path=DEFAULT_PATH):
+    ptr = Pointer(vgm.load_vgm(path), 0, ENDIAN)
+    header = VgmHeader.decode(ptr)
+
+    for module in [vgm, columnar]:
+        name = module.__name__.split('.')[-1]
+        off = bench(f'{name} disabled', module.parse_body, ptr, header,
+                    contextlib.nullcontext)
+        on = bench(f'{name} enabled', module.parse_body, ptr, header,
+                   lambda: Profiler(memory=False))
+        print(f'{"overhead when enabled":>24}: {on / off - 1:.0%}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
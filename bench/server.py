@@ -0,0 +1,55 @@
+""" Benchmark: NREQUEST concurrent uploads of one file to vgmviz.server,
+cold (coalesced into one parse) and warm (LRU cache hits),
+against NREQUEST independent parses.
+
+Usage: python -m bench.server [path.vgm]
+"""
+import http.client
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from vgmviz.server import VgmServer, Song, song_key
+
+DEFAULT_PATH = 'data/bell.vgm'
+NREQUEST = 8
+
+
+def post(port, data):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    try:
+        conn.request('POST', '/parse', data)
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 200, response.status
+    finally:
+        conn.close()
+
+
+def concurrent(name, port, data):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(NREQUEST) as pool:
+        list(pool.map(lambda _: post(port, data), range(NREQUEST)))
+    print(f'{name:>24}: {time.perf_counter() - t0:.2f}s')
+
+
+def main(path=DEFAULT_PATH):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    t0 = time.perf_counter()
+    Song(song_key(data), data)
+    print(f'{f"{NREQUEST} parses (estimated)":>24}: '
+          f'{NREQUEST * (time.perf_counter() - t0):.2f}s')
+
+    with VgmServer(('127.0.0.1', 0)) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        concurrent('cold (coalesced)', server.server_port, data)
+        concurrent('warm (cached)', server.server_port, data)
+        print(server.songs.stats())
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,31 @@
+""" Benchmark: YM2612 synthesis throughput, as a real-time factor
+(seconds of audio rendered per second of CPU time; > 1 is faster than real time).
+
+Usage: python -m bench.synth [path.vgm] [seconds]
+"""
+import sys
+import time
+
+from vgmviz import vgm
+from vgmviz.synth import YM2612Synth, RATE
+
+DEFAULT_PATH = 'data/bell.vgm'
+
+
+def main(path=DEFAULT_PATH, seconds='30'):
+    header, events = vgm.parse_vgm(path)
+    time_events = vgm.timed_from_linear(events)
+    nsamp = min(int(float(seconds) * RATE), header.nsamp)
+
+    for fb_iterations in [1, 4]:
+        synth = YM2612Synth(header.ym2612_clock, fb_iterations=fb_iterations)
+        t0 = time.perf_counter()
+        synth.render(time_events, nsamp)
+        elapsed = time.perf_counter() - t0
+
+        print(f'fb_iterations={fb_iterations}: {nsamp / RATE:.1f}s of audio '
+              f'in {elapsed:.2f}s = {nsamp / RATE / elapsed:.1f}x real time')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
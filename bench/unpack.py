@@ -0,0 +1,72 @@
+""" Benchmark: unpacking YM2612 register writes (events/sec).
+
+Compares ev_unpack as originally implemented (reg_unpack() arithmetic,
+plus dataclasses.replace() for Port1) against the precomputed tables:
+map_ev(ev_unpack), iter_ev_unpack(), and unpack_all() over columnar arrays.
+
+Usage: python -m bench.unpack [path.vgm]
+"""
+import functools
+import sys
+import time
+from dataclasses import replace
+
+from vgmviz import vgm, columnar, ym2612
+from vgmviz.ym2612 import UnpackedEvent, reg_unpack
+
+DEFAULT_PATH = 'data/bell.vgm'
+
+
+@functools.singledispatch
+def reference_unpack(e):
+    """ ev_unpack() as it worked before lookup tables. """
+    return e
+
+
+@reference_unpack.register(vgm.YM2612Port0)
+@reference_unpack.register(vgm.YM2612Port1)
+def _(e):
+    unpack = reg_unpack(e.reg)
+    if isinstance(e, vgm.YM2612Port1):
+        unpack = replace(unpack, chan=unpack.chan + 3)
+    return UnpackedEvent(unpack, e.value)
+
+
+def bench(name, func, arg, n, repeat=3):
+    best = float('inf')
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func(arg)
+        best = min(best, time.perf_counter() - t0)
+
+    print(f'{name:>16}: {n} events in {best:.3f}s = {n / best / 1e6:.2f}M events/sec')
+    return out
+
+
+def main(path=DEFAULT_PATH):
+    header, events = vgm.parse_vgm(path)
+    time_events = vgm.keep_type(vgm.timed_from_linear(events),
+                                [vgm.YM2612Port0, vgm.YM2612Port1])
+    n = len(time_events)
+
+    before = bench('reference', lambda t_e: vgm.map_ev(t_e, reference_unpack),
+                   time_events, n)
+    after = bench('map_ev', lambda t_e: vgm.map_ev(t_e, ym2612.ev_unpack),
+                  time_events, n)
+    assert before == after
+    after = bench('iter_ev_unpack', lambda t_e: list(ym2612.iter_ev_unpack(t_e)),
+                  time_events, n)
+    assert before == after
+
+    header, table = columnar.parse_vgm(path)
+    table = columnar.keep_type(table, [vgm.YM2612Port0, vgm.YM2612Port1])
+    unpacked = bench('unpack_all', lambda t: ym2612.unpack_all(t['port'], t['reg']),
+                     table, len(table))
+    assert [tuple(r) for r in unpacked.tolist()] == [
+        (t_e.event.unpack.chan, t_e.event.unpack.op, t_e.event.unpack.param)
+        for t_e in before]
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,45 @@
+""" Benchmark: write_vgm throughput (MB/s), round-tripping a parsed file.
+
+Compares writing each field to the file (buffered=False)
+against encoding into a BufferWriter and writing once (buffered=True).
+
+Usage: python -m bench.write [path.vgm]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from vgmviz.vgm import parse_vgm, write_vgm
+
+DEFAULT_PATH = 'data/bell.vgm'
+
+
+def bench(name, header, events, out_path, repeat=3, **kwargs) -> bytes:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        write_vgm(out_path, events, header, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+
+    nbytes = os.path.getsize(out_path)
+    print(f'{name:>10}: {nbytes} bytes in {best:.3f}s = {nbytes / best / 1e6:.2f} MB/s')
+
+    with open(out_path, 'rb') as f:
+        return f.read()
+
+
+def main(path=DEFAULT_PATH):
+    header, events = parse_vgm(path)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, 'out.vgm')
+        before = bench('unbuffered', header, events, out_path, buffered=False)
+        after = bench('buffered', header, events, out_path, buffered=True)
+
+        assert before == after
+        assert parse_vgm(out_path)[1] == events
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -1,8 +1,14 @@
+import re
+
 from setuptools import setup
 
+# vgmviz/__init__.py holds the version (read without importing vgmviz).
+with open('vgmviz/__init__.py') as f:
+    version = re.search(r"^__version__ = '(.*)'", f.read(), re.M).group(1)
+
 setup(
     name='vgmviz',
-    version='',
+    version=version,
     packages=[''],
     url='',
     license='',
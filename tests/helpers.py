@@ -0,0 +1,30 @@
+""" VGM files for tests. """
+from typing import Tuple
+
+from vgmviz import columnar, vgm
+from vgmviz.columnar import EventArray
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import VgmHeader, LinearEventList, ENDIAN
+
+
+def make_vgm(body: bytes) -> bytes:
+    """ Minimal VGM 1.50 file with data at 0x40. """
+    header = bytearray(0x40)
+    header[0x00:0x04] = b'Vgm '
+    header[0x08:0x0C] = (0x150).to_bytes(4, ENDIAN)
+    header[0x34:0x38] = (0x40 - 0x34).to_bytes(4, ENDIAN)
+
+    data = header + body
+    data[0x04:0x08] = (len(data) - 0x04).to_bytes(4, ENDIAN)
+    return bytes(data)
+
+
+def open_vgm(data: bytes) -> Tuple[Pointer, VgmHeader]:
+    ptr = Pointer.create(data, ENDIAN)
+    return ptr, VgmHeader.decode(ptr)
+
+
+def parse_both(data: bytes) -> Tuple[Pointer, LinearEventList, EventArray]:
+    """ Parse with vgm.parse_body() and columnar.parse_body(). """
+    ptr, header = open_vgm(data)
+    return ptr, vgm.parse_body(ptr, header), columnar.parse_body(ptr, header)
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from vgmviz import aio, vgm
+from vgmviz.aio import VgmLoader, aparse_vgm, aiter_vgm
+from vgmviz.pointer import EndOfFileError
+from vgmviz.vgm import YM2612Port0, Wait16Bit, PSGWrite
+
+BELL = 'data/bell.vgm'
+
+EVENTS = [YM2612Port0(0x28, 0xF0), Wait16Bit(100), PSGWrite(0x9F), Wait16Bit(50)] * 50
+
+
+def write(tmp_path, name, events=EVENTS):
+    path = str(tmp_path / name)
+    vgm.write_vgm(path, events)
+    return path
+
+
+async def collect(aiterator):
+    return [x async for x in aiterator]
+
+
+def test_bell():
+    assert asyncio.run(aparse_vgm(BELL)) == vgm.parse_vgm(BELL)
+
+
+@pytest.mark.parametrize('executor', [None, aio.THREAD, aio.PROCESS])
+@pytest.mark.parametrize('name', ['a.vgm', 'a.vgz'])
+def test_parse(tmp_path, executor, name):
+    path = write(tmp_path, name)
+
+    async def main():
+        async with VgmLoader(executor, workers=2, chunk_size=100) as loader:
+            return (
+                await aparse_vgm(path, loader=loader),
+                await aparse_vgm(path, ['ym2612'], loader=loader),
+                await collect(aiter_vgm(path, loader=loader)),
+                await collect(loader.iter_vgm(path, timed=True)),
+            )
+
+    parsed, ym2612, linear, timed = asyncio.run(main())
+    assert parsed == vgm.parse_vgm(path)
+    assert ym2612 == vgm.parse_vgm(path, chips=['ym2612'])
+    assert linear == parsed[1]
+    assert timed == list(vgm.iter_vgm(path, timed=True))
+
+
+def test_errors(tmp_path):
+    path = str(tmp_path / 'short.vgm')
+    with open(path, 'wb') as f:
+        f.write(b'Vgm ')
+    with pytest.raises(EndOfFileError):
+        asyncio.run(aparse_vgm(path))
+
+    # Missing the end-of-data command, and a partial command.
+    truncated = str(tmp_path / 'truncated.vgm')
+    with open(write(tmp_path, 'full.vgm'), 'rb') as f:
+        data = f.read()
+    with open(truncated, 'wb') as f:
+        f.write(data[:-10])
+    for executor in [None, aio.PROCESS]:
+        loader = VgmLoader(executor, workers=1)
+        with pytest.raises(EndOfFileError):
+            asyncio.run(aparse_vgm(truncated, loader=loader))
+        with pytest.raises(EndOfFileError):
+            asyncio.run(collect(aiter_vgm(truncated, loader=loader)))
+        loader.close()
+    with pytest.raises(ValueError, match='ym9999'):
+        asyncio.run(aparse_vgm(BELL, chips=['ym9999']))
+    with pytest.raises(ValueError):
+        VgmLoader('fiber')
+
+
+def record_feeds(monkeypatch):
+    """ Returns a list, which gets the _Decoder of each decoded chunk. """
+    feeds = []
+    feed = aio._Decoder.feed
+
+    def recording_feed(self, chunk):
+        feeds.append(self)
+        return feed(self, chunk)
+
+    monkeypatch.setattr(aio._Decoder, 'feed', recording_feed)
+    return feeds
+
+
+@pytest.mark.parametrize('max_concurrent', [1, 2])
+def test_concurrency(tmp_path, monkeypatch, max_concurrent):
+    feeds = record_feeds(monkeypatch)
+    big = write(tmp_path, 'big.vgm', EVENTS * 20)
+    small = write(tmp_path, 'small.vgm')
+    done = []
+
+    async def parse(loader, path):
+        await loader.parse_vgm(path)
+        done.append(path)
+
+    async def main():
+        loader = VgmLoader(max_concurrent=max_concurrent, chunk_size=256)
+        await asyncio.gather(parse(loader, big), parse(loader, small))
+
+    asyncio.run(main())
+    decoders = list(dict.fromkeys(feeds))
+    assert len(decoders) == 2
+
+    runs = sum(a is not b for a, b in zip(feeds, feeds[1:])) + 1
+    if max_concurrent == 1:
+        # One file at a time.
+        assert runs == 2
+        assert done == [big, small]
+    else:
+        # The small file does not wait for the big one.
+        assert runs > 2
+        assert done == [small, big]
+
+
+def test_cancel(tmp_path, monkeypatch):
+    feeds = record_feeds(monkeypatch)
+    path = write(tmp_path, 'big.vgm', EVENTS * 20)
+
+    async def main():
+        loader = VgmLoader(chunk_size=256)
+        task = asyncio.create_task(loader.parse_vgm(path))
+        while len(feeds) < 3:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        ncancel = len(feeds)
+        await asyncio.sleep(0.05)
+        return ncancel
+
+    ncancel = asyncio.run(main())
+    assert len(feeds) == ncancel
+    assert ncancel < 30
@@ -0,0 +1,50 @@
+import json
+import shutil
+
+from vgmviz import batch, columnar
+from vgmviz.__main__ import main
+
+BELL = 'data/bell.vgm'
+
+
+def make_files(tmp_path):
+    shutil.copy(BELL, tmp_path / 'a.vgm')
+    (tmp_path / 'b.vgm').write_bytes(b'not a vgm file' * 10)
+    (tmp_path / 'notes.txt').write_bytes(b'')
+    return [str(tmp_path / 'a.vgm'), str(tmp_path / 'b.vgm')]
+
+
+def test_parse_many(tmp_path):
+    paths = make_files(tmp_path)
+    assert batch.find_vgm([str(tmp_path)]) == paths
+
+    for workers in [1, 2]:
+        ok, bad = batch.parse_many(paths, workers)
+
+        assert ok.ok
+        header, events = columnar.parse_vgm(BELL)
+        assert ok.header == header
+        assert (ok.events == events).all()
+
+        assert not bad.ok
+        assert bad.error.startswith('MagicError')
+
+
+def test_cli(tmp_path, capsys):
+    make_files(tmp_path)
+    assert main(['batch', '-j', '1', str(tmp_path)]) == 1
+
+    ok, bad = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert ok['nevents'] == 1000658
+    assert 'error' in bad
+
+
+def test_cli_cache(tmp_path, capsys):
+    make_files(tmp_path)
+    cache_dir = tmp_path / 'cache'
+    for _ in range(2):
+        assert main(['batch', '-j', '1', '--cache', str(cache_dir),
+                     str(tmp_path / 'a.vgm')]) == 0
+    first, second = capsys.readouterr().out.splitlines()
+    assert first == second
+    assert len(list(cache_dir.glob('*.npy'))) == 1
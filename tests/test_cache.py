@@ -0,0 +1,84 @@
+import os
+import shutil
+
+import numpy as np
+
+from vgmviz import columnar
+from vgmviz.cache import ParseCache
+
+BELL = 'data/bell.vgm'
+
+
+def test_hit(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache'))
+    header, events = columnar.parse_vgm(BELL)
+
+    for _ in range(2):
+        cached_header, cached_events = cache.parse_vgm(BELL)
+        assert cached_header == header
+        assert (cached_events == events).all()
+
+    assert isinstance(cached_events, np.memmap)
+    assert len(cache.keys()) == 1
+
+
+def test_key(tmp_path):
+    path = str(tmp_path / 'a.vgm')
+    shutil.copy(BELL, path)
+    key = ParseCache.key(path)
+    assert ParseCache.key(path) == key
+
+    # Same contents, different mtime
+    os.utime(path, ns=(0, 0))
+    assert ParseCache.key(path) != key
+
+
+def test_evict(tmp_path):
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f'{i}.vgm')
+        shutil.copy(BELL, path)
+        os.utime(path, ns=(i, i))  # different keys
+        paths.append(path)
+
+    cache = ParseCache(str(tmp_path / 'cache'), max_bytes=None)
+    keys = []
+    for i, path in enumerate(paths):
+        cache.parse_vgm(path)
+        key = cache.key(path)
+        os.utime(cache._path(key, '.npy'), ns=(i, i))
+        keys.append(key)
+    assert cache.keys() == keys
+    entry_nbytes = cache.entry_nbytes(keys[0])
+
+    # Using key 0 makes it most recent.
+    cache.parse_vgm(paths[0])
+    assert cache.keys() == keys[1:] + keys[:1]
+
+    cache.max_bytes = 2 * entry_nbytes
+    cache.evict()
+    assert cache.keys() == [keys[2], keys[0]]
+    assert cache.nbytes == 2 * entry_nbytes
+
+    cache.max_bytes = 0
+    cache.evict()
+    assert cache.keys() == [keys[0]]
+
+    cache.clear()
+    assert cache.keys() == []
+    assert os.listdir(cache.directory) == []
+
+
+def test_vgz(tmp_path):
+    from vgmviz import vgm
+
+    header, events = vgm.parse_vgm(BELL)
+    path = str(tmp_path / 'bell.vgz')
+    vgm.write_vgm(path, events, header)
+    header, events = columnar.parse_vgm(path)
+
+    cache = ParseCache(str(tmp_path / 'cache'))
+    for _ in range(2):
+        cached_header, cached_events = cache.parse_vgm(path)
+        assert cached_header == header
+        assert (cached_events == events).all()
@@ -0,0 +1,71 @@
+import pytest
+
+from vgmviz import columnar, vgm
+from vgmviz.vgm import VgmNotImplemented
+from tests.helpers import make_vgm, open_vgm, parse_both
+
+BELL = 'data/bell.vgm'
+
+
+def test_small():
+    body = bytes.fromhex(
+        '52 28 f0'  # YM2612Port0
+        '67 66 00 02000000 abcd'  # DataBlock
+        'e0 01000000'  # PCMSeek
+        '61 0001'  # Wait16Bit(256)
+        '53 b4 c0'  # YM2612Port1
+        '7f 83'  # Wait4Bit(16), PCMWriteWait(3)
+        '66'
+    )
+    ptr, events, table = parse_both(make_vgm(body))
+
+    assert table['command'].tolist() == [0x52, 0x67, 0xE0, 0x61, 0x53, 0x7F, 0x83]
+    assert table['offset'].tolist() == [0x40, 0x43, 0x4C, 0x51, 0x54, 0x57, 0x58]
+    assert table['delay'].tolist() == [0, 0, 0, 256, 0, 16, 3]
+    assert table['time'].tolist() == [0, 0, 0, 0, 256, 256, 272]
+    assert table['port'].tolist() == [0, 0, 0, 0, 1, 0, 0]
+    assert table['reg'][[0, 1, 4]].tolist() == [0x28, 0x00, 0xB4]
+    assert table['value'][[0, 1, 2, 4]].tolist() == [0xF0, 2, 1, 0xC0]
+
+    timed = columnar.timed_from_linear(table)
+    assert timed['time'].tolist() == [t_e.time for t_e in vgm.timed_from_linear(events)]
+
+    assert columnar.data_blocks(ptr, table) == [events[1]]
+
+
+def test_unhandled():
+    with pytest.raises(VgmNotImplemented):
+        parse_both(make_vgm(bytes.fromhex('52 28 f0 00 66')))
+
+
+def test_bell():
+    header, events = vgm.parse_vgm(BELL)
+    _, table = columnar.parse_vgm(BELL)
+    assert len(table) == len(events)
+
+    time_events = vgm.timed_from_linear(events)
+    timed = columnar.timed_from_linear(table)
+    assert timed['time'].tolist() == [t_e.time for t_e in time_events]
+
+    cls = [vgm.YM2612Port0]
+    assert columnar.keep_type(timed, cls)['value'].tolist() == \
+        [t_e.event.value for t_e in vgm.keep_type(time_events, cls)]
+
+    begin, end = 1000, 500000
+    assert len(columnar.filter_ev_time(timed, begin, end)) == \
+        len(vgm.filter_ev_time(time_events, begin, end))
+
+
+def test_event_table():
+    ptr, header = open_vgm(open(BELL, 'rb').read())
+    expected = vgm.timed_from_linear(vgm.parse_body(ptr, header))
+
+    table = columnar.EventTable(
+        ptr, columnar.timed_from_linear(columnar.parse_body(ptr, header)))
+    assert len(table) == len(expected)
+    assert list(table[:2000]) == expected[:2000]
+    assert list(table[-2000:]) == expected[-2000:]
+    assert table[12345] == expected[12345]
+    assert table[-1] == expected[-1]
+    assert list(table[100:200].linear()) == [e for _, e in expected[100:200]]
+    assert table.nbytes == len(table) * columnar.EVENT_DTYPE.itemsize
@@ -0,0 +1,138 @@
+""" VGM 1.71 command coverage. """
+import pytest
+
+from vgmviz import columnar, vgm, parallel
+from vgmviz.datastruct import cmd2event, event_layout
+from vgmviz.vgm import VgmNotImplemented
+from tests.helpers import make_vgm, open_vgm
+
+BODY = bytes.fromhex(
+    '50 9f'  # PSGWrite
+    '4f ff'  # GGStereo
+    '30 9f'  # PSGWrite2
+    '31 01'  # AY8910StereoMask
+    '32 00'  # reserved
+    '40 01 02'  # reserved
+    '51 10 20'  # YM2413
+    'a2 28 f0'  # YM2612Port0_2
+    'c0 3412 56'  # SegaPCM (little-endian address)
+    'c4 1234 05'  # QSound (big-endian value)
+    'c5 1234 56'  # SCSP (big-endian address)
+    'c9 00 00 00'  # reserved
+    'd0 01 02 03'  # YMF278B
+    'd6 05 1234'  # ES5506Word
+    'e1 1234 5678'  # C352
+    'e2 00 00 00 00'  # reserved
+    '62 63'  # Wait735, Wait882
+    '68 66 00 010000 020000 030000'  # PCMRamWrite
+    '90 00 02 00 2a'  # DacStreamSetup
+    '91 00 00 01 00'  # DacStreamData
+    '92 00 44ac0000'  # DacStreamFrequency
+    '93 00 00000000 01 10000000'  # DacStreamStart
+    '94 00'  # DacStreamStop
+    '95 00 0100 00'  # DacStreamStartBlock
+    '52 2b 80'  # YM2612Port0
+    '66'
+)
+
+EXPECTED = [
+    vgm.PSGWrite(0x9F),
+    vgm.GGStereo(0xFF),
+    vgm.PSGWrite2(0x9F),
+    vgm.AY8910StereoMask(1),
+    vgm.YM2413(0x10, 0x20),
+    vgm.YM2612Port0_2(0x28, 0xF0),
+    vgm.SegaPCM(0x1234, 0x56),
+    vgm.QSound(0x1234, 5),
+    vgm.SCSP(0x1234, 0x56),
+    vgm.YMF278B(1, 2, 3),
+    vgm.ES5506Word(5, 0x1234),
+    vgm.C352(0x1234, 0x5678),
+    vgm.Wait735(),
+    vgm.Wait882(),
+    vgm.PCMRamWrite(b'\x66', 0, 1, 2, 3),
+    vgm.DacStreamSetup(0, 2, 0, 0x2A),
+    vgm.DacStreamData(0, 0, 1, 0),
+    vgm.DacStreamFrequency(0, 44100),
+    vgm.DacStreamStart(0, 0, 1, 16),
+    vgm.DacStreamStop(0),
+    vgm.DacStreamStartBlock(0, 1, 0),
+    vgm.YM2612Port0(0x2B, 0x80),
+]
+
+
+def parse(body=BODY, chips=None):
+    ptr, header = open_vgm(make_vgm(body))
+    return ptr, header, vgm.parse_body(ptr, header, chips)
+
+
+def test_commands():
+    ptr, header, events = parse()
+    assert events == EXPECTED
+
+    table = columnar.parse_body(ptr, header)
+    assert table['command'].tolist() == [type(e).base_command for e in events]
+    assert columnar.decode_rows(ptr, table) == events
+    assert table['time'][-1] == 735 + 882
+    assert table['port'][9] == 1  # YMF278B.port
+
+    assert [e for _, e in parallel.parse_body_parallel(ptr, header, 2)] \
+        == [e for e in events if not isinstance(e, vgm.PureWait)]
+
+
+def test_round_trip():
+    ptr, header = open_vgm(bytes(vgm.encode_vgm(EXPECTED)))
+    assert vgm.parse_body(ptr, header) == EXPECTED
+
+
+def test_incremental():
+    data = make_vgm(BODY)
+    parser = vgm.IncrementalParser()
+    events = []
+    for i in range(len(data)):
+        events += parser.feed_linear(data[i:i + 1])
+    assert parser.done
+    assert events == EXPECTED
+
+
+def test_sizes():
+    """ Every command from 0x30 to 0xFF has a size, except the terminator and
+    commands the spec leaves undefined. """
+    undefined = {0x60, 0x64, 0x65, 0x66, *range(0x69, 0x70), *range(0x96, 0xA0)}
+    for command in range(0x30, 0x100):
+        if command in undefined:
+            continue
+        cls = cmd2event.get(command)
+        if cls is None:
+            assert command in vgm.RESERVED_SIZES
+        else:
+            assert event_layout(cls).size > 0
+
+
+@pytest.mark.parametrize('chips', [['ym2612'], []])
+def test_chips(chips):
+    ptr, header, events = parse(chips=chips)
+    expected = [e for e in EXPECTED
+                if type(e).chip is None or type(e).chip in chips
+                or isinstance(e, vgm.IWait)]
+    assert events == expected
+
+    table = columnar.parse_body(ptr, header, chips)
+    assert columnar.decode_rows(ptr, table) == expected
+
+    parser = vgm.IncrementalParser(chips=chips)
+    assert parser.feed_linear(make_vgm(BODY)) == expected
+
+
+def test_chips_waits():
+    """ Waits are kept even if their chip is skipped. """
+    body = bytes.fromhex('52 2b 80 83 50 9f 66')
+    _, _, events = parse(body, chips=['sn76489'])
+    assert events == [vgm.PCMWriteWait(3), vgm.PSGWrite(0x9F)]
+
+
+def test_unknown():
+    with pytest.raises(ValueError, match='ym9999'):
+        parse(chips=['ym9999'])
+    with pytest.raises(VgmNotImplemented):
+        parse(bytes.fromhex('64 00 66'))
@@ -0,0 +1,69 @@
+import io
+import pickle
+import sys
+
+import pytest
+
+from vgmviz.datastruct import _get_codec
+from vgmviz.pointer import Pointer, Writer
+from vgmviz.vgm import DataBlock, PCMSeek, PCMWriteWait, Wait4Bit, Wait16Bit, \
+    YM2612Port0, YM2612Port1, ENDIAN
+
+
+def roundtrip(event) -> bytes:
+    wrt = Writer(io.BytesIO(), ENDIAN)
+    event.encode(wrt)
+    data = wrt.file.getvalue()
+
+    ptr = Pointer.create(data, ENDIAN)
+    command = ptr.u8()
+    assert type(event).decode(ptr, command) == event
+    assert ptr.addr == len(data)
+    return data
+
+
+def test_fixed_size():
+    assert roundtrip(YM2612Port0(0x28, 0xF0)) == bytes([0x52, 0x28, 0xF0])
+    assert roundtrip(YM2612Port1(0xB4, 0xC0)) == bytes([0x53, 0xB4, 0xC0])
+    assert roundtrip(Wait16Bit(0x1234)) == bytes([0x61, 0x34, 0x12])
+    assert roundtrip(PCMSeek(0x010203)) == bytes([0xE0, 0x03, 0x02, 0x01, 0x00])
+
+    assert _get_codec(YM2612Port0, ENDIAN).fixed_size == 3
+    assert _get_codec(PCMSeek, ENDIAN).fixed_size == 5
+    assert _get_codec(DataBlock, ENDIAN).fixed_size is None
+
+
+def test_parametric_encode():
+    # command() is not defined, so encode() inverts `parameterize`.
+    assert roundtrip(Wait4Bit(1)) == bytes([0x70])
+    assert roundtrip(Wait4Bit(16)) == bytes([0x7F])
+    assert roundtrip(PCMWriteWait(0)) == bytes([0x80])
+    assert roundtrip(PCMWriteWait(15)) == bytes([0x8F])
+
+    with pytest.raises(ValueError):
+        roundtrip(Wait4Bit(17))
+
+
+def test_data_block():
+    event = DataBlock(b'\x66', 0x00, 3, b'abc')
+    assert roundtrip(event) == bytes([0x67, 0x66, 0x00, 3, 0, 0, 0]) + b'abc'
+
+
+def test_subclass_codecs():
+    # YM2612Port0 and YM2612Port1 share Write8as8's fields, but not its codec.
+    assert _get_codec(YM2612Port0, ENDIAN) is not _get_codec(YM2612Port1, ENDIAN)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason='slots need Python 3.10')
+def test_slots():
+    from vgmviz.datastruct import cmd2event
+
+    for command, cls in cmd2event.items():
+        assert cls.__dictoffset__ == 0, cls
+        assert cls.base_command in cls.commands
+        assert command in cls.commands
+
+    event = YM2612Port0(0x28, 0xF0)
+    with pytest.raises(AttributeError):
+        event.foo = 1
+    assert pickle.loads(pickle.dumps(event)) == event
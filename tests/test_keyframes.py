@@ -0,0 +1,70 @@
+import numpy as np
+
+from vgmviz.keyframes import Keyframes
+from vgmviz.vgm import TimedEvent, YM2612Port0, YM2612Port1, PCMWriteWait
+from vgmviz.ym2612 import ev_unpack, PARAMS, Atten, FeedbackAlgo
+
+
+def make_events():
+    writes = [
+        (0, YM2612Port0(0x40, 1)),
+        (0, PCMWriteWait(0)),
+        (5, YM2612Port0(0x40, 2)),
+        (5, YM2612Port1(0xB2, 7)),
+        (10, YM2612Port0(0x40, 3)),
+        (10, YM2612Port0(0x40, 4)),
+        (25, YM2612Port0(0x2B, 0x80)),
+    ]
+    return [TimedEvent(time, e) for time, e in writes]
+
+
+def replay(time_events, time):
+    state = np.zeros((2, 0x100), np.uint8)
+    for t, e in time_events:
+        if t <= time and isinstance(e, (YM2612Port0, YM2612Port1)):
+            state[e.port, e.reg] = e.value
+    return state
+
+
+def test_state_at():
+    time_events = make_events()
+    unpacked = [TimedEvent(t, ev_unpack(e)) for t, e in time_events]
+
+    for spacing in [None, 1, 4, 10, 100]:
+        for events in [time_events, unpacked]:
+            keyframes = Keyframes(events, spacing)
+            for time in range(-1, 30):
+                assert (keyframes.state_at(time) == replay(time_events, time)).all()
+
+
+def test_max_bytes():
+    keyframes = Keyframes(make_events(), spacing=1, max_bytes=3 * 512)
+    assert len(keyframes) <= 3
+    assert keyframes.nbytes <= 3 * 512
+    assert (keyframes.state_at(26) == replay(make_events(), 26)).all()
+
+
+def test_params_at():
+    params = Keyframes(make_events(), spacing=4).params_at(7)
+    assert params[0, 0, PARAMS.index(Atten)] == 2
+    assert (params[5, :, PARAMS.index(FeedbackAlgo)] == 7).all()
+
+
+def test_param_frames():
+    from vgmviz import columnar, vgm
+    from vgmviz.keyframes import param_frames
+    from vgmviz.ym2612 import regfile_params
+
+    time_events = make_events()
+    for fps, rate in [(1, 1), (1, 2), (3, 10)]:
+        frames = param_frames(time_events, 30, fps, rate)
+        assert len(frames) == -(-30 * fps // rate)
+        for k, frame in enumerate(frames):
+            time = k * rate // fps
+            assert (frame == regfile_params(replay(time_events, time))).all()
+
+    header, table = columnar.parse_vgm('data/bell.vgm')
+    frames = param_frames(table, header.nsamp)
+    keyframes = Keyframes(table)
+    for k in range(0, len(frames), 97):
+        assert (frames[k] == keyframes.params_at(k * 735)).all()
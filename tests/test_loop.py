@@ -0,0 +1,136 @@
+import math
+
+import pytest
+
+from vgmviz import columnar, vgm, ym2612
+from vgmviz.vgm import TimedEvent, YM2612Port0, LoopedTimeline, ENDIAN
+from vgmviz.ym2612 import ev_unpack, TimedEventIndex, LoopedEventIndex, Register
+from tests.helpers import make_vgm, open_vgm
+
+BELL = 'data/bell.vgm'
+
+
+def expand(time_events, loop_time, end_time, nloops):
+    """ Reference: copy the loop body nloops - 1 times. """
+    body = [t_e for t_e in time_events if t_e.time >= loop_time]
+    out = list(time_events)
+    for k in range(1, nloops):
+        out += [TimedEvent(t + k * (end_time - loop_time), e) for t, e in body]
+    return out
+
+
+WRITES = [
+    (0, YM2612Port0(0x40, 1)),  # intro
+    (0, YM2612Port0(0x44, 2)),  # intro, never written in the loop
+    (10, YM2612Port0(0x40, 3)),  # loop starts
+    (15, YM2612Port0(0xB0, 4)),
+    (20, YM2612Port0(0x40, 5)),
+    (30, YM2612Port0(0xB0, 6)),  # at end_time, before jumping back
+]
+LOOP_TIME, END_TIME = 10, 30
+TIME_EVENTS = [TimedEvent(time, ev_unpack(e)) for time, e in WRITES]
+
+
+@pytest.mark.parametrize('nloops', [1, 2, 4])
+def test_view(nloops):
+    view = LoopedTimeline(TIME_EVENTS, LOOP_TIME, END_TIME, nloops)
+    expected = expand(TIME_EVENTS, LOOP_TIME, END_TIME, nloops)
+
+    assert len(view) == len(expected)
+    assert list(view) == expected
+    assert [view[i] for i in range(-len(view), len(view))] == expected + expected
+    assert view[1:-1:2] == expected[1:-1:2]
+    assert view.duration == END_TIME + (nloops - 1) * 20
+
+    times = [-math.inf, *range(-1, view.duration + 3), 12.5, math.inf]
+    for begin in times:
+        for end in times:
+            assert view.window(begin, end) == vgm.filter_ev_time(expected, begin, end)
+        assert view.index_after(begin) == sum(t <= begin for t, _ in expected)
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        LoopedTimeline(TIME_EVENTS, 10, 10, 2)
+    with pytest.raises(ValueError):
+        LoopedTimeline(TIME_EVENTS, 10, 30, 0)
+    with pytest.raises(ValueError):
+        LoopedTimeline(TIME_EVENTS, 10, 30, loop_index=4)
+
+
+def test_loop_addr():
+    """ The loop body starts at the event at loop_addr,
+    not at the first event at the loop's time. """
+    data = bytearray(make_vgm(bytes.fromhex(
+        '61 0a00'  # Wait16Bit(10)
+        '52 40 01'  # Intro, at the loop's time
+        '52 40 02'  # Loop starts (0x46)
+        '61 1400'  # Wait16Bit(20)
+        '66'
+    )))
+    data[0x18:0x1C] = (30).to_bytes(4, ENDIAN)  # nsamp
+    data[0x1C:0x20] = (0x46 - 0x1C).to_bytes(4, ENDIAN)  # loop_addr
+    data[0x20:0x24] = (20).to_bytes(4, ENDIAN)  # loop_nsamp
+    ptr, header = open_vgm(bytes(data))
+    timed = columnar.timed_from_linear(columnar.parse_body(ptr, header))
+    time_events = vgm.timed_from_linear(vgm.parse_body(ptr, header))
+
+    intro, body = time_events
+    view = LoopedTimeline.from_header(time_events, header, 3, offsets=timed['offset'])
+    assert view.loop_index == 1
+    assert list(view) == [intro, body, TimedEvent(30, body.event),
+                          TimedEvent(50, body.event)]
+    assert view.window(30, 50) == [TimedEvent(30, body.event)]
+
+    # Without offsets, every event at the loop's time is repeated.
+    assert len(LoopedTimeline.from_header(time_events, header, 3)) == 6
+
+    unpacked = vgm.map_ev(time_events, ev_unpack)
+    looped = LoopedEventIndex.from_header(
+        TimedEventIndex(unpacked), header, 3, offsets=timed['offset'])
+    expected = TimedEventIndex(vgm.map_ev(list(view), ev_unpack))
+    for begin, end in [(0, 10), (10, 30), (29, 51), (30, 70)]:
+        assert looped.bound_ev_time(begin, end) == expected.bound_ev_time(begin, end)
+
+
+def test_state():
+    nloops = 3
+    looped = LoopedEventIndex(TimedEventIndex(TIME_EVENTS), LOOP_TIME, END_TIME, nloops)
+    expected = TimedEventIndex(expand(TIME_EVENTS, LOOP_TIME, END_TIME, nloops))
+
+    for i in range(len(expected) + 1):
+        assert looped.last_events(i) == expected.last_events(i)
+    for time in range(-1, looped.duration + 2):
+        assert looped.state_at(time) == expected.state_at(time)
+        assert looped.state_before(time) == expected.state_before(time)
+    for begin, end in [(0, 10), (25, 35), (29, 71), (50, 50), (0, math.inf)]:
+        assert looped.bound_ev_time(begin, end) == expected.bound_ev_time(begin, end)
+
+    # The second iteration starts with the state at the end of the first.
+    state = looped.state_before(END_TIME + 5)
+    assert state[Register(0, 0, 0xB0)].value == 6
+    assert state[Register(0, 0, 0x40)].value == 3
+    assert state[Register(0, 1, 0x40)].value == 2
+
+
+def test_bell():
+    header, events = vgm.parse_vgm(BELL)
+    unpacked = vgm.keep_type(
+        vgm.map_ev(vgm.timed_from_linear(events), ym2612.ev_unpack),
+        [ym2612.UnpackedEvent])
+    index = TimedEventIndex(unpacked)
+
+    once = LoopedEventIndex.from_header(index, header)
+    assert len(once) == len(unpacked)
+
+    looped = LoopedEventIndex.from_header(index, header, nloops=2)
+    assert looped.loop_time == header.nsamp - header.loop_nsamp
+    assert looped.times is index.times
+
+    expected = TimedEventIndex(expand(unpacked, looped.loop_time, header.nsamp, 2))
+    begin, end = header.nsamp - 1000, header.nsamp + 1000
+    assert looped.bound_ev_time(begin, end) == expected.bound_ev_time(begin, end)
+
+    # No loop: plays once.
+    header.loop_addr = 0
+    assert LoopedTimeline.from_header(unpacked, header, nloops=5).nloops == 1
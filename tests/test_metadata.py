@@ -0,0 +1,147 @@
+import dataclasses
+import gzip
+import json
+
+from vgmviz import vgm
+from vgmviz.__main__ import main
+from vgmviz.pointer import Pointer, BufferWriter
+from vgmviz.vgm import VgmHeader, Gd3Tag, ExtraHeader, ENDIAN
+from tests.helpers import make_vgm
+
+BELL = 'data/bell.vgm'
+
+
+def test_bell():
+    header, gd3, extra = vgm.read_metadata(BELL)
+    assert header == vgm.parse_vgm(BELL)[0]
+    assert header.rate == 50
+    assert header.loop_addr == 7924
+    assert header.chips() == {'sn76489', 'ym2612', 'dac_stream'}
+
+    assert gd3.title == 'Stages 2, 5, 7'
+    assert gd3.game == 'Time Trax'
+    assert gd3.author == 'Tim Follin'
+    assert gd3.title_jp == ''
+    assert extra is None
+
+
+def test_header_past_data():
+    """ Header fields at or after data_addr read as 0, not as VGM data. """
+    data = make_vgm(b'\xff' * 0x100 + b'\x66')
+    header = VgmHeader.decode(Pointer.create(data, ENDIAN))
+    assert header.data_addr == 0x40
+    assert header.ym2203_clock == header.ga20_clock == header.extra_addr == 0
+
+    # Short files only need the first 0x40 bytes.
+    assert VgmHeader.decode(Pointer.create(make_vgm(b'\x66'), ENDIAN)).gd3_addr == 0
+
+
+def test_old_version():
+    data = bytearray(make_vgm(b'\x66'))
+    data[0x08:0x0C] = (0x101).to_bytes(4, ENDIAN)
+    data[0x10:0x14] = (7670453).to_bytes(4, ENDIAN)  # YM2413 clock field
+    header = VgmHeader.decode(Pointer.create(bytes(data), ENDIAN))
+    assert header.ym2612_clock == header.ym2151_clock == 7670453
+
+
+def test_header_round_trip():
+    header = VgmHeader(nbytes=0x200, version=0x171, nsamp=44100, ym2612_clock=7600489,
+                       data_addr=0x100, gd3_addr=0x180, loop_addr=0x120,
+                       loop_base=-1, ga20_clock=3579545, extra_addr=0xE4)
+    wrt = BufferWriter(ENDIAN)
+    header.encode(wrt)
+    assert len(wrt.getvalue()) == header.size == 0x100
+    assert VgmHeader.decode(Pointer.create(bytes(wrt.getvalue()), ENDIAN)) == header
+
+    # Fields past data_addr are not written.
+    header = dataclasses.replace(header, data_addr=0x80)
+    wrt = BufferWriter(ENDIAN)
+    header.encode(wrt)
+    assert len(wrt.getvalue()) == 0x80
+    decoded = VgmHeader.decode(Pointer.create(bytes(wrt.getvalue()), ENDIAN))
+    assert decoded == dataclasses.replace(header, ga20_clock=0, extra_addr=0)
+
+
+def test_gd3():
+    tag = Gd3Tag(title='Bell', title_jp='ベル', game='Time Trax', notes='a\nb')
+    wrt = BufferWriter(ENDIAN)
+    tag.encode(wrt)
+    assert Gd3Tag.decode(Pointer.create(bytes(wrt.getvalue()), ENDIAN)) == tag
+
+    # Missing strings are empty.
+    data = b'Gd3 ' + (0x100).to_bytes(4, ENDIAN) + (6).to_bytes(4, ENDIAN) \
+        + 'ab\0'.encode('utf-16-le')
+    assert Gd3Tag.decode(Pointer.create(data, ENDIAN)) == Gd3Tag(title='ab')
+
+
+def test_extra_header():
+    extra = bytes.fromhex(
+        '0c000000'  # size
+        '08000000'  # chip clock offset (0x0C)
+        '0a000000'  # chip volume offset (0x12)
+        '01 82 00093d00'  # 1 clock: second YM2612, 4000000 Hz
+        '01 00 00 0080'  # 1 volume: SN76489, flags 0, volume 0x8000
+    )
+    ptr = Pointer.create(extra, ENDIAN)
+    assert ExtraHeader.decode(ptr) == ExtraHeader([(0x82, 4000000)], [(0, 0, 0x8000)])
+
+
+def make_tagged(path, gzipped=False):
+    """ Write a VGM 1.71 file with an extra header and GD3 tag. """
+    wrt = BufferWriter(ENDIAN)
+    wrt.seek(0x100)
+    wrt.bytes_(bytes.fromhex('52 28 f0 61 4000 66'))
+    gd3_addr = wrt.addr
+    Gd3Tag(title='Tagged').encode(wrt)
+    header = VgmHeader(nbytes=wrt.addr, version=0x171, nsamp=0x40,
+                       ym2612_clock=7600489, data_addr=0x100, gd3_addr=gd3_addr,
+                       extra_addr=0xE4)
+    header.encode(wrt)
+    # After the last header field.
+    wrt.bytes_(bytes.fromhex('0c000000 00000000 00000000'), 0xE4)
+
+    data = bytes(wrt.getvalue())
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(data) if gzipped else data)
+    return header
+
+
+def test_read_metadata(tmp_path):
+    for name in ['a.vgm', 'a.vgz']:
+        path = str(tmp_path / name)
+        header = make_tagged(path, gzipped=name.endswith('.vgz'))
+        assert vgm.read_metadata(path) == (header, Gd3Tag(title='Tagged'),
+                                           ExtraHeader([], []))
+        # The header does not overlap the data.
+        _, events = vgm.parse_vgm(path, chips=header.chips())
+        assert events == [vgm.YM2612Port0(0x28, 0xF0), vgm.Wait16Bit(0x40)]
+
+
+def test_chips_dac_stream():
+    """ parse_body(chips=header.chips()) keeps DAC stream commands. """
+    events = [
+        vgm.DacStreamSetup(0, 0x02, 0, 0x2A),
+        vgm.DacStreamFrequency(0, 8000),
+        vgm.DacStreamStop(0),
+        vgm.Wait16Bit(1),
+    ]
+    data = bytes(vgm.encode_vgm(events))
+    ptr = Pointer(data, 0, ENDIAN)
+    header = VgmHeader.decode(ptr)
+    assert header.chips() == {'ym2612', 'dac_stream'}
+    assert vgm.parse_body(ptr, header, chips=header.chips()) == events
+
+    header.ym2612_clock = 0
+    assert header.chips() == set()
+
+
+def test_cli(tmp_path, capsys):
+    make_tagged(str(tmp_path / 'a.vgm'))
+    (tmp_path / 'bad.vgm').write_bytes(b'Vgm ')
+
+    assert main(['info', str(tmp_path)]) == 1
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines[0]['gd3']['title'] == 'Tagged'
+    assert lines[0]['chips'] == ['dac_stream', 'ym2612']
+    assert lines[0]['header']['version'] == 0x171
+    assert 'EndOfFileError' in lines[1]['error']
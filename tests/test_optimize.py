@@ -0,0 +1,197 @@
+import dataclasses
+import json
+
+import pytest
+
+from vgmviz import vgm, optimize
+from vgmviz.__main__ import main
+from vgmviz.optimize import optimize_linear, EquivalenceError
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import VgmHeader, ENDIAN, TimedEvent, YM2612Port0, YM2612Port1, \
+    PCMWriteWait, PCMSeek, Wait4Bit, Wait16Bit, Wait735, Wait882, IWait
+from tests.helpers import make_vgm
+
+BELL = 'data/bell.vgm'
+
+
+def total_delay(events):
+    return sum(e.delay for e in events if isinstance(e, IWait))
+
+
+def test_wait_plan():
+    # Fewest bytes, by dynamic programming over 1-byte waits and Wait16Bit.
+    n = 2000
+    best = [0] + [3] * n
+    for d in range(1, n + 1):
+        for short in list(range(1, 17)) + [735, 882]:
+            if short <= d:
+                best[d] = min(best[d], best[d - short] + 1)
+
+    for d in range(n + 1):
+        events = optimize._wait_events(d)
+        assert total_delay(events) == d
+        assert optimize._wait_plan(d)[0] == best[d]
+
+    assert optimize._wait_events(735) == [Wait735()]
+    assert optimize._wait_events(882 + 16) == [Wait4Bit(16), Wait882()]
+    assert optimize._wait_events(40) == [Wait16Bit(40)]
+    assert total_delay(optimize._wait_events(200000)) == 200000
+
+
+def test_optimize_linear():
+    time_events = [
+        TimedEvent(0, YM2612Port0(0x40, 1)),
+        TimedEvent(0, YM2612Port0(0x40, 1)),  # redundant
+        TimedEvent(0, YM2612Port1(0x40, 1)),  # other port
+        TimedEvent(0, YM2612Port0(0xA4, 0x22)),
+        TimedEvent(0, YM2612Port0(0xA0, 0x69)),
+        TimedEvent(0, YM2612Port0(0x28, 0xF0)),
+        TimedEvent(735, YM2612Port0(0xA4, 0x22)),  # latch, kept
+        TimedEvent(735, YM2612Port0(0xA0, 0x69)),
+        TimedEvent(735, YM2612Port0(0x28, 0xF0)),
+        TimedEvent(735, YM2612Port0(0x40, 1)),  # redundant
+        TimedEvent(735, PCMWriteWait(3)),
+        TimedEvent(760, PCMSeek(0)),
+    ]
+    events = optimize_linear(time_events, nsamp=800)
+    assert events == [
+        YM2612Port0(0x40, 1),
+        YM2612Port1(0x40, 1),
+        YM2612Port0(0xA4, 0x22),
+        YM2612Port0(0xA0, 0x69),
+        YM2612Port0(0x28, 0xF0),
+        Wait735(),
+        YM2612Port0(0xA4, 0x22),
+        YM2612Port0(0xA0, 0x69),
+        YM2612Port0(0x28, 0xF0),
+        PCMWriteWait(15), Wait4Bit(10),
+        PCMSeek(0),
+        Wait16Bit(40),
+    ]
+    # Input events are not modified.
+    assert time_events[10].event == PCMWriteWait(3)
+
+    assert len(optimize_linear(time_events, dedupe=False)) == 14
+
+
+def test_dac_not_deduped_across_pcm():
+    time_events = [
+        TimedEvent(0, YM2612Port0(0x2A, 0x80)),
+        TimedEvent(0, PCMWriteWait(0)),
+        TimedEvent(0, YM2612Port0(0x2A, 0x80)),
+    ]
+    assert len(optimize_linear(time_events)) == 3
+
+
+def metadata(path):
+    return vgm.decode_metadata(Pointer(vgm.load_vgm(path), 0, ENDIAN))
+
+
+def test_bell(tmp_path):
+    out = str(tmp_path / 'bell.vgm')
+    report = optimize.optimize_vgm(BELL, out)
+    assert report.nbytes_after < report.nbytes_before
+
+    assert report.nevents_after < report.nevents_before * 1.01
+
+    # The header and GD3 tag are kept, and only the VGM data is counted.
+    (header, gd3, _), (out_header, out_gd3, _) = metadata(BELL), metadata(out)
+    assert out_gd3 == gd3
+    for name in ['sn76489_clock', 'ym2612_clock', 'sn76489_feedback', 'rate',
+                 'volume_modifier', 'nsamp', 'loop_nsamp']:
+        assert getattr(out_header, name) == getattr(header, name)
+    assert report.nbytes_before == header.gd3_addr - header.data_addr
+    assert report.nbytes_after == out_header.gd3_addr - out_header.data_addr
+
+
+def write_looped(path, events, loop_index):
+    vgm.save_vgm(path, vgm.reencode_vgm(make_vgm(b'\x66'), events, loop_index))
+    return path
+
+
+def test_loop(tmp_path):
+    # The write after the loop point repeats the intro, but is needed when looping.
+    events = [YM2612Port0(0x40, 1), Wait16Bit(100), YM2612Port0(0x40, 1), Wait16Bit(100)]
+    orig = write_looped(str(tmp_path / 'in.vgm'), events, 2)
+    out = str(tmp_path / 'out.vgm')
+    optimize.optimize_vgm(orig, out)
+
+    header, events = vgm.parse_vgm(out)
+    assert (header.nsamp, header.loop_nsamp) == (200, 100)
+    assert events == [YM2612Port0(0x40, 1), Wait16Bit(100), YM2612Port0(0x40, 1),
+                      Wait16Bit(100)]
+    assert header.loop_addr == header.data_addr + 6
+
+    dropped = write_looped(str(tmp_path / 'dropped.vgm'),
+                           [YM2612Port0(0x40, 1), Wait16Bit(100), Wait16Bit(100)], 2)
+    with pytest.raises(EquivalenceError, match='after loop'):
+        optimize.verify_equivalent(orig, dropped)
+
+    moved = write_looped(str(tmp_path / 'moved.vgm'), events, 1)
+    with pytest.raises(EquivalenceError, match='loop'):
+        optimize.verify_equivalent(orig, moved)
+
+    no_loop = write_looped(str(tmp_path / 'no_loop.vgm'), events, None)
+    with pytest.raises(EquivalenceError, match='loop'):
+        optimize.verify_equivalent(orig, no_loop)
+
+
+def test_verify_metadata(tmp_path):
+    out = str(tmp_path / 'out.vgm')
+    optimize.optimize_vgm(BELL, out)
+    data = bytes(vgm.load_vgm(out))
+    header = VgmHeader.decode(Pointer(data, 0, ENDIAN))
+
+    def patch(name, addr, value):
+        path = str(tmp_path / name)
+        changed = bytearray(data)
+        changed[addr:addr + len(value)] = value
+        vgm.save_vgm(path, changed)
+        return path
+
+    with pytest.raises(EquivalenceError, match='sn76489_clock'):
+        optimize.verify_equivalent(BELL, patch('clock.vgm', 0x0C, b'\0\0\0\0'))
+    with pytest.raises(EquivalenceError, match='rate'):
+        optimize.verify_equivalent(BELL, patch('rate.vgm', 0x24, b'\x3c'))
+    with pytest.raises(EquivalenceError, match='GD3'):
+        # First character of the title.
+        optimize.verify_equivalent(BELL, patch('gd3.vgm', header.gd3_addr + 12, b'X'))
+
+
+def test_verify_fails(tmp_path):
+    time_events = [
+        TimedEvent(0, YM2612Port0(0x40, 1)),
+        TimedEvent(100, YM2612Port1(0x40, 2)),
+        TimedEvent(200, vgm.PSGWrite(0x9F)),
+    ]
+
+    def write(name, time_events, nsamp=1000):
+        path = str(tmp_path / name)
+        vgm.write_vgm(path, optimize_linear(time_events, nsamp))
+        return path
+
+    orig = write('orig.vgm', time_events)
+    optimize.verify_equivalent(orig, write('same.vgm', time_events))
+
+    changed = time_events.copy()
+    changed[1] = TimedEvent(101, YM2612Port1(0x40, 2))
+    with pytest.raises(EquivalenceError, match='YM2612'):
+        optimize.verify_equivalent(orig, write('changed.vgm', changed))
+
+    changed = time_events[:2]
+    with pytest.raises(EquivalenceError, match='PSG'):
+        optimize.verify_equivalent(orig, write('psg.vgm', changed))
+
+    with pytest.raises(EquivalenceError, match='nsamp'):
+        optimize.verify_equivalent(orig, write('short.vgm', time_events, 999))
+
+
+def test_cli(tmp_path, capsys):
+    path = str(tmp_path / 'in.vgm')
+    time_events = [TimedEvent(t, YM2612Port0(0x40, 1)) for t in range(0, 7350, 735)]
+    vgm.write_vgm(path, vgm.linear_from_timed(time_events))
+
+    assert main(['optimize', path, str(tmp_path / 'out.vgm')]) == 0
+    report = json.loads(capsys.readouterr().out)
+    # 9 redundant writes dropped, then 9 Wait16Bit merged into 1.
+    assert report['saved'] == 9 * 3 + 8 * 3
@@ -0,0 +1,35 @@
+import pytest
+
+from vgmviz import vgm, parallel
+from tests.helpers import make_vgm, open_vgm
+
+BELL = 'data/bell.vgm'
+
+
+def serial(ptr, header):
+    return vgm.timed_from_linear(vgm.parse_body(ptr, header))
+
+
+@pytest.mark.parametrize('nchunks', [1, 3, 100])
+def test_small(nchunks):
+    body = bytes.fromhex(
+        '52 28 f0'
+        '67 66 00 02000000 abcd'
+        'e0 01000000'
+        '61 0001'
+        '53 b4 c0'
+        '7f 83'
+        '70 52 2a 80'
+        '66'
+    )
+    ptr, header = open_vgm(make_vgm(body))
+
+    out = parallel.parse_body_parallel(ptr, header, 2, nchunks)
+    assert out == serial(ptr, header)
+
+
+def test_bell():
+    ptr, header = open_vgm(open(BELL, 'rb').read())
+    out = parallel.parse_body_parallel(ptr, header, 2)
+    assert out == serial(ptr, header)
+
@@ -0,0 +1,88 @@
+import numpy as np
+
+from vgmviz import columnar, vgm, pcm, synth
+from tests.helpers import make_vgm, open_vgm, parse_both
+
+BELL = 'data/bell.vgm'
+
+
+def test_pcm_writes():
+    body = bytes.fromhex(
+        '67 66 00 03000000 102030'  # DataBlock (bank 0-2)
+        '81 81'  # PCMWriteWait before any seek: bank[0], bank[1]
+        '52 2b 80'  # DacEnable
+        'e0 02000000'  # PCMSeek(2)
+        '82'  # bank[2]
+        '67 66 00 02000000 4050'  # DataBlock (bank 3-4)
+        '83 52 2a 99 80'  # bank[3], DacValue, bank[4]
+        'e0 04000000 81 81'  # PCMSeek(4): bank[4], past the end
+        '61 0a00'  # Wait16Bit(10)
+        '52 2b 00'  # DacEnable
+        '66'
+    )
+    ptr, events, table = parse_both(make_vgm(body))
+    time_events = vgm.timed_from_linear(events)
+
+    assert pcm.data_bank(ptr, table).tolist() == [0x10, 0x20, 0x30, 0x40, 0x50]
+
+    writes = pcm.pcm_writes(ptr, table)
+    assert writes['value'].tolist() == [
+        0x10, 0x20, 0x30, 0x40, 0x99, 0x50, 0x50, pcm.DAC_CENTER]
+    assert writes['time'].tolist() == [0, 1, 2, 4, 7, 7, 7, 8]
+    assert len(pcm.pcm_writes(ptr, table, dac=False)) == 7
+
+    enables = pcm.dac_enables(table)
+    assert enables['time'].tolist() == [2, 19]
+    assert enables['value'].tolist() == [1, 0]
+
+    expected = synth.dac_stream(time_events, 25)
+    assert np.array_equal(pcm.dac_stream(ptr, table, 25), expected, equal_nan=True)
+
+
+def test_no_pcm():
+    ptr, _, table = parse_both(make_vgm(bytes.fromhex('61 0a00 66')))
+    assert len(pcm.data_bank(ptr, table)) == 0
+    assert len(pcm.pcm_writes(ptr, table)) == 0
+    assert np.isnan(pcm.dac_stream(ptr, table, 10)).all()
+
+
+def test_bell():
+    """ Compare against a Python replay of the PCM program. """
+    ptr, header = open_vgm(vgm.load_vgm(BELL))
+    table = columnar.parse_body(ptr, header)
+
+    bank = bytearray()
+    pos = 0
+    expected = []
+    for time, e in vgm.timed_from_linear(vgm.parse_body(ptr, header)):
+        if isinstance(e, vgm.PCMWriteWait):
+            expected.append((time, bank[pos] if pos < len(bank) else pcm.DAC_CENTER))
+            pos += 1
+        elif isinstance(e, vgm.PCMSeek):
+            pos = e.address
+        elif isinstance(e, vgm.DataBlock) and e.typ == 0:
+            bank += e.file
+
+    writes = pcm.pcm_writes(ptr, table, dac=False)
+    assert len(writes) == len(expected) > 0
+    assert (writes == np.array(expected, pcm.PCM_DTYPE)).all()
+
+
+def test_write_before_block():
+    """ A write cannot read a data block which comes later in the file. """
+    body = bytes.fromhex(
+        '52 2b 80'  # DacEnable
+        '82'  # Before the data block: DAC_CENTER
+        '67 66 00 02000000 ffff'  # DataBlock (bank 0-1)
+        '82'  # bank[1]
+        '66'
+    )
+    ptr, events, table = parse_both(make_vgm(body))
+    time_events = vgm.timed_from_linear(events)
+
+    writes = pcm.pcm_writes(ptr, table)
+    assert writes['value'].tolist() == [pcm.DAC_CENTER, 0xFF]
+
+    expected = synth.dac_stream(time_events, 4)
+    assert np.array_equal(pcm.dac_stream(ptr, table, 4), expected, equal_nan=True)
+    assert expected[0] == 0
@@ -1,7 +1,7 @@
 import io
 
 import pytest
-from vgmviz.pointer import Pointer, Writer
+from vgmviz.pointer import Pointer, Writer, EndOfFileError
 
 
 @pytest.fixture
@@ -71,8 +71,10 @@ def test_eof(ptr):
         ptr.s16()
 
     ptr.s8()
-    with pytest.raises(ValueError):
+    with pytest.raises(EndOfFileError):
         ptr.s8()
+    with pytest.raises(EndOfFileError):
+        ptr.u8()
 
 
 # Writer tests
@@ -98,3 +100,56 @@ def test_write_offset(wrt):
 
     wrt.offset(0x180, addr=0x100)
     assert b'\x00\x00\x00\x80' == buf()[0x100:]
+
+
+# Zero-copy tests
+
+def test_memoryview():
+    data = bytearray.fromhex('0001 7e7f 8081 feff')
+    ptr = Pointer.create(memoryview(data), 'big')
+
+    assert ptr.u16() == 0x0001
+    blob = ptr.bytes_(2)
+    assert isinstance(blob, memoryview)
+    assert blob == b'\x7e\x7f'
+
+    # Slices share memory with the original buffer.
+    data[2] = 0x00
+    assert blob == b'\x00\x7f'
+
+    assert ptr.magic(b'\x80\x81') == b'\x80\x81'
+
+
+def test_mmap(tmp_path):
+    import mmap
+
+    path = tmp_path / 'data.bin'
+    path.write_bytes(bytes.fromhex('0001 7e7f'))
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    ptr = Pointer.create(mapped, 'big')
+    assert ptr.u32() == 0x00017e7f
+
+
+# BufferWriter tests
+
+def test_buffer_writer():
+    from vgmviz.pointer import BufferWriter
+
+    wrt = BufferWriter('big', capacity=1)
+    wrt.seek(4)
+    for i in range(100):
+        wrt.u16(i)
+    assert wrt.addr == wrt.size == 204
+
+    # Patch header in place.
+    wrt.offset(0x100, addr=0)
+    assert wrt.addr == 4
+    assert wrt.size == 204
+
+    out = io.BytesIO()
+    wrt.flush(out)
+    data = out.getvalue()
+    assert data[:4] == b'\x00\x00\x01\x00'
+    assert data[4:] == b''.join(i.to_bytes(2, 'big') for i in range(100))
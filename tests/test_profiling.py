@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from vgmviz import columnar, vgm, ym2612, profiling
+from vgmviz.__main__ import main
+from vgmviz.pointer import Pointer
+from vgmviz.profiling import Profiler
+from vgmviz.vgm import VgmHeader, ENDIAN
+from tests.helpers import make_vgm, open_vgm
+
+BODY = bytes.fromhex(
+    '52 28 f0'  # YM2612Port0
+    '67 66 00 02000000 abcd'  # DataBlock
+    '52 2b 80'  # YM2612Port0
+    '61 0001'  # Wait16Bit
+    '80 80 81'  # PCMWriteWait
+    '66'
+)
+EXPECTED = {
+    '0x52': (2, 6),
+    '0x61': (1, 3),
+    '0x67': (1, 9),
+    '0x80': (2, 2),
+    '0x81': (1, 1),
+}
+
+
+def opcodes(prof):
+    return {command: (s['count'], s['nbytes'])
+            for command, s in prof.to_dict()['opcodes'].items()}
+
+
+def test_disabled():
+    assert profiling.active() is None
+    vgm.parse_body(*open_vgm(make_vgm(BODY)))
+    assert profiling.active() is None
+
+
+@pytest.mark.parametrize('module', [vgm, columnar])
+def test_opcodes(module):
+    ptr = Pointer.create(make_vgm(BODY), ENDIAN)
+    with Profiler() as prof:
+        assert profiling.active() is prof
+        module.parse_body(ptr, VgmHeader.decode(ptr))
+    assert profiling.active() is None
+
+    assert opcodes(prof) == EXPECTED
+    d = json.loads(prof.to_json())
+    assert d['classes']['PCMWriteWait']['count'] == 3
+    assert d['opcodes']['0x80']['cls'] == 'PCMWriteWait'
+    assert d['stages'][f'{module.__name__.split(".")[-1]}.parse_body']['calls'] == 1
+    assert d['stages']['VgmHeader.decode']['calls'] == 1
+    assert d['peak_memory'] > 0
+    assert 'PCMWriteWait' in prof.summary()
+
+
+def test_stages():
+    time_events = vgm.timed_from_linear(vgm.parse_body(*open_vgm(make_vgm(BODY))))
+
+    with Profiler(memory=False) as prof:
+        unpacked = list(ym2612.iter_ev_unpack(time_events))
+        ym2612.bound_ev_time(vgm.keep_type(unpacked, [ym2612.UnpackedEvent]), 0, 10)
+
+    stages = prof.to_dict()['stages']
+    assert stages['ym2612.iter_ev_unpack']['calls'] == 1
+    assert stages['ym2612.bound_ev_time']['calls'] == 1
+    assert stages['TimedEventIndex.bound_ev_time']['ns'] <= \
+        stages['ym2612.bound_ev_time']['ns']
+    assert prof.peak_memory is None
+    assert not prof.opcodes
+
+
+def test_nested():
+    with Profiler(memory=False):
+        with pytest.raises(RuntimeError):
+            with Profiler(memory=False):
+                pass
+    assert profiling.active() is None
+
+
+def test_cli(tmp_path, capsys):
+    path = tmp_path / 'a.vgm'
+    path.write_bytes(make_vgm(BODY))
+    json_path = tmp_path / 'profile.json'
+
+    assert main(['batch', '--profile', '--profile-json', str(json_path), str(path)]) == 0
+    assert 'PCMWriteWait' in capsys.readouterr().err
+    d = json.loads(json_path.read_text())
+    assert {command: (s['count'], s['nbytes'])
+            for command, s in d['opcodes'].items()} == EXPECTED
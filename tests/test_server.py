@@ -0,0 +1,172 @@
+import gzip
+import http.client
+import json
+import struct
+import threading
+import time
+
+import pytest
+
+from vgmviz import vgm, ym2612
+from vgmviz.keyframes import param_frames
+from vgmviz.server import VgmServer, SongCache, Song, song_key
+from vgmviz.vgm import YM2612Port0, YM2612Port1, Wait16Bit, PSGWrite, DataBlock
+
+EVENTS = [
+    DataBlock(b'\x66', 0, 2, b'\x80\x81'),
+    YM2612Port0(0x40, 1),
+    PSGWrite(0x9F),
+    Wait16Bit(735),
+    YM2612Port1(0x44, 2),
+    Wait16Bit(735),
+    YM2612Port0(0x40, 3),
+    Wait16Bit(100),
+]
+DATA = bytes(vgm.encode_vgm(EVENTS))
+
+
+@pytest.fixture
+def server():
+    server = VgmServer(('127.0.0.1', 0), SongCache(max_songs=2))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=30)
+    try:
+        conn.request(method, path, body)
+        response = conn.getresponse()
+        return response.status, response.getheader('Transfer-Encoding'), response.read()
+    finally:
+        conn.close()
+
+
+def lines(body: bytes):
+    return [json.loads(line) for line in body.decode().splitlines()]
+
+
+def test_parse(server):
+    status, _, body = request(server, 'POST', '/parse', DATA)
+    assert status == 200
+    out = json.loads(body)
+    assert out['key'] == song_key(DATA)
+    assert out['header']['nsamp'] == 735 * 2 + 100
+    assert out['chips'] == ['dac_stream', 'ym2612']
+    assert out['nevents'] == len(EVENTS)
+
+    # VGZ uploads are decompressed, but keyed by their own hash.
+    status, _, body = request(server, 'POST', '/parse', gzip.compress(DATA))
+    assert json.loads(body)['nevents'] == len(EVENTS)
+
+
+def test_timeline(server):
+    status, encoding, body = request(server, 'POST', '/timeline', DATA)
+    assert status == 200
+    assert encoding == 'chunked'
+    assert lines(body) == [
+        {'time': 0, 'type': 'DataBlock', 'typ': 0, 'nbytes': 2, 'file_nbytes': 2},
+        {'time': 0, 'type': 'YM2612Port0', 'reg': 0x40, 'value': 1},
+        {'time': 0, 'type': 'PSGWrite', 'value': 0x9F},
+        {'time': 735, 'type': 'YM2612Port1', 'reg': 0x44, 'value': 2},
+        {'time': 1470, 'type': 'YM2612Port0', 'reg': 0x40, 'value': 3},
+    ]
+
+    # Uploaded songs can be fetched by key.
+    path = f'/timeline?key={song_key(DATA)}&begin=1&end=2000&type=YM2612Port0'
+    status, _, body = request(server, 'GET', path)
+    assert [line['time'] for line in lines(body)] == [1470]
+
+
+def test_state(server):
+    status, _, body = request(server, 'POST', '/state?begin=700&end=800', DATA)
+    assert status == 200
+
+    song = Song(song_key(DATA), DATA)
+    expected = song.ym2612_index.bound_ev_time(700, 800)
+    assert [(line['time'], line['value']) for line in lines(body)] == \
+        [(time, event.value) for time, event in expected]
+    assert lines(body)[-1] == dict(time=800, chan=3, op=1, param=0x40, value=2)
+
+
+def test_frames(server):
+    status, _, body = request(server, 'POST', '/frames?fps=60', DATA)
+    info, *frames = lines(body)
+    expected = param_frames(vgm.keep_type(vgm.timed_from_linear(EVENTS),
+                                          [YM2612Port0, YM2612Port1]), 1570)
+    assert info['shape'] == list(expected.shape)
+    assert info['params'] == list(ym2612.PARAMS)
+    assert frames == expected.tolist()
+
+
+def test_bell_streamed(server):
+    with open('data/bell.vgm', 'rb') as f:
+        data = f.read()
+    status, encoding, body = request(server, 'POST', '/timeline?end=100000', data)
+    assert status == 200
+    assert encoding == 'chunked'
+
+    time_events = vgm.filter_ev_time(
+        vgm.timed_from_linear(vgm.parse_vgm('data/bell.vgm')[1]), 0, 100000)
+    assert len(lines(body)) == len(time_events)
+
+
+def test_errors(server):
+    assert request(server, 'POST', '/parse', b'Vgm nonsense')[0] == 400
+    assert request(server, 'POST', '/parse', b'\x1f\x8bnonsense')[0] == 400
+
+    # The data offset is at the (header's) end of file.
+    data = bytearray(DATA)
+    struct.pack_into('<I', data, 0x04, 0x40 - 0x04)
+    assert request(server, 'POST', '/parse', bytes(data))[0] == 400
+    assert request(server, 'POST', '/nothing', DATA)[0] == 404
+    assert request(server, 'GET', '/timeline?key=0123')[0] == 404
+    assert request(server, 'GET', '/timeline')[0] == 400
+    assert request(server, 'POST', '/timeline?type=Nope', DATA)[0] == 400
+    assert request(server, 'POST', '/timeline?begin=x', DATA)[0] == 400
+    assert request(server, 'POST', '/frames?fps=0', DATA)[0] == 400
+
+
+def test_coalesce(server, monkeypatch):
+    """ Concurrent uploads of one file are parsed once. """
+    nparse = []
+
+    def slow_song(key, data):
+        nparse.append(key)
+        time.sleep(0.3)
+        return Song(key, data)
+
+    monkeypatch.setattr(server.songs, 'parse', slow_song)
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(request(server, 'POST', '/parse', DATA)))
+        for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [status for status, _, _ in results] == [200] * 4
+    assert len(nparse) == 1
+    stats = json.loads(request(server, 'GET', '/stats')[2])
+    assert stats['misses'] == 1
+    assert stats['hits'] + stats['coalesced'] == 3
+
+
+def test_lru():
+    cache = SongCache(max_songs=2)
+    files = [bytes(vgm.encode_vgm([Wait16Bit(n)])) for n in range(1, 4)]
+    keys = [cache.get_or_parse(data).key for data in files[:2]]
+    cache.get(keys[0])  # Most recently used
+    cache.get_or_parse(files[2])
+
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.stats()['songs'] == 2
+
+    with pytest.raises(ValueError):
+        cache.get_or_parse(b'bad')
+    assert cache.stats()['parsing'] == 0
@@ -0,0 +1,90 @@
+import numpy as np
+
+from vgmviz import vgm, synth
+from vgmviz.vgm import TimedEvent, YM2612Port0
+
+CLOCK = 7670453  # NTSC
+
+
+def sine_patch(fnum=1084, block=4):
+    """ Channel 0, algorithm 7, only S1 audible, instant attack. """
+    writes = [
+        (0xB0, 0x07),  # algorithm 7, no feedback
+        (0x30, 0x01),  # S1 multiple 1
+        (0x40, 0x00), (0x44, 0x7F), (0x48, 0x7F), (0x4C, 0x7F),  # S1 at full volume
+        (0x50, 0x1F),  # attack rate 31
+        (0x80, 0x0F),  # sustain level 0, release rate 15
+        (0xA4, (block << 3) | (fnum >> 8)),
+        (0xA0, fnum & 0xFF),
+    ]
+    return [TimedEvent(0, YM2612Port0(reg, value)) for reg, value in writes]
+
+
+def peak_hz(samples, rate=synth.RATE):
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    return np.argmax(spectrum) * rate / len(samples)
+
+
+def test_sine():
+    events = sine_patch() + [
+        TimedEvent(0, YM2612Port0(0x28, 0x10)),  # key on S1
+        TimedEvent(22050, YM2612Port0(0x28, 0x00)),  # key off
+    ]
+    out = synth.render(events, 44100, CLOCK)
+    assert out.shape == (6, 44100)
+    assert not out[1:].any()
+
+    chan = out[0]
+    assert abs(peak_hz(chan[:22050]) - 440) < 3
+    assert 0.99 < np.abs(chan[1000:22050]).max() <= 1
+    # Released
+    assert np.abs(chan[-1000:]).max() < 1e-3
+
+
+def test_key_off_before_on():
+    out = synth.render(sine_patch(), 1000, CLOCK)
+    assert not out.any()
+
+
+def test_feedback():
+    """ With enough iterations, block-wise feedback equals a per-sample loop. """
+    n = 64
+    s = synth.YM2612Synth(CLOCK, fb_iterations=n)
+    phase = np.arange(n) * 0.01
+    gain = np.linspace(1, 0.5, n)
+
+    for feedback in [1, 4, 7]:
+        s.fb_history[0] = [0.1, 0.2]
+        y = s._feedback(0, phase, gain, feedback)
+
+        expected = [0.1, 0.2]
+        for i in range(n):
+            mod = (expected[-1] + expected[-2]) * 2.0 ** (feedback - 7)
+            expected.append(np.sin(2 * np.pi * (phase[i] + mod)) * gain[i])
+        assert np.allclose(y, expected[2:])
+        assert np.allclose(s.fb_history[0], expected[-2:])
+
+
+def test_dac():
+    events = [
+        TimedEvent(0, vgm.DataBlock(b'\x66', 0, 4, bytes([0x80, 0xC0, 0x40, 0xFF]))),
+        TimedEvent(0, YM2612Port0(0x2B, 0x80)),
+        TimedEvent(0, vgm.PCMSeek(1)),
+        TimedEvent(10, vgm.PCMWriteWait(0)),
+        TimedEvent(10, vgm.PCMWriteWait(5)),
+        TimedEvent(15, YM2612Port0(0x2A, 0x00)),
+        TimedEvent(20, YM2612Port0(0x2B, 0x00)),
+    ]
+    out = synth.render(events, 30, CLOCK)
+    expected = np.zeros(30)
+    expected[10:15] = (0x40 - 128) / 128
+    expected[15:20] = -1
+    assert (out[5] == expected).all()
+
+
+def test_bell():
+    header, events = vgm.parse_vgm('data/bell.vgm')
+    out = synth.render(vgm.timed_from_linear(events), 44100, header.ym2612_clock)
+    assert np.isfinite(out).all()
+    assert np.abs(out).max() <= 1
+    assert out[:5].any()
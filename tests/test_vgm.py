@@ -1,3 +1,5 @@
+import os
+
 import pytest
 
 from vgmviz.vgm import PCMWriteWait, Wait4Bit
@@ -13,3 +15,188 @@ def test_Wait():
     assert Wait4Bit.decode(None, 0x70).delay == 1
     assert Wait4Bit.decode(None, 0x7f).delay == 16
     # I "trust" register_cmd2event() to not register Wait4Bit for invalid commands.
+
+
+def test_parse_vgm_mmap():
+    from vgmviz.vgm import parse_vgm, DataBlock
+
+    header, events = parse_vgm('data/bell.vgm', mmap=True)
+    block = next(e for e in events if isinstance(e, DataBlock))
+    assert isinstance(block.file, memoryview)
+
+    assert (header, events) == parse_vgm('data/bell.vgm')
+
+
+def test_iter_vgm():
+    from vgmviz import vgm, ym2612
+
+    path = 'data/bell.vgm'
+    header, events = vgm.parse_vgm(path)
+    time_events = vgm.timed_from_linear(events)
+
+    fm = vgm.map_ev(vgm.filter_ev_type(time_events, vgm.YM2612Port1), ym2612.ev_unpack)
+    stream = ym2612.iter_ev_unpack(
+        vgm.iter_filter_ev_type(vgm.iter_vgm(path, timed=True), vgm.YM2612Port1))
+    assert list(stream) == fm
+
+    # Stops reading once time >= end.
+    begin, end = 1000, 20000
+    assert list(vgm.iter_filter_ev_time(vgm.iter_vgm(path, timed=True), begin, end)) \
+        == vgm.filter_ev_time(time_events, begin, end)
+
+
+def test_iter_playlist(tmp_path):
+    from vgmviz import vgm
+
+    path = str(tmp_path / 'a.vgm')
+    vgm.write_vgm(path, [vgm.YM2612Port0(0x28, 0xF0), vgm.Wait16Bit(100)])
+
+    playlist = list(vgm.iter_playlist([path, path]))
+    assert [t_e.time for t_e in playlist] == [0, 100]
+
+
+def test_write_vgm_buffered(tmp_path):
+    from vgmviz import vgm
+
+    events = [
+        vgm.DataBlock(b'\x66', 0, 2, b'ab'),
+        vgm.PCMSeek(1),
+        vgm.YM2612Port0(0x2B, 0x80),
+        vgm.PCMWriteWait(3),
+        vgm.Wait4Bit(5),
+        vgm.Wait16Bit(1000),
+        vgm.YM2612Port1(0xB4, 0xC0),
+    ]
+    paths = [str(tmp_path / 'unbuffered.vgm'), str(tmp_path / 'buffered.vgm')]
+    vgm.write_vgm(paths[0], events, buffered=False)
+    vgm.write_vgm(paths[1], events, buffered=True)
+
+    with open(paths[0], 'rb') as f0, open(paths[1], 'rb') as f1:
+        assert f0.read() == f1.read()
+
+    header, parsed = vgm.parse_vgm(paths[1])
+    assert parsed == events
+    assert header.nsamp == 3 + 5 + 1000
+
+    # Every write mode accepts a one-shot iterator.
+    for kwargs in [dict(buffered=False), dict()]:
+        vgm.write_vgm(paths[0], iter(events), **kwargs)
+        with open(paths[0], 'rb') as f0, open(paths[1], 'rb') as f1:
+            assert f0.read() == f1.read()
+
+    vgz = str(tmp_path / 'iter.vgz')
+    vgm.write_vgm(vgz, iter(events))
+    assert vgm.parse_vgm(vgz) == (header, events)
+
+
+def test_incremental_parser(tmp_path):
+    from vgmviz import vgm
+
+    events = [
+        vgm.YM2612Port0(0x28, 0xF0),
+        vgm.Wait16Bit(100),
+        vgm.DataBlock(b'\x66', 0, 3, b'abc'),
+        vgm.PCMWriteWait(3),
+        vgm.YM2612Port1(0xB4, 0xC0),
+        vgm.Wait4Bit(5),
+        vgm.YM2612Port0(0x28, 0x00),
+    ]
+    path = str(tmp_path / 'a.vgm')
+    vgm.write_vgm(path, events)
+    with open(path, 'rb') as f:
+        data = f.read()
+    expected = vgm.timed_from_linear(events)
+
+    # Truncated trailing commands are decoded once complete.
+    for step in [1, 2, 5, 64, len(data)]:
+        parser = vgm.IncrementalParser()
+        out = []
+        for i in range(0, len(data), step):
+            out += parser.feed(data[i:i + step])
+            assert out == expected[:len(out)]
+        assert out == expected
+        assert parser.done
+        assert parser.time == 108
+        assert parser.feed(b'\x66') == []
+
+    parser = vgm.IncrementalParser()
+    assert parser.feed_linear(data[:-1]) == events
+    assert not parser.done
+    assert parser.feed_linear(data[-1:]) == []
+    assert parser.done
+
+
+def test_incremental_parser_data_block(monkeypatch):
+    """ An incomplete command is not decoded again until enough data arrives. """
+    from vgmviz import vgm
+    from vgmviz.vgm import DataBlock, Wait16Bit
+
+    ndecode = []
+
+    class CountingPointer(vgm._BufferPointer):
+        def __init__(self, *args):
+            ndecode.append(1)
+            super().__init__(*args)
+
+    monkeypatch.setattr(vgm, '_BufferPointer', CountingPointer)
+
+    events = [Wait16Bit(1), DataBlock(b'\x66', 0, 0x10000, bytes(range(256)) * 0x100),
+              Wait16Bit(2)]
+    data = bytes(vgm.encode_vgm(events))
+    parser = vgm.IncrementalParser()
+    out = []
+    for i in range(0, len(data), 16):
+        out += parser.feed_linear(data[i:i + 16])
+
+    assert out == events
+    assert type(out[1].file) is bytes
+    assert parser.done
+    # Once each for the DataBlock's fields, its contents, and the rest
+    # (instead of once per feed).
+    assert len(ndecode) == 3
+
+
+def test_incremental_parser_bell():
+    from vgmviz import vgm
+
+    with open('data/bell.vgm', 'rb') as f:
+        data = f.read()
+    parser = vgm.IncrementalParser()
+    out = []
+    for i in range(0, len(data), 100000):
+        out += parser.feed(data[i:i + 100000])
+    assert out == vgm.timed_from_linear(vgm.parse_vgm('data/bell.vgm')[1])
+
+
+def test_vgz(tmp_path):
+    import gzip
+    from vgmviz import vgm
+    from vgmviz.pointer import EndOfFileError
+
+    header, events = vgm.parse_vgm('data/bell.vgm')
+    with open('data/bell.vgm', 'rb') as f:
+        data = f.read()
+
+    fast = str(tmp_path / 'fast.vgz')
+    small = str(tmp_path / 'small.vgz')
+    vgm.write_vgm(fast, events, header, compresslevel=1)
+    vgm.write_vgm(small, events, header)  # .vgz defaults to level 9
+    with open(small, 'rb') as f:
+        assert f.read(2) == vgm.GZIP_MAGIC
+    assert os.path.getsize(small) < os.path.getsize(fast) < len(data)
+
+    # Several gzip members, and a wrong size in the gzip trailer.
+    multi = str(tmp_path / 'multi.vgz')
+    with open(multi, 'wb') as f:
+        f.write(gzip.compress(data[:5000]) + gzip.compress(data[5000:]))
+
+    assert vgm.parse_vgm(fast)[1] == events
+    assert vgm.parse_vgm(small, mmap=True)[1] == events
+    assert vgm.parse_vgm(multi, mmap=True)[1] == events
+    assert list(vgm.iter_vgm(multi)) == events
+
+    truncated = str(tmp_path / 'truncated.vgz')
+    with open(truncated, 'wb') as f:
+        f.write(gzip.compress(data[:len(data) // 2]))
+    with pytest.raises(EndOfFileError):
+        list(vgm.iter_vgm(truncated))
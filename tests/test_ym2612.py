@@ -15,3 +15,145 @@ def test_reg_pack2unpack():
 
 
 # TODO def test_reg_filter():
+
+
+def _bound_ev_time_reference(time_events, begin, end):
+    """ bound_ev_time() as originally implemented (linear scans). """
+    from vgmviz.vgm import TimedEvent
+
+    regs = sorted(set(t_e.event.unpack for t_e in time_events))
+    before = [t_e for t_e in time_events if t_e.time < begin]
+    during = [t_e for t_e in time_events if begin <= t_e.time < end]
+
+    old = {reg: next((t_e.event for t_e in reversed(before) if t_e.event.unpack == reg),
+                     None) for reg in regs}
+    new = {reg: next((t_e.event for t_e in reversed(during) if t_e.event.unpack == reg),
+                     old[reg]) for reg in regs}
+
+    return ([TimedEvent(begin, e) for e in old.values() if e is not None]
+            + during
+            + [TimedEvent(end, e) for e in new.values() if e is not None])
+
+
+def test_bound_ev_time():
+    from vgmviz.vgm import TimedEvent, YM2612Port0, YM2612Port1
+    from vgmviz.ym2612 import ev_unpack, TimedEventIndex, bound_ev_time
+
+    writes = [
+        (0, YM2612Port0(0x40, 1)),
+        (0, YM2612Port1(0x40, 2)),
+        (10, YM2612Port0(0x40, 3)),
+        (10, YM2612Port0(0xB0, 4)),
+        (20, YM2612Port0(0x44, 5)),
+        (30, YM2612Port0(0x40, 6)),
+    ]
+    time_events = [TimedEvent(time, ev_unpack(e)) for time, e in writes]
+    index = TimedEventIndex(time_events)
+
+    for begin, end in [(0, 10), (5, 25), (10, 30), (15, 16), (30, 100), (40, 50)]:
+        expected = _bound_ev_time_reference(time_events, begin, end)
+        assert index.bound_ev_time(begin, end) == expected
+        assert bound_ev_time(time_events, begin, end) == expected
+
+    assert index.window(10, 30) == time_events[2:5]
+    assert index.state_at(10)[Register(0, 0, 0x40)].value == 3
+    assert index.state_before(10)[Register(0, 0, 0x40)].value == 1
+    assert Register(0, 1, 0x40) not in index.state_at(10)
+
+
+def test_unpack_tables():
+    import numpy as np
+    from dataclasses import replace
+    from vgmviz.vgm import YM2612Port0, YM2612Port1
+    from vgmviz.ym2612 import ev_unpack, ev_pack, unpack_all, pack_all, _exists
+
+    ports = []
+    regs = []
+    for port, cls in enumerate([YM2612Port0, YM2612Port1]):
+        for reg in range(0x100):
+            e = cls(reg, 0x12)
+            unpacked = ev_unpack(e)
+
+            # ev_unpack as originally implemented.
+            expected = reg_unpack(reg)
+            expected = replace(expected, chan=expected.chan + 3 * port)
+            assert unpacked.unpack == expected
+            assert unpacked.value == 0x12
+            assert unpacked.unpack is ev_unpack(cls(reg, 0)).unpack
+
+            if _exists((port, reg)):
+                assert ev_pack(unpacked) == e
+                ports.append(port)
+                regs.append(reg)
+
+    ports = np.array(ports, np.uint8)
+    regs = np.array(regs, np.uint8)
+    unpacked = unpack_all(ports, regs)
+    assert [tuple(r) for r in unpacked.tolist()] == [
+        (r.chan, r.op, r.param)
+        for r in (ev_unpack(YM2612Port1(reg, 0) if port else YM2612Port0(reg, 0)).unpack
+                  for port, reg in zip(ports.tolist(), regs.tolist()))]
+
+    port_out, reg_out = pack_all(unpacked['chan'], unpacked['op'], unpacked['param'])
+    assert (port_out == ports).all()
+    assert (reg_out == regs).all()
+
+    import pytest
+    with pytest.raises(ValueError):
+        pack_all(np.array([0]), np.array([1]), np.array([0xB0]))
+
+
+def _channel_timelines_reference(time_events):
+    """ channel_timelines() as a per-event loop. """
+    from vgmviz.vgm import YM2612Port0, YM2612Port1
+
+    latch = [0] * 6
+    state = [[0, 0, 0] for _ in range(6)]  # fnum, block, key_on
+    out = [[(0, 0, 0, 0)] for _ in range(6)]
+
+    for time, e in time_events:
+        if not isinstance(e, (YM2612Port0, YM2612Port1)):
+            continue
+        chan = (e.reg & 3) + 3 * e.port
+        if e.reg == 0x28 and e.port == 0:
+            chan = {0: 0, 1: 1, 2: 2, 4: 3, 5: 4, 6: 5}.get(e.value & 7)
+            if chan is None:
+                continue
+            state[chan][2] = e.value >> 4
+        elif e.reg & 3 == 3:
+            continue
+        elif e.reg & ~3 == 0xA4:
+            latch[chan] = e.value
+            continue
+        elif e.reg & ~3 == 0xA0:
+            state[chan][:2] = [(latch[chan] & 7) << 8 | e.value, (latch[chan] >> 3) & 7]
+        else:
+            continue
+
+        row = (time, *state[chan])
+        if out[chan][-1][0] == time:
+            out[chan].pop()
+        if not out[chan] or out[chan][-1][1:] != row[1:]:
+            out[chan].append(row)
+    return out
+
+
+def test_channel_timelines():
+    import numpy as np
+    from vgmviz import columnar, vgm
+    from vgmviz.ym2612 import channel_timelines, fnum_to_hz
+
+    header, events = columnar.parse_vgm('data/bell.vgm')
+    time_events = vgm.timed_from_linear(vgm.parse_vgm('data/bell.vgm')[1])
+
+    timelines = channel_timelines(events, header.ym2612_clock)
+    expected = _channel_timelines_reference(time_events)
+    assert len(timelines) == 6
+    for timeline, rows in zip(timelines, expected):
+        assert timeline[['time', 'fnum', 'block', 'key_on']].tolist() == rows
+        assert np.allclose(timeline['hz'], fnum_to_hz(timeline['fnum'],
+                                                      timeline['block'],
+                                                      header.ym2612_clock))
+
+    # A440 is fnum 1084 at block 4 (NTSC clock).
+    assert abs(fnum_to_hz(1084, 4, 7670453) - 440) < 1
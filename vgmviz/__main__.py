@@ -0,0 +1,154 @@
+"""
+Command-line interface.
+
+python -m vgmviz batch [-j N] [--cache DIR] PATH...
+    Parse VGM files (or directories of them) in parallel,
+    and print one JSON line per file.
+
+python -m vgmviz info PATH...
+    Print the header and GD3 tag of VGM files (or directories of them)
+    as one JSON line per file, without parsing their events.
+
+python -m vgmviz optimize [--no-verify] IN OUT
+    Re-encode IN to OUT with fewer bytes (see vgmviz.optimize),
+    and print the size savings as JSON.
+
+python -m vgmviz serve [--host HOST] [--port PORT] [--max-songs N]
+    Serve parsed VGM files over HTTP (see vgmviz.server).
+
+Every command accepts:
+    --profile: print time per stage and per event class to stderr
+        (see vgmviz.profiling). batch then parses in the current process.
+    --profile-json FILE: write the profile as JSON.
+"""
+import argparse
+import dataclasses
+import json
+import sys
+from typing import List
+
+from vgmviz import batch, optimize, profiling, vgm, server
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='vgmviz')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--profile', action='store_true',
+                        help='print a profile summary to stderr')
+    common.add_argument('--profile-json', metavar='FILE', default=None,
+                        help='write the profile as JSON to FILE')
+
+    batch_parser = commands.add_parser('batch', parents=[common],
+                                       help='parse many VGM files')
+    batch_parser.add_argument('paths', nargs='+', metavar='PATH',
+                              help='VGM files, or directories to search')
+    batch_parser.add_argument('-j', '--workers', type=int, default=None,
+                              help='worker processes (default: CPU count)')
+    batch_parser.add_argument('--cache', metavar='DIR', default=None,
+                              help='cache parsed files in DIR')
+
+    info_parser = commands.add_parser('info', parents=[common],
+                                      help='print VGM metadata')
+    info_parser.add_argument('paths', nargs='+', metavar='PATH',
+                             help='VGM files, or directories to search')
+
+    optimize_parser = commands.add_parser('optimize', parents=[common],
+                                          help='re-encode a VGM file')
+    optimize_parser.add_argument('input', metavar='IN', help='VGM or VGZ file')
+    optimize_parser.add_argument('output', metavar='OUT',
+                                 help='output file (.vgz is compressed)')
+    optimize_parser.add_argument('--no-verify', dest='verify', action='store_false',
+                                 help='skip checking that OUT plays the same as IN')
+
+    serve_parser = commands.add_parser('serve', parents=[common],
+                                       help='serve VGM timelines over HTTP')
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help='address to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=server.DEFAULT_PORT,
+                              help=f'port (default: {server.DEFAULT_PORT})')
+    serve_parser.add_argument('--max-songs', type=int, default=server.DEFAULT_MAX_SONGS,
+                              help='parsed files kept in memory '
+                                   f'(default: {server.DEFAULT_MAX_SONGS})')
+
+    args = parser.parse_args(argv)
+
+    if not (args.profile or args.profile_json):
+        return _run(args)
+
+    with profiling.Profiler() as prof:
+        status = _run(args)
+    if args.profile:
+        print(prof.summary(), file=sys.stderr)
+    if args.profile_json:
+        with open(args.profile_json, 'w') as f:
+            f.write(prof.to_json())
+    return status
+
+
+def _run(args) -> int:
+    if args.command == 'batch':
+        return _batch(args)
+    if args.command == 'info':
+        return _info(args)
+    if args.command == 'optimize':
+        return _optimize(args)
+    if args.command == 'serve':
+        server.serve(args.host, args.port, args.max_songs)
+        return 0
+    raise ValueError(args.command)
+
+
+def _batch(args) -> int:
+    nerror = 0
+    # Worker processes are not profiled.
+    workers = 1 if profiling.active() is not None else args.workers
+    for result in batch.parse_many(batch.find_vgm(args.paths), workers,
+                                   cache_dir=args.cache):
+        line = {'path': result.path}
+        if result.ok:
+            line.update(
+                version=result.header.version,
+                nsamp=result.header.nsamp,
+                nevents=len(result.events),
+            )
+        else:
+            nerror += 1
+            line['error'] = result.error
+
+        print(json.dumps(line), flush=True)
+
+    return 1 if nerror else 0
+
+
+def _info(args) -> int:
+    nerror = 0
+    for path in batch.find_vgm(args.paths):
+        line = {'path': path}
+        try:
+            header, gd3, extra = vgm.read_metadata(path)
+        except (OSError, ValueError) as e:
+            nerror += 1
+            line['error'] = f'{type(e).__name__}: {e}'
+        else:
+            line['header'] = {
+                name: value for name, value in dataclasses.asdict(header).items()
+                if name != 'magic'}
+            line['chips'] = sorted(header.chips())
+            line['gd3'] = gd3 and dataclasses.asdict(gd3)
+            line['extra'] = extra and dataclasses.asdict(extra)
+
+        print(json.dumps(line), flush=True)
+
+    return 1 if nerror else 0
+
+
+def _optimize(args) -> int:
+    report = optimize.optimize_vgm(args.input, args.output, verify=args.verify)
+    print(json.dumps(dict(report._asdict(), saved=report.saved)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+asyncio facade over vgm.parse_vgm() and vgm.IncrementalParser.
+
+    header, events = await aparse_vgm(path)
+    async for event in aiter_vgm(path, timed=True):
+        ...
+
+Nothing blocks the event loop:
+- Files are read in chunks, each in a thread (asyncio has no non-blocking file I/O).
+- Decoding runs in an executor (VgmLoader(executor=...)). With threads, each chunk
+  is decompressed and decoded as a separate job (by an IncrementalParser), so other
+  requests' jobs interleave with it, and cancelling the awaiting task stops
+  parsing after the current chunk.
+  With processes, each file is decoded by one job in a worker process (after it is
+  read), and cancelling drops the result.
+- VgmLoader(max_concurrent=N) bounds the number of files parsed at once.
+"""
+import asyncio
+import os
+import weakref
+import zlib
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Union, AsyncIterator, Tuple, Iterable, List
+
+from vgmviz import vgm
+from vgmviz.pointer import Pointer, EndOfFileError
+from vgmviz.vgm import VgmHeader, LinearEventList, EventStruct, IncrementalParser, \
+    TimedEvent, IWait, PureWait, GZIP_MAGIC, ENDIAN
+
+_Chips = Optional[Iterable[str]]
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+DEFAULT_CHUNK_SIZE = 0x40000
+DEFAULT_MAX_CONCURRENT = 8
+
+
+class VgmLoader:
+    """ Parses VGM/VGZ files from coroutines.
+
+    Use as `async with VgmLoader(...) as loader:`, or call close() when done,
+    to shut down an executor created by the loader.
+    """
+
+    def __init__(
+            self,
+            executor: Union[str, Executor, None] = None,
+            workers: Optional[int] = None,
+            max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        """
+        :param executor: Where decoding runs. None uses the event loop's default
+            (thread) executor. THREAD or PROCESS creates a pool of `workers`,
+            owned by the loader. An Executor instance is used as-is (not shut down).
+        :param workers: Pool size for THREAD or PROCESS (None = os.cpu_count()).
+        :param max_concurrent: Number of files parsed at once. Other calls wait.
+        :param chunk_size: Bytes read (and decoded) per job.
+        """
+        if executor == THREAD:
+            executor = ThreadPoolExecutor(workers)
+            self._owned = True
+        elif executor == PROCESS:
+            executor = ProcessPoolExecutor(workers or os.cpu_count())
+            self._owned = True
+        elif executor is None or isinstance(executor, Executor):
+            self._owned = False
+        else:
+            raise ValueError(f'executor must be {THREAD!r}, {PROCESS!r}, '
+                             f'an Executor or None, not {executor!r}')
+
+        self.executor: Optional[Executor] = executor
+        self.max_concurrent = max_concurrent
+        self.chunk_size = chunk_size
+
+        # asyncio.Semaphore is bound to one event loop.
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def in_process(self) -> bool:
+        """ Whether decoding runs in this process (so it can be done per chunk). """
+        return not isinstance(self.executor, ProcessPoolExecutor)
+
+    def close(self) -> None:
+        if self._owned:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self) -> 'VgmLoader':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        try:
+            return self._semaphores[loop]
+        except KeyError:
+            sem = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrent)
+            return sem
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # Parsing
+
+    async def parse_vgm(self, path: str, chips: _Chips = None) \
+            -> Tuple[VgmHeader, LinearEventList]:
+        """ Equivalent to vgm.parse_vgm(path, chips=chips). """
+        chips = vgm._check_chips(chips)
+        async with self._semaphore():
+            if not self.in_process:
+                data = b''.join([chunk async for chunk in _read_chunks(
+                    path, self.chunk_size)])
+                return await self._run(_parse_data, data, chips)
+
+            decoder = _Decoder(chips)
+            events = []
+            async for chunk in _read_chunks(path, self.chunk_size):
+                events += await self._run(decoder.feed, chunk)
+                if decoder.parser.done:
+                    break
+            return decoder.finish(), events
+
+    async def iter_vgm(self, path: str, timed: bool = False, chips: _Chips = None) \
+            -> AsyncIterator[EventStruct]:
+        """ Equivalent to vgm.iter_vgm(path, timed).
+        Events are yielded as each chunk is decoded.
+        The file counts towards max_concurrent until the iterator is exhausted or closed.
+        """
+        chips = vgm._check_chips(chips)
+        async with self._semaphore():
+            if self.in_process:
+                events = self._iter_chunks(path, chips)
+            else:
+                events = self._iter_whole(path, chips)
+
+            time = 0
+            async for event in events:
+                if timed:
+                    if not isinstance(event, PureWait):
+                        yield TimedEvent(time, event)
+                    if isinstance(event, IWait):
+                        time += event.delay
+                else:
+                    yield event
+
+    async def _iter_chunks(self, path: str, chips: _Chips) -> AsyncIterator[EventStruct]:
+        decoder = _Decoder(chips)
+        async for chunk in _read_chunks(path, self.chunk_size):
+            for event in await self._run(decoder.feed, chunk):
+                yield event
+            if decoder.parser.done:
+                break
+        decoder.finish()
+
+    async def _iter_whole(self, path: str, chips: _Chips) -> AsyncIterator[EventStruct]:
+        data = b''.join([chunk async for chunk in _read_chunks(path, self.chunk_size)])
+        _, events = await self._run(_parse_data, data, chips)
+        for event in events:
+            yield event
+
+
+_default_loader: Optional[VgmLoader] = None
+
+
+def default_loader() -> VgmLoader:
+    """ Loader used by aparse_vgm() and aiter_vgm() (the event loop's default executor).
+    """
+    global _default_loader
+    if _default_loader is None:
+        _default_loader = VgmLoader()
+    return _default_loader
+
+
+async def aparse_vgm(path: str, chips: _Chips = None, loader: VgmLoader = None) \
+        -> Tuple[VgmHeader, LinearEventList]:
+    """ See VgmLoader.parse_vgm(). """
+    return await (loader or default_loader()).parse_vgm(path, chips)
+
+
+def aiter_vgm(path: str, timed: bool = False, chips: _Chips = None,
+              loader: VgmLoader = None) -> AsyncIterator[EventStruct]:
+    """ See VgmLoader.iter_vgm(). """
+    return (loader or default_loader()).iter_vgm(path, timed, chips)
+
+
+# Reading and decoding
+
+async def _read_chunks(path: str, chunk_size: int) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    f = await loop.run_in_executor(None, open, path, 'rb')
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+def _parse_data(data: bytes, chips: _Chips) -> Tuple[VgmHeader, LinearEventList]:
+    """ vgm.parse_vgm() of a file's contents (run in a worker process). """
+    if data.startswith(GZIP_MAGIC):
+        data = b''.join(_Gunzip().feed(data))
+    ptr = Pointer(data, 0, ENDIAN)
+    header = VgmHeader.decode(ptr)
+    return header, vgm.parse_body(ptr, header, chips)
+
+
+class _Decoder:
+    """ Decompresses (if gzipped) and decodes a file, fed one chunk at a time. """
+
+    def __init__(self, chips: _Chips):
+        self.parser = IncrementalParser(chips=chips)
+        self.gunzip: Optional[_Gunzip] = None
+        self.started = False
+
+    def feed(self, chunk: bytes) -> LinearEventList:
+        if not self.started:
+            self.started = True
+            if chunk.startswith(GZIP_MAGIC):
+                self.gunzip = _Gunzip()
+
+        if self.gunzip is None:
+            return self.parser.feed_linear(chunk)
+
+        events = []
+        for data in self.gunzip.feed(chunk):
+            events += self.parser.feed_linear(data)
+        return events
+
+    def finish(self) -> VgmHeader:
+        """ Raise EndOfFileError unless the whole file (up to the end-of-data command)
+        was read, like vgm.parse_vgm(). """
+        if self.parser.header is None:
+            raise EndOfFileError('end of file in VGM header')
+        if not self.parser.done:
+            raise EndOfFileError(f'end of file at {self.parser.addr:#x}, '
+                                 f'before the end-of-data command')
+        return self.parser.header
+
+
+class _Gunzip:
+    """ Push-based vgm.iter_decompress(): gzip (possibly several members) -> chunks. """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(vgm._GZIP_WBITS)
+
+    def feed(self, data: bytes) -> List[bytes]:
+        out = []
+        while data:
+            out.append(self.decompressor.decompress(data))
+            if self.decompressor.eof:
+                # Start of next gzip member.
+                data = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(vgm._GZIP_WBITS)
+            else:
+                data = b''
+        return out
@@ -0,0 +1,80 @@
+"""
+Parse many VGM files in parallel (eg. to catalog a soundtrack archive).
+
+Files are spread across a ProcessPoolExecutor. Each file is decoded by the columnar
+decoder, so workers return one NumPy array per file instead of lists of dataclasses,
+which keeps pickling (IPC) cheap.
+"""
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional, Iterable, Iterator, List
+
+from vgmviz import columnar
+from vgmviz.cache import ParseCache
+from vgmviz.columnar import EventArray
+from vgmviz.vgm import VgmHeader
+
+VGM_EXTENSIONS = ('.vgm', '.vgz')
+
+
+class ParseResult(NamedTuple):
+    path: str
+    header: Optional[VgmHeader]
+    events: Optional[EventArray]
+    error: Optional[str]  # eg. 'VgmNotImplemented: Unhandled VGM command 0x4f'
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def parse_one(path: str, cache_dir: Optional[str] = None) -> ParseResult:
+    """ Never raises (except BaseException). Errors are returned in ParseResult.error.
+
+    :param cache_dir: If not None, look up and store results in a ParseCache.
+    """
+    try:
+        if cache_dir is not None:
+            header, events = ParseCache(cache_dir).parse_vgm(path)
+        else:
+            header, events = columnar.parse_vgm(path)
+    except Exception as e:
+        return ParseResult(path, None, None, f'{type(e).__name__}: {e}')
+    return ParseResult(path, header, events, None)
+
+
+def parse_many(
+        paths: Iterable[str],
+        workers: Optional[int] = None,
+        chunksize: int = 1,
+        cache_dir: Optional[str] = None,
+) -> Iterator[ParseResult]:
+    """ Yields one ParseResult per path, in order.
+
+    :param workers: Number of processes (None = os.cpu_count()).
+        workers=1 parses in the current process.
+    :param cache_dir: See parse_one().
+    """
+    func = functools.partial(parse_one, cache_dir=cache_dir)
+    if workers == 1:
+        yield from map(func, paths)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        yield from executor.map(func, paths, chunksize=chunksize)
+
+
+def find_vgm(paths: Iterable[str]) -> List[str]:
+    """ Expand directories into the VGM files they contain (recursively). """
+    out = []
+    for path in paths:
+        if not os.path.isdir(path):
+            out.append(path)
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            out += [os.path.join(root, name) for name in sorted(files)
+                    if name.lower().endswith(VGM_EXTENSIONS)]
+    return out
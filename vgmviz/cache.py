@@ -0,0 +1,177 @@
+"""
+On-disk cache of parsed VGM files (header + columnar event table).
+
+Each entry is two files in the cache directory:
+- <key>.npy: the EventArray, loaded with np.load(mmap_mode='r') (no decoding).
+- <key>.json: the VgmHeader fields.
+
+VGZ files are parsed like VGM files, so a hit skips decompression as well as decoding.
+
+The key is a hash of the file contents (as stored), its mtime, vgmviz.__version__ and
+CACHE_VERSION, so a changed file (or a new decoder) never hits a stale entry.
+
+Entries are evicted least-recently-used first, when the cache exceeds max_bytes.
+A hit updates the entry's mtime, which is the LRU order.
+"""
+import dataclasses
+import hashlib
+import json
+import os
+from typing import Tuple, Optional, List
+
+import numpy as np
+
+import vgmviz
+from vgmviz import columnar
+from vgmviz.columnar import EventArray, EVENT_DTYPE
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import VgmHeader, ENDIAN, load_vgm
+
+# Increment when the cached format changes (EVENT_DTYPE, VgmHeader fields...).
+CACHE_VERSION = 2
+
+_EVENTS_EXT = '.npy'
+_HEADER_EXT = '.json'
+
+
+class ParseCache:
+    """
+    :param directory: Created if missing.
+    :param max_bytes: Size limit of all entries. None means unlimited.
+    """
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = 1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def parse_vgm(self, path: str) -> Tuple[VgmHeader, EventArray]:
+        """ Cached equivalent of columnar.parse_vgm().
+        On a hit, the events are a read-only memory-mapped array. """
+        key = self.key(path)
+        hit = self.get(key)
+        if hit is not None:
+            return hit
+
+        ptr = Pointer(load_vgm(path, mmap=True), 0, ENDIAN)
+        header = VgmHeader.decode(ptr)
+        events = columnar.parse_body(ptr, header)
+        self.put(key, header, events)
+        return header, events
+
+    @staticmethod
+    def key(path: str) -> str:
+        # Hash the file as stored, so hits on VGZ files skip decompression.
+        h = hashlib.sha256()
+        h.update(f'{CACHE_VERSION} {vgmviz.__version__} '
+                 f'{os.stat(path).st_mtime_ns} '.encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(0x100000), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    # Entries
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, key + ext)
+
+    def get(self, key: str) -> Optional[Tuple[VgmHeader, EventArray]]:
+        events_path = self._path(key, _EVENTS_EXT)
+        try:
+            with open(self._path(key, _HEADER_EXT)) as f:
+                header = _header_from_json(json.load(f))
+            events = np.load(events_path, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        if events.dtype != EVENT_DTYPE:
+            return None
+
+        os.utime(events_path)
+        return header, events
+
+    def put(self, key: str, header: VgmHeader, events: EventArray) -> None:
+        # Write to temporary files and rename, so readers never see partial entries.
+        # The header is renamed last, since get() reads it first.
+        tmp = f'.{os.getpid()}.tmp'
+        events_path = self._path(key, _EVENTS_EXT)
+        header_path = self._path(key, _HEADER_EXT)
+
+        with open(events_path + tmp, 'wb') as f:
+            np.save(f, events)
+        with open(header_path + tmp, 'w') as f:
+            json.dump(_header_to_json(header), f)
+        os.replace(events_path + tmp, events_path)
+        os.replace(header_path + tmp, header_path)
+
+        self.evict()
+
+    def keys(self) -> List[str]:
+        """ Sorted from least to most recently used. """
+        entries = []
+        for name in os.listdir(self.directory):
+            key, ext = os.path.splitext(name)
+            if ext == _EVENTS_EXT:
+                try:
+                    mtime = os.stat(os.path.join(self.directory, name)).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                entries.append((mtime, key))
+        return [key for _, key in sorted(entries)]
+
+    def entry_nbytes(self, key: str) -> int:
+        nbytes = 0
+        for ext in [_EVENTS_EXT, _HEADER_EXT]:
+            try:
+                nbytes += os.path.getsize(self._path(key, ext))
+            except FileNotFoundError:
+                pass
+        return nbytes
+
+    @property
+    def nbytes(self) -> int:
+        return sum(map(self.entry_nbytes, self.keys()))
+
+    def evict(self) -> None:
+        """ Remove least-recently-used entries until nbytes <= max_bytes.
+        The most recent entry is always kept. """
+        if self.max_bytes is None:
+            return
+        keys = self.keys()
+        sizes = [self.entry_nbytes(key) for key in keys]
+        total = sum(sizes)
+
+        for key, size in zip(keys[:-1], sizes):
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+
+    def remove(self, key: str) -> None:
+        # Remove the header first, so get() misses instead of reading a lone header.
+        for ext in [_HEADER_EXT, _EVENTS_EXT]:
+            try:
+                os.remove(self._path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        for key in self.keys():
+            self.remove(key)
+
+
+def _header_to_json(header: VgmHeader) -> dict:
+    return {
+        field.name: value.hex() if isinstance(value, bytes) else value
+        for field in dataclasses.fields(header)
+        for value in [getattr(header, field.name)]
+    }
+
+
+def _header_from_json(d: dict) -> VgmHeader:
+    kwargs = {}
+    for field in dataclasses.fields(VgmHeader):
+        value = d[field.name]
+        if field.type in (bytes, 'bytes'):
+            value = bytes.fromhex(value)
+        kwargs[field.name] = value
+    return VgmHeader(**kwargs)
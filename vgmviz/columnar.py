@@ -0,0 +1,311 @@
+"""
+Columnar (NumPy) VGM event decoding.
+
+vgm.parse_body() creates one EventStruct per command. This module instead decodes
+the body into a structured array (one row per command), without creating Python
+objects per event. Only variable-length commands (DataBlock) are decoded as objects,
+and only on request (see decode_rows).
+
+Command boundaries are found with a command-length lookup table over the whole buffer
+(see command_offsets), so the Python-level work is per command *type*, not per command.
+"""
+from time import perf_counter_ns
+from typing import Tuple, List, Type, Dict, Iterable, Iterator, Sequence, Union
+
+import numpy as np
+
+from vgmviz import profiling, vgm
+from vgmviz.datastruct import EventStruct, cmd2event, event_layout, event_decoder, \
+    Command
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import VgmHeader, VgmNotImplemented, PureWait, ENDIAN, \
+    EVENT_TERMINATOR, RESERVED_SIZES, LinearEventList, TimedEvent, load_vgm
+
+EVENT_DTYPE = np.dtype([
+    ('offset', np.uint32),  # Address of the command ID
+    ('command', np.uint8),
+    ('time', np.int64),  # Samples elapsed before this command
+    ('delay', np.uint32),  # Samples waited by this command (IWait.delay)
+    ('port', np.uint8),  # Chip port (eg. YM2612Port1 -> 1)
+    ('reg', np.uint8),  # Register (or DataBlock.typ)
+    ('value', np.uint32),  # Register value, or other operand (PCMSeek.address...)
+])
+
+EventArray = np.ndarray  # dtype=EVENT_DTYPE
+
+# EventStruct field name -> EVENT_DTYPE column, if the names differ.
+# Fields without a matching column are not stored.
+_FIELD_COLUMNS = {
+    'typ': 'reg',
+    'nbytes': 'value',
+    'address': 'value',
+}
+
+
+# Parse VGM
+
+@profiling.timed('columnar.parse_vgm')
+def parse_vgm(path: str, mmap: bool = False, chips: Iterable[str] = None) \
+        -> Tuple[VgmHeader, EventArray]:
+    ptr = Pointer(load_vgm(path, mmap), 0, ENDIAN)
+
+    header = VgmHeader.decode(ptr)
+    events = parse_body(ptr, header, chips)
+    return header, events
+
+
+@profiling.timed('columnar.parse_body')
+def parse_body(ptr: Pointer, header: VgmHeader, chips: Iterable[str] = None) \
+        -> EventArray:
+    """ Columnar equivalent of vgm.parse_body().
+    Row i of the output corresponds to event i of vgm.parse_body(ptr, header, chips).
+    """
+    buf = np.frombuffer(ptr.data, np.uint8)
+    offsets = command_offsets(ptr, header)
+    offsets = offsets[np.isin(buf[offsets], materialized_commands(chips))]
+
+    out = np.zeros(len(offsets), EVENT_DTYPE)
+    out['offset'] = offsets
+    commands = out['command'] = buf[offsets]
+    prof = profiling.active()
+
+    for command in np.unique(commands).tolist():
+        if prof is not None:
+            start = perf_counter_ns()
+        cls = cmd2event[command]
+        layout = event_layout(cls)
+        rows = np.flatnonzero(commands == command)
+        row_offsets = offsets[rows]
+
+        for name, field_offset, code in layout.fields:
+            column = _FIELD_COLUMNS.get(name, name)
+            if column in EVENT_DTYPE.names:
+                out[column][rows] = _read_int(buf, row_offsets + field_offset, code,
+                                              ptr.endian)
+        for name, func in layout.params:
+            column = _FIELD_COLUMNS.get(name, name)
+            if column in EVENT_DTYPE.names:
+                out[column][rows] = func(command - cls.base_command)
+
+        # Chip port, if constant per class (YM2612Port1.port). Otherwise a field.
+        port = getattr(cls, 'port', 0)
+        if isinstance(port, int):
+            out['port'][rows] = port
+
+        # Fixed-length waits (Wait735...) have a class-level delay, not a field.
+        delay = getattr(cls, 'delay', None)
+        if isinstance(delay, int):
+            out['delay'][rows] = delay
+
+        if prof is not None:
+            stats = prof.opcode(command)
+            stats.ns += perf_counter_ns() - start
+            stats.count += len(rows)
+            stats.nbytes += layout.size * len(rows)
+            if layout.length is not None:
+                column = _FIELD_COLUMNS.get(layout.length, layout.length)
+                stats.nbytes += int(out[column][rows].sum())
+
+    # Exclusive prefix sum of delays.
+    time = out['time']
+    np.cumsum(out['delay'], out=time)
+    time -= out['delay']
+    return out
+
+
+@profiling.timed('columnar.command_offsets')
+def command_offsets(ptr: Pointer, header: VgmHeader) -> np.ndarray:
+    """ Return the address of every command in the VGM body, excluding the terminator.
+    This includes reserved commands (which parse_body() drops).
+
+    Each byte is treated as a potential command, and `next[i] = i + length(buf[i])`.
+    The commands are the orbit of data_addr under `next`. This is found by pointer
+    doubling (next, next^2, next^4...), so Python only loops O(log n) times.
+    """
+    buf = np.frombuffer(ptr.data, np.uint8)
+    begin = header.data_addr
+    end = min(header.nbytes, len(buf))
+    if not begin < end:
+        raise ValueError(f'data_addr={begin:#x} past end of file {end:#x}')
+
+    body = buf[begin:end]
+    n = len(body)
+    lengths, length_fields = _length_tables(ptr.endian)
+
+    # Node i represents address begin+i. Node n is end-of-file.
+    # Unknown commands and the terminator have length 0, and point to themselves.
+    jump = np.empty(n + 1, np.int64)
+    jump[:n] = np.arange(n)
+    jump[:n] += lengths[body]
+    jump[n] = n
+
+    # Variable-length commands (DataBlock) store their length in a field.
+    for command, (field_offset, code, size) in length_fields.items():
+        (idx,) = np.nonzero(body[:max(n - size + 1, 0)] == command)
+        nbytes = _read_int(body, idx + field_offset, code, ptr.endian)
+        jump[idx] = idx + size + nbytes
+
+    np.minimum(jump, n, out=jump)
+
+    reached = np.zeros(n + 1, bool)
+    reached[0] = True
+    nreached = 1
+    while True:
+        reached[jump[reached]] = True
+        new_nreached = np.count_nonzero(reached)
+        if new_nreached == nreached:
+            break
+        nreached = new_nreached
+        jump = jump[jump]
+
+    (nodes,) = np.nonzero(reached)
+    last = nodes[-1]
+    if last == n:
+        raise ValueError(f'VGM body has no terminator (command {EVENT_TERMINATOR:#x})')
+    if body[last] != EVENT_TERMINATOR:
+        raise VgmNotImplemented(f"Unhandled VGM command {body[last]:#2x}")
+
+    return (nodes[:-1] + begin).astype(np.uint32)
+
+
+def materialized_commands(chips: Iterable[str] = None) -> List[Command]:
+    """ Commands decoded by vgm.parse_body(chips=chips). """
+    chips = vgm._check_chips(chips)
+    return [command for command, cls in cmd2event.items()
+            if vgm.is_materialized(cls, chips)]
+
+
+def _length_tables(endian: str) -> Tuple[np.ndarray, Dict[Command, tuple]]:
+    """
+    :return: (lengths, length_fields)
+        lengths[command] = fixed size of command (0 if unknown or terminator).
+        length_fields[command] = (offset, struct code, fixed size) of the field
+            holding the length of a variable-length command.
+    """
+    lengths = np.zeros(256, np.int64)
+    length_fields = {}
+
+    for command, size in RESERVED_SIZES.items():
+        lengths[command] = size
+
+    for command, cls in cmd2event.items():
+        layout = event_layout(cls)
+        lengths[command] = layout.size
+        if layout.length is not None:
+            (field_offset, code), = [
+                (offset, code) for name, offset, code in layout.fields
+                if name == layout.length]
+            length_fields[command] = (field_offset, code, layout.size)
+
+    return lengths, length_fields
+
+
+def _read_int(buf: np.ndarray, offsets: np.ndarray, code: str, endian: str) \
+        -> np.ndarray:
+    """ Read one integer (struct code B/H/I/b/h/i) at each offset. """
+    nbytes = {'b': 1, 'h': 2, 'i': 4}[code.lower()]
+    byte_order = range(nbytes) if endian == 'little' else range(nbytes - 1, -1, -1)
+
+    out = np.zeros(len(offsets), np.int64)
+    for shift, i in enumerate(byte_order):
+        out |= buf[offsets + i].astype(np.int64) << (8 * shift)
+
+    if code.islower():
+        sign = 1 << (8 * nbytes - 1)
+        out = (out ^ sign) - sign
+    return out
+
+
+# Python fallback
+
+def decode_rows(ptr: Pointer, events: EventArray) -> LinearEventList:
+    """ Decode rows into EventStruct objects (eg. to read DataBlock contents). """
+    out = []
+    for offset, command in zip(events['offset'].tolist(), events['command'].tolist()):
+        ptr.seek(offset + 1)
+        out.append(cmd2event[command].decode(ptr, command))
+    return out
+
+
+def data_blocks(ptr: Pointer, events: EventArray) -> LinearEventList:
+    return decode_rows(ptr, keep_type(events, [cls for cls in cmd2event.values()
+                                               if event_layout(cls).length]))
+
+
+class EventTable(Sequence):
+    """ Read-only TimedEventList backed by an EventArray.
+
+    Rows take sizeof(EVENT_DTYPE) bytes each, instead of an EventStruct plus
+    a TimedEvent. Items are decoded from the file on access, and not kept.
+    Slicing returns another EventTable.
+
+    EventTable(ptr, timed_from_linear(parse_body(ptr, header))) has the same items as
+    vgm.timed_from_linear(vgm.parse_body(ptr, header)).
+    """
+
+    def __init__(self, ptr: Pointer, events: EventArray):
+        self.ptr = ptr
+        self.events = events
+        self._decoders = {}
+
+    def __len__(self):
+        return len(self.events)
+
+    def __getitem__(self, i: Union[int, slice]) -> 'Union[TimedEvent, EventTable]':
+        if isinstance(i, slice):
+            return EventTable(self.ptr, self.events[i])
+        row = self.events[i]
+        return TimedEvent(int(row['time']), self._decode(int(row['offset'])))
+
+    def __iter__(self) -> Iterator[TimedEvent]:
+        for time, offset in zip(self.events['time'].tolist(),
+                                self.events['offset'].tolist()):
+            yield TimedEvent(time, self._decode(offset))
+
+    def linear(self) -> Iterator[EventStruct]:
+        """ Iterate over events without times (like a LinearEventList). """
+        for offset in self.events['offset'].tolist():
+            yield self._decode(offset)
+
+    def _decode(self, offset: int) -> EventStruct:
+        ptr = self.ptr
+        command = ptr.u8(offset)
+        try:
+            decode, command_offset = self._decoders[command]
+        except KeyError:
+            decode, command_offset = self._decoders[command] = \
+                event_decoder(command, ptr.endian)
+        ptr.seek(offset + 1)
+        return decode(ptr, command_offset)
+
+    @property
+    def nbytes(self) -> int:
+        return self.events.nbytes
+
+
+# **** Array equivalents of vgm.timed_from_linear() etc. ****
+
+def _commands_of(classes: Iterable[Type[EventStruct]]) -> List[Command]:
+    classes = set(classes)
+    return [command for command, cls in cmd2event.items() if cls in classes]
+
+
+def timed_from_linear(events: EventArray) -> EventArray:
+    """ Remove PureWait rows. Times are already stored in events['time']. """
+    waits = _commands_of(cls for cls in cmd2event.values() if issubclass(cls, PureWait))
+    return events[~np.isin(events['command'], waits)]
+
+
+def keep_type(events: EventArray, classes: List[type]) -> EventArray:
+    if not classes:
+        raise ValueError('empty classes')
+    return events[np.isin(events['command'], _commands_of(classes))]
+
+
+def filter_ev_time(events: EventArray, begin=float('-inf'), end=float('inf')) \
+        -> EventArray:
+    """ Returns a view (events are sorted by time). """
+    time = events['time']
+    i0 = np.searchsorted(time, begin, 'left') if begin > -np.inf else 0
+    i1 = np.searchsorted(time, end, 'left') if end < np.inf else len(events)
+    return events[i0:i1]
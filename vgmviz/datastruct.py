@@ -1,6 +1,11 @@
-from typing import ClassVar, Dict, Type, Callable, Optional, Any, List, Union
+import struct
+import sys
+from binascii import unhexlify
+from operator import attrgetter
+from typing import ClassVar, Dict, Type, Callable, Optional, Any, List, Union, Tuple, \
+    NamedTuple, Iterable
 
-from dataclasses import fields, Field, dataclass, field
+from dataclasses import fields, Field, dataclass, field, MISSING
 
 from vgmviz.pointer import Pointer, Writer
 
@@ -14,12 +19,14 @@ _Kwargs = Dict[str, Any]
 _METADATA_KEY = 'struct_field'
 
 
-def meta(*args, **kwargs) -> Field:
+def meta(*args, default=MISSING, **kwargs) -> Field:
     metadata = FieldMeta(*args, **kwargs)
 
     field_kwargs = {}
     if metadata.method == 'magic':
         field_kwargs['default'] = metadata.arg
+    elif default is not MISSING:
+        field_kwargs['default'] = default
 
     return field(metadata={_METADATA_KEY: metadata}, **field_kwargs)
 
@@ -54,6 +61,14 @@ class FieldMeta:
                 'Invalid metadata, cannot supply multiple of [method, parameterize]')
 
 
+# Python 3.10+: events are slotted (no per-instance __dict__), which saves memory
+# when parsing millions of events.
+if sys.version_info >= (3, 10):
+    event_dataclass = dataclass(slots=True)
+else:
+    event_dataclass = dataclass
+
+
 #### DataStruct (for VGM headers)
 
 # noinspection PyDataclass
@@ -61,19 +76,10 @@ class DataStruct:
     """ Dataclass representing a struct. """
     @classmethod
     def decode(cls, ptr: Pointer) -> 'DataStruct':
-        kwargs: _Kwargs = {}
-
-        for f in fields(cls):  # type: Field
-            _struct_read(cls, ptr, f, kwargs, 0)
-
-        # noinspection PyArgumentList
-        return cls(**kwargs)
+        return _get_codec(cls, ptr.endian).decode(ptr, 0)
 
     def encode(self, wrt: Writer) -> None:
-        f: Field
-        for f in fields(self):
-            value = getattr(self, f.name)
-            _struct_write(self, wrt, value, f)
+        _get_codec(type(self), wrt.endian).encode(self, wrt)
 
 
 #### EventStruct (special-case supporting command ID)
@@ -96,12 +102,15 @@ def register_cmd2event(*commands: int) -> Callable:
             raise TypeError(f'{event_cls} must be Event')
 
         event_cls.base_command = commands[0]
+        event_cls.commands = commands
         event_cls.is_multiple_commands = (len(commands) > 1)
 
+        # With slots, dataclass() returns a new class. Register that one.
+        event_cls = event_dataclass(event_cls)
         for command in commands:
             cmd2event[command] = event_cls
 
-        return dataclass(event_cls)
+        return event_cls
     return _register_event
 
 
@@ -120,46 +129,142 @@ class EventStruct:
 
     - encode() checks: If `is_multiple_commands` is true,
     it reads `command()`, which calculates command from event fields.
+        - If `command()` is not defined, the command is looked up
+        by inverting the `parameterize` functions over `commands`.
     - encode() writes command ID to `wrt`, skipping all parameterized fields.
 
+    - decode() and encode() are compiled per class on first use (see _Codec).
+
     - TODO: encode() ignores fields `x` targeted by `meta(length=x)`
     and recomputes them when writing.
         - Only useful for binary blob editing.
         I don't need it in the foreseeable future.
-
-    - TODO: actually define `command()` on parametric commands.
-        - I do not expect to encode() them.
     """
 
+    __slots__ = ()
+
     base_command: ClassVar[Command]
+    commands: ClassVar[Tuple[Command, ...]]
     command: ClassVar[Callable[[], int]]
     is_multiple_commands: ClassVar[bool]
 
+    # Chip written by this event (eg. 'ym2612'), or None (waits, data blocks...).
+    chip: ClassVar[Optional[str]] = None
+
     @classmethod
     def decode(cls, ptr: Pointer, command: Command) -> 'EventStruct':
-        command_offset = command - cls.base_command
-        kwargs = {}
-
-        for f in fields(cls):  # type: Field
-            _struct_read(cls, ptr, f, kwargs, command_offset)
-
-        # noinspection PyArgumentList
-        return cls(**kwargs)
+        # ptr may be None for purely parametric events (eg. Wait4Bit).
+        endian = ptr.endian if ptr is not None else None
+        return _get_codec(cls, endian).decode(ptr, command - cls.base_command)
 
     # NOT classmethod
     def encode(self, wrt: Writer) -> None:
-        if self.is_multiple_commands:
-            command = self.command()
-        else:
-            command = self.base_command
+        _get_codec(type(self), wrt.endian).encode(self, wrt)
+
+
+_Decoder = Callable[[Pointer, int], 'EventStruct']
+
+
+def event_decoder(command: Command, endian: str) -> Tuple[_Decoder, int]:
+    """ Look up the compiled decoder for a command ID.
+    Returns (decode, command_offset); call decode(ptr, command_offset).
+
+    Equivalent to cmd2event[command].decode(ptr, command),
+    but skips the per-event codec lookup. Used by parse_body's dispatch table.
+    """
+    cls = cmd2event[command]
+    return _get_codec(cls, endian).decode, command - cls.base_command
+
+
+def encode_events(events: Iterable['EventStruct'], wrt: Writer, batch: int = 4096) \
+        -> None:
+    """ Equivalent to `for event in events: event.encode(wrt)`.
 
-        # Write command ID.
-        wrt.u8(command)
+    Consecutive fixed-size events are packed together, with one struct.Struct
+    per `batch` events, instead of one Writer call per event.
+    """
+    prefix = _ENDIAN_PREFIX[wrt.endian]
+    codecs: Dict[type, _Codec] = {}
 
-        f: Field
-        for f in fields(self):
-            value = getattr(self, f.name)
-            _struct_write(self, wrt, value, f)
+    codes: List[str] = []
+    values: List[int] = []
+
+    def flush():
+        if codes:
+            wrt.pack(struct.Struct(prefix + ''.join(codes)), *values)
+            codes.clear()
+            values.clear()
+
+    for event in events:
+        cls = type(event)
+        try:
+            codec = codecs[cls]
+        except KeyError:
+            codec = codecs[cls] = _get_codec(cls, wrt.endian)
+
+        if codec.codes is None:
+            flush()
+            codec.encode(event, wrt)
+            continue
+
+        codes.append(codec.codes)
+        values += codec.values(event)
+        if len(codes) >= batch:
+            flush()
+
+    flush()
+
+
+class EventLayout(NamedTuple):
+    """ Byte layout of an event, for decoders which do not create EventStruct objects.
+
+    fields: (name, byte offset from command ID, struct code) of integer fields,
+        up to the first variable-length field. Integers without a struct code
+        (eg. u24) are counted in `size`, but not listed.
+    params: (name, parameterize) of parametric fields.
+    size: Size of the fixed-size part (including command ID).
+    length: Name of the field holding the length of the trailing blob, if any.
+        The full event size is then `size + event.<length>`.
+    """
+    fields: List[Tuple[str, int, str]]
+    params: List[Tuple[str, Callable[[int], int]]]
+    size: int
+    length: Optional[str]
+
+
+def event_layout(cls: Type['EventStruct']) -> EventLayout:
+    out_fields = []
+    params = []
+    size = 1
+    length = None
+
+    for f in fields(cls):  # type: Field
+        metadata = _get_meta(f)
+        if metadata is None:
+            continue
+
+        if metadata.parameterize:
+            params.append((f.name, metadata.parameterize))
+            continue
+        if length is not None or metadata.addr is not None:
+            raise ValueError(f'cannot compute layout of {cls}: field {f.name}')
+
+        if _is_plain(metadata):
+            code = _STRUCT_CODES[metadata.method]
+            out_fields.append((f.name, size, code))
+            size += struct.calcsize(code)
+        elif metadata.method == 'magic':
+            size += len(metadata.arg)
+        elif metadata.method == 'hexmagic':
+            size += len(unhexlify(metadata.arg))
+        elif metadata.method in _FIXED_SIZES:
+            size += _FIXED_SIZES[metadata.method]
+        elif metadata.length is not None:
+            length = metadata.length
+        else:
+            raise ValueError(f'cannot compute layout of {cls}: field {f.name}')
+
+    return EventLayout(out_fields, params, size, length)
 
 
 #### Struct field operations
@@ -232,6 +337,10 @@ def _struct_write(obj: _AnyStruct, wrt: Writer, value: Any, f: Field) -> None:
             if metadata.addr is not None:
                 write_kwargs['addr'] = metadata.addr
 
+            # hexmagic fields hold the decoded bytes, so write the hex constant instead.
+            if metadata.method == 'hexmagic':
+                write_args = [metadata.arg]
+
             # Write fields which were read from command parameters.
             getattr(wrt, metadata.method)(*write_args, **write_kwargs)
 
@@ -241,3 +350,280 @@ def _struct_write(obj: _AnyStruct, wrt: Writer, value: Any, f: Field) -> None:
     except Exception as e:
         import sys
         raise type(e)(f'class={cls}, field={f.name}')
+
+
+#### Compiled codecs
+
+_ENDIAN_PREFIX = {'little': '<', 'big': '>'}
+
+# Pointer/Writer methods which have a fixed-size struct.Struct equivalent.
+_STRUCT_CODES = {
+    'u8': 'B', 'u16': 'H', 'u32': 'I',
+    's8': 'b', 's16': 'h', 's32': 'i',
+}
+
+# Other fixed-size Pointer/Writer methods, and their size in bytes.
+_FIXED_SIZES = {'u24': 3, 's24': 3, 'u16be': 2}
+
+_CODECS_KEY = '_codecs'
+
+
+def _get_codec(cls: Type[_AnyStruct], endian: Optional[str]) -> '_Codec':
+    # Check cls.__dict__, not getattr(cls): subclasses (eg. YM2612Port0 of Write8as8)
+    # must not reuse their parent's codec.
+    codecs = cls.__dict__.get(_CODECS_KEY)
+    if codecs is None:
+        codecs = {}
+        setattr(cls, _CODECS_KEY, codecs)
+
+    codec = codecs.get(endian)
+    if codec is None:
+        codec = codecs[endian] = _Codec(cls, endian)
+    return codec
+
+
+class _Codec:
+    """ decode()/encode() specialized for one struct class and endianness.
+
+    Field metadata is resolved once (on first use), instead of once per field per event.
+    Runs of integer fields are merged into a single precompiled struct.Struct.
+    Events consisting only of integer and parametric fields (YM2612Port0, Wait16Bit,
+    PCMSeek...) are fixed-size, and read/write all fields with one struct call.
+    """
+
+    # Size in bytes (including command ID) if the event is fixed-size, otherwise None.
+    fixed_size: Optional[int]
+
+    # Fixed-size events only: struct codes (excluding endian), and a function
+    # returning the values to pack (command ID, then fields). Used by encode_events().
+    codes: Optional[str] = None
+    values: Callable[['EventStruct'], tuple]
+
+    def __init__(self, cls: Type[_AnyStruct], endian: Optional[str]):
+        self.cls = cls
+        self.is_event = issubclass(cls, EventStruct)
+        self.prefix = _ENDIAN_PREFIX.get(endian, '=')
+
+        self.params: List[Tuple[str, Callable[[int], int]]] = []
+        self.fields: List[Tuple[Field, FieldMeta]] = []
+
+        is_fixed = True
+        for f in fields(cls):  # type: Field
+            try:
+                metadata = _get_meta(f)
+            except KeyError:
+                raise ValueError(f'broken type {cls}: field {f.name} missing metadata')
+            if metadata is None:
+                continue
+
+            if metadata.parameterize:
+                if not getattr(cls, 'is_multiple_commands', None):
+                    raise ValueError(
+                        f'non-parametric {cls} cannot have parametric field {f.name}')
+                self.params.append((f.name, metadata.parameterize))
+            elif not _is_plain(metadata) or metadata.addr is not None:
+                is_fixed = False
+            self.fields.append((f, metadata))
+
+        self.command_of = self._compile_command()
+        if is_fixed:
+            self._compile_fixed()
+        else:
+            self.fixed_size = None
+            self._compile_general()
+
+    # Command ID
+
+    def _compile_command(self) -> Optional[Callable[[_AnyStruct], Command]]:
+        cls = self.cls
+        if not self.is_event:
+            return None
+
+        if not cls.is_multiple_commands:
+            base_command = cls.base_command
+            return lambda obj: base_command
+
+        command = getattr(cls, 'command', None)
+        if command is not None:
+            return lambda obj: obj.command()
+
+        # Invert the parametric fields, by evaluating them for every registered command.
+        names = [name for name, _ in self.params]
+        param2command = {
+            tuple(func(command - cls.base_command) for _, func in self.params): command
+            for command in cls.commands
+        }
+
+        def no_command(key: tuple):
+            return ValueError(
+                f'cannot encode {cls}: no command matches {dict(zip(names, key))}')
+
+        if len(names) == 1:
+            # Common case (Wait4Bit, PCMWriteWait): skip building tuples.
+            name, = names
+            param2command = {key: command for (key,), command in param2command.items()}
+
+            def command_of(obj: EventStruct) -> Command:
+                try:
+                    return param2command[getattr(obj, name)]
+                except KeyError:
+                    raise no_command((getattr(obj, name),))
+        else:
+            def command_of(obj: EventStruct) -> Command:
+                key = tuple(getattr(obj, name) for name in names)
+                try:
+                    return param2command[key]
+                except KeyError:
+                    raise no_command(key)
+
+        return command_of
+
+    # Fixed-size structs
+
+    def _compile_fixed(self) -> None:
+        cls = self.cls
+        plain = [(f.name, meta.method) for f, meta in self.fields if not meta.parameterize]
+        names = [name for name, _ in plain]
+        codes = ''.join(_STRUCT_CODES[method] for _, method in plain)
+
+        st = struct.Struct(self.prefix + codes)
+        self.fixed_size = int(self.is_event) + st.size
+
+        # Decode
+        if not self.params:
+            if names:
+                def decode(ptr: Pointer, command_offset: int) -> _AnyStruct:
+                    return cls(*ptr.unpack(st))
+            else:
+                def decode(ptr: Pointer, command_offset: int) -> _AnyStruct:
+                    return cls()
+
+        elif not names:
+            funcs = [func for _, func in self.params]
+            if len(funcs) == 1:
+                func, = funcs
+
+                def decode(ptr: Pointer, command_offset: int) -> _AnyStruct:
+                    return cls(func(command_offset))
+            else:
+                def decode(ptr: Pointer, command_offset: int) -> _AnyStruct:
+                    return cls(*[func(command_offset) for func in funcs])
+
+        else:
+            params = self.params
+
+            def decode(ptr: Pointer, command_offset: int) -> _AnyStruct:
+                kwargs = dict(zip(names, ptr.unpack(st)))
+                for name, func in params:
+                    kwargs[name] = func(command_offset)
+                return cls(**kwargs)
+
+        self.decode = decode
+
+        # Encode
+        command_of = self.command_of
+        if self.is_event:
+            self.codes = 'B' + codes
+            enc_st = struct.Struct(self.prefix + self.codes)
+
+            if not names:
+                def values(obj: EventStruct) -> tuple:
+                    return command_of(obj),
+            elif len(names) == 1:
+                get = attrgetter(*names)
+
+                def values(obj: EventStruct) -> tuple:
+                    return command_of(obj), get(obj)
+            else:
+                get = attrgetter(*names)
+
+                def values(obj: EventStruct) -> tuple:
+                    return (command_of(obj), *get(obj))
+
+            self.values = values
+
+            def encode(obj: _AnyStruct, wrt: Writer) -> None:
+                wrt.pack(enc_st, *values(obj))
+        else:
+            def encode(obj: _AnyStruct, wrt: Writer) -> None:
+                wrt.pack(st, *[getattr(obj, n) for n in names])
+
+        self.encode = encode
+
+    # Variable-size or fixed-address structs
+
+    def _compile_general(self) -> None:
+        cls = self.cls
+        steps: List[Callable[[Pointer, _Kwargs, int], None]] = []
+
+        # Merge consecutive integer fields into one struct.
+        run: List[Tuple[str, str]] = []
+
+        def flush_run():
+            if run:
+                steps.append(self._struct_step(list(run)))
+                run.clear()
+
+        for f, metadata in self.fields:
+            if metadata.parameterize:
+                # Does not read from ptr, so it can be reordered freely.
+                steps.append(_param_step(f.name, metadata.parameterize))
+            elif _is_plain(metadata) and metadata.addr is None:
+                run.append((f.name, _STRUCT_CODES[metadata.method]))
+            elif _is_plain(metadata):
+                flush_run()
+                steps.append(self._struct_step(
+                    [(f.name, _STRUCT_CODES[metadata.method])], metadata.addr))
+            else:
+                flush_run()
+                steps.append(_field_step(cls, f))
+        flush_run()
+
+        def decode(ptr: Pointer, command_offset: int) -> _AnyStruct:
+            kwargs: _Kwargs = {}
+            for step in steps:
+                step(ptr, kwargs, command_offset)
+            # noinspection PyArgumentList
+            return cls(**kwargs)
+
+        self.decode = decode
+
+        field_list = [f for f, _ in self.fields]
+        command_of = self.command_of
+
+        def encode(obj: _AnyStruct, wrt: Writer) -> None:
+            if command_of is not None:
+                # Write command ID.
+                wrt.u8(command_of(obj))
+
+            for f in field_list:
+                _struct_write(obj, wrt, getattr(obj, f.name), f)
+
+        self.encode = encode
+
+    def _struct_step(self, run: List[Tuple[str, str]], addr: Optional[int] = None):
+        names = [name for name, _ in run]
+        st = struct.Struct(self.prefix + ''.join(code for _, code in run))
+
+        def step(ptr: Pointer, kwargs: _Kwargs, command_offset: int) -> None:
+            kwargs.update(zip(names, ptr.unpack(st, addr)))
+        return step
+
+
+def _is_plain(metadata: FieldMeta) -> bool:
+    """ Whether a field can be read/written by struct.Struct. """
+    return (metadata.method in _STRUCT_CODES
+            and metadata.length is None
+            and metadata.arg is None)
+
+
+def _param_step(name: str, func: Callable[[int], int]):
+    def step(ptr: Pointer, kwargs: _Kwargs, command_offset: int) -> None:
+        kwargs[name] = func(command_offset)
+    return step
+
+
+def _field_step(cls: Type[_AnyStruct], f: Field):
+    def step(ptr: Pointer, kwargs: _Kwargs, command_offset: int) -> None:
+        _struct_read(cls, ptr, f, kwargs, command_offset)
+    return step
@@ -0,0 +1,184 @@
+"""
+Random access to YM2612 register state, via periodic snapshots (keyframes).
+
+Finding the register state at time t normally means replaying every write since t=0.
+Keyframes stores the full register file (2 ports x 256 registers, uint8) every
+`spacing` samples. The state at time t is then the previous keyframe,
+plus a replay of the writes since that keyframe.
+"""
+import math
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from vgmviz import vgm, ym2612, columnar
+from vgmviz.ym2612 import UnpackedEvent, NPORT, NCHAN, NOP, PARAMS
+
+REGFILE_SHAPE = (NPORT, 0x100)
+REGFILE_NBYTES = NPORT * 0x100
+
+_TimedEvents = Union['vgm.TimedEventList', columnar.EventArray]
+
+
+def register_writes(time_events: _TimedEvents) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :param time_events: TimedEvents holding YM2612Port0/YM2612Port1 or UnpackedEvent
+        (other events are ignored), or a columnar.EventArray.
+    :return: (times int64, slots intp, values uint8), where slot = port * 0x100 + reg.
+    """
+    if isinstance(time_events, np.ndarray):
+        events = columnar.keep_type(time_events, [vgm.YM2612Port0, vgm.YM2612Port1])
+        slots = events['port'].astype(np.intp) * 0x100 + events['reg']
+        return (events['time'].astype(np.int64), slots,
+                events['value'].astype(np.uint8))
+
+    times = []
+    slots = []
+    values = []
+    for time, event in time_events:
+        if isinstance(event, UnpackedEvent):
+            port, reg = ym2612._UNPACK2PORT_REG[event.unpack]
+        elif isinstance(event, (vgm.YM2612Port0, vgm.YM2612Port1)):
+            port, reg = event.port, event.reg
+        else:
+            continue
+
+        times.append(time)
+        slots.append(port * 0x100 + reg)
+        values.append(event.value)
+
+    return (np.array(times, np.int64), np.array(slots, np.intp),
+            np.array(values, np.uint8))
+
+
+class Keyframes:
+    """
+    :param time_events: See register_writes().
+    :param spacing: Samples between keyframes. None disables keyframes
+        (every lookup replays from t=0).
+    :param max_bytes: Memory budget for keyframes. If exceeded, spacing is increased.
+
+    State at time t includes writes at time t (like TimedEventIndex.state_at).
+    """
+
+    spacing: float
+    keyframes: np.ndarray  # uint8[nkeyframes, NPORT, 0x100]
+
+    def __init__(
+            self,
+            time_events: _TimedEvents,
+            spacing: Optional[int] = 44100,
+            max_bytes: Optional[int] = None,
+    ):
+        self.times, self.slots, self.values = register_writes(time_events)
+
+        duration = int(self.times[-1]) + 1 if len(self.times) else 1
+        if spacing is None:
+            spacing = math.inf
+        if max_bytes is not None:
+            max_keyframes = max(max_bytes // REGFILE_NBYTES, 1)
+            spacing = max(spacing, math.ceil(duration / max_keyframes))
+        self.spacing = spacing
+
+        self._build(duration)
+
+    def _build(self, duration: int) -> None:
+        nkeyframes = 1 if self.spacing == math.inf else -(-duration // self.spacing)
+        self.keyframes = np.zeros((nkeyframes,) + REGFILE_SHAPE, np.uint8)
+
+        # Keyframe k holds writes with time < k * spacing.
+        state = np.zeros(REGFILE_NBYTES, np.uint8)
+        begin = 0
+        for k in range(1, nkeyframes):
+            end = np.searchsorted(self.times, k * self.spacing, 'left')
+            self._apply(state, begin, end)
+            self.keyframes[k] = state.reshape(REGFILE_SHAPE)
+            begin = end
+
+    def _apply(self, state: np.ndarray, begin: int, end: int) -> None:
+        """ Apply writes [begin, end) to a flat register file. """
+        if begin == end:
+            return
+        # Fancy assignment with repeated indices has no defined order,
+        # so keep only the last write to each register.
+        slots = self.slots[begin:end][::-1]
+        values = self.values[begin:end][::-1]
+        slots, first = np.unique(slots, return_index=True)
+        state[slots] = values[first]
+
+    def __len__(self):
+        return len(self.keyframes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.keyframes.nbytes
+
+    def state_at(self, time) -> np.ndarray:
+        """ Register file uint8[NPORT, 0x100] after all writes with t_e.time <= time.
+        """
+        if time < 0:
+            return np.zeros(REGFILE_SHAPE, np.uint8)
+
+        k = min(int(time // self.spacing), len(self.keyframes) - 1)
+        state = self.keyframes[k].reshape(-1).copy()
+
+        begin = np.searchsorted(self.times, k * self.spacing, 'left') if k else 0
+        end = np.searchsorted(self.times, time, 'right')
+        self._apply(state, begin, end)
+        return state.reshape(REGFILE_SHAPE)
+
+    def params_at(self, time) -> np.ndarray:
+        """ uint8[NCHAN, NOP, len(ym2612.PARAMS)] at `time`. """
+        return ym2612.regfile_params(self.state_at(time))
+
+
+# Fixed-rate parameter frames
+
+def param_frames(
+        time_events: _TimedEvents,
+        nsamp: int,
+        fps: float = 60,
+        rate: int = 44100,
+) -> np.ndarray:
+    """ Operator parameters sampled at a fixed frame rate, for the whole song at once.
+
+    :param time_events: See register_writes().
+    :param nsamp: Song length in samples (eg. VgmHeader.nsamp).
+    :return: uint8[nframes, NCHAN, NOP, len(PARAMS)].
+        Frame k is the state at time floor(k * rate / fps), including writes at that time
+        (like Keyframes.params_at()).
+    """
+    nframes = math.ceil(nsamp * fps / rate)
+    frame_times = np.floor(np.arange(nframes) * (rate / fps)).astype(np.int64)
+    times, slots, values = register_writes(time_events)
+
+    # Only track registers used by PARAMS. col = column in `changes`.
+    param_slots = ym2612._PARAM_PORT * 0x100 + ym2612._PARAM_REG
+    used_slots = np.unique(param_slots)
+    slot2col = np.full(REGFILE_NBYTES, -1, np.intp)
+    slot2col[used_slots] = np.arange(len(used_slots))
+    ncol = len(used_slots)
+
+    cols = slot2col[slots]
+    # A write at time t is first visible in the first frame with frame_time >= t.
+    frames = np.searchsorted(frame_times, times, 'left')
+    keep = (cols >= 0) & (frames < nframes)
+
+    # Last write to each (frame, col) wins. Writes are in time order.
+    keys = (frames[keep] * ncol + cols[keep])[::-1]
+    keys, last = np.unique(keys, return_index=True)
+
+    changes = np.zeros((nframes, ncol), np.uint8)
+    changed = np.zeros((nframes, ncol), bool)
+    changes.reshape(-1)[keys] = values[keep][::-1][last]
+    changed.reshape(-1)[keys] = True
+
+    # Forward fill: each frame takes the last changed frame at or before it.
+    # (Row 0 is all zeros where unchanged, which is the initial state.)
+    source = np.where(changed, np.arange(nframes)[:, None], 0)
+    np.maximum.accumulate(source, axis=0, out=source)
+    state = changes[source, np.arange(ncol)]
+
+    out = state[:, slot2col[param_slots]]
+    assert out.shape == (nframes, NCHAN, NOP, len(PARAMS))
+    return out
@@ -0,0 +1,320 @@
+"""
+Optimizing VGM encoder.
+
+vgm.linear_from_timed() encodes every gap between events as Wait16Bit (3 bytes),
+and keeps every register write. optimize_linear() instead:
+- Encodes each gap with the fewest bytes, using Wait4Bit (0x7n, 1-16 samples),
+  Wait735 (0x62), Wait882 (0x63) and Wait16Bit (0x61).
+- Folds up to 15 samples of a gap into a preceding PCMWriteWait (0x8n), for free.
+- Drops YM2612 writes which repeat a register's current value.
+  Registers with side effects on write (KEEP_REGS) are never dropped.
+
+Consecutive waits are merged, since gaps are computed from event times.
+
+optimize_vgm() re-encodes only the VGM data of a file: the header, extra header and
+GD3 tag are kept (vgm.reencode_vgm()), with loop_addr moved to the re-encoded loop point.
+
+verify_equivalent() checks a re-encoded file against the original, by parsing both
+(columnar.parse_body) and comparing the metadata, and the register state and PCM output
+at every time.
+"""
+import dataclasses
+import functools
+from typing import Iterable, Optional, Tuple, List, Dict, NamedTuple
+
+import numpy as np
+
+from vgmviz import columnar, vgm, pcm
+from vgmviz.datastruct import EventStruct
+from vgmviz.keyframes import register_writes
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import TimedEvent, LinearEventList, VgmHeader, VgmMetadata, PureWait, \
+    PCMWriteWait, YM2612Port0, YM2612Port1, Wait4Bit, Wait16Bit, Wait735, Wait882, ENDIAN
+
+# YM2612 registers whose writes act even if the value is unchanged:
+# 0x27 (timer load/reset strobes), 0x28 (key on/off),
+# 0xA0-0xAF (writing the low byte latches the high byte written earlier).
+KEEP_REGS = frozenset([0x27, 0x28, *range(0xA0, 0xB0)])
+
+# 1-byte waits, by delay.
+_SHORT_WAITS: Dict[int, type] = {
+    **{delay: Wait4Bit for delay in range(1, 17)},
+    Wait735.delay: Wait735,
+    Wait882.delay: Wait882,
+}
+_WAIT16_MAX = 0xFFFF
+_PCM_DELAY_MAX = 15
+
+# VgmHeader fields which differ after re-encoding. verify_equivalent() compares
+# what they point to instead.
+_ADDR_FIELDS = frozenset(['nbytes', 'data_addr', 'gd3_addr', 'loop_addr', 'extra_addr'])
+
+
+class EquivalenceError(ValueError):
+    pass
+
+
+# Encoding
+
+def optimize_linear(
+        time_events: Iterable[TimedEvent],
+        nsamp: Optional[int] = None,
+        dedupe: bool = True,
+        begin: int = 0,
+) -> LinearEventList:
+    """ Optimized equivalent of vgm.linear_from_timed().
+
+    :param nsamp: Song length. If given, a wait is added after the last event
+        (linear_from_timed() ends at the last event).
+    :param dedupe: Drop redundant YM2612 writes.
+    :param begin: Time of the first output event (eg. the loop point).
+    """
+    events: LinearEventList = []
+    state: Dict[Tuple[int, int], int] = {}
+    prev_time = begin
+
+    def wait(duration: int) -> None:
+        last = events[-1] if events else None
+        if isinstance(last, PCMWriteWait):
+            fold, duration = _pcm_fold(duration)
+            events[-1] = PCMWriteWait(fold)
+        events.extend(_wait_events(duration))
+
+    for time, event in time_events:
+        if isinstance(event, PureWait):
+            continue
+
+        if dedupe:
+            if isinstance(event, (YM2612Port0, YM2612Port1)) and \
+                    event.reg not in KEEP_REGS:
+                key = (event.port, event.reg)
+                if state.get(key) == event.value:
+                    continue
+                state[key] = event.value
+            elif isinstance(event, PCMWriteWait):
+                # Writes the DAC register from the data bank.
+                state.pop((0, pcm.DacValue), None)
+
+        if time > prev_time:
+            wait(time - prev_time)
+            prev_time = time
+
+        if isinstance(event, PCMWriteWait):
+            event = PCMWriteWait(0)
+        events.append(event)
+
+    if nsamp is not None and nsamp > prev_time:
+        wait(nsamp - prev_time)
+    return events
+
+
+def _wait_events(duration: int) -> List[EventStruct]:
+    _, wait16, short = _wait_plan(duration)
+    return [Wait16Bit(delay) for delay in wait16] + [
+        _SHORT_WAITS[delay](delay) if _SHORT_WAITS[delay] is Wait4Bit
+        else _SHORT_WAITS[delay]()
+        for delay in short]
+
+
+@functools.lru_cache(maxsize=None)
+def _wait_plan(duration: int) -> Tuple[int, Tuple[int, ...], Tuple[int, ...]]:
+    """ Fewest-byte encoding of a wait (then fewest events).
+    Returns (nbytes, Wait16Bit delays, 1-byte wait delays).
+
+    Any 3 one-byte waits can be replaced by one Wait16Bit, so at most 2 are needed.
+    """
+    best = None
+    for remainder, short in _SHORT_SUMS.items():
+        rest = duration - remainder
+        if rest < 0:
+            continue
+        nwait16 = -(-rest // _WAIT16_MAX)
+        nbytes = 3 * nwait16 + len(short)
+        # Break ties by the number of events.
+        plan = (nbytes, nwait16 + len(short), rest, nwait16, short)
+        if best is None or plan < best:
+            best = plan
+
+    nbytes, _, rest, nwait16, short = best
+    wait16 = [_WAIT16_MAX] * nwait16
+    if nwait16:
+        wait16[-1] = rest - _WAIT16_MAX * (nwait16 - 1)
+    return nbytes, tuple(wait16), short
+
+
+def _short_sums() -> Dict[int, Tuple[int, ...]]:
+    """ Delays reachable with 0-2 one-byte waits -> fewest waits. """
+    out = {}
+    for a in _SHORT_WAITS:
+        for b in _SHORT_WAITS:
+            out.setdefault(a + b, (a, b))
+    for a in _SHORT_WAITS:
+        out[a] = (a,)
+    out[0] = ()
+    return out
+
+
+_SHORT_SUMS = _short_sums()
+
+
+@functools.lru_cache(maxsize=None)
+def _pcm_fold(duration: int) -> Tuple[int, int]:
+    """ Split a wait after a PCMWriteWait into (PCMWriteWait delay, remaining wait),
+    minimizing the bytes (then events) of the remaining wait. """
+    def cost(fold):
+        nbytes, wait16, short = _wait_plan(duration - fold)
+        return nbytes, len(wait16) + len(short)
+
+    fold = min(range(min(duration, _PCM_DELAY_MAX), -1, -1), key=cost)
+    return fold, duration - fold
+
+
+# Verification
+
+class OptimizeReport(NamedTuple):
+    """ Size of the VGM data (events and end-of-data command, without the header
+    and GD3 tag), and number of events, before and after optimize_vgm(). """
+    nbytes_before: int
+    nbytes_after: int
+    nevents_before: int
+    nevents_after: int
+
+    @property
+    def saved(self) -> int:
+        return self.nbytes_before - self.nbytes_after
+
+    @property
+    def ratio(self) -> float:
+        return self.nbytes_after / self.nbytes_before
+
+
+def optimize_vgm(in_path: str, out_path: str, verify: bool = True) -> OptimizeReport:
+    """ Re-encode the VGM data of a VGM/VGZ file with optimize_linear().
+    The rest of the file is kept (see vgm.reencode_vgm()).
+
+    :param verify: Parse the output back, and raise EquivalenceError if it differs
+        from the input (see verify_equivalent()).
+    """
+    data = vgm.load_vgm(in_path)
+    ptr = Pointer(data, 0, ENDIAN)
+    header = VgmHeader.decode(ptr)
+    events = vgm.parse_body(ptr, header)
+    nbytes_before = ptr.addr - header.data_addr
+    table = columnar.parse_body(ptr, header)
+
+    out_events: LinearEventList = []
+    loop_index = None
+    row = loop_time = 0
+    if header.loop_addr:
+        row = _loop_row(table, header.loop_addr)
+        if row is None:
+            raise ValueError(f'loop_addr {header.loop_addr:#x} is not at a command')
+        # Optimize the looped part separately, so none of its writes are dropped
+        # as redundant with the intro (they are not, when looping back).
+        loop_time = int(table['time'][row])
+        out_events = optimize_linear(vgm.iter_timed_from_linear(events[:row]), loop_time)
+        loop_index = len(out_events)
+    out_events += optimize_linear(vgm.iter_timed_from_linear(events[row:], loop_time),
+                                  header.nsamp, begin=loop_time)
+
+    out = vgm.reencode_vgm(data, out_events, loop_index)
+    vgm.save_vgm(out_path, out)
+
+    if verify:
+        verify_equivalent(in_path, out_path)
+    out_header = VgmHeader.decode(Pointer(out, 0, ENDIAN))
+    nbytes_after = (out_header.gd3_addr or out_header.nbytes) - out_header.data_addr
+    return OptimizeReport(nbytes_before, nbytes_after, len(events), len(out_events))
+
+
+def verify_equivalent(path: str, other_path: str) -> None:
+    """ Raise EquivalenceError unless both files have the same metadata (header fields
+    other than addresses, extra header, GD3 tag, and loop point), and produce the same
+    YM2612 register state, PCM (DAC) writes and PSG writes at every time.
+
+    The looped part must also produce the same YM2612 register state on its own,
+    so that both files stay equivalent after looping back.
+    """
+    (meta, events, ptr), (other_meta, other_events, other_ptr) = [
+        _parse(p) for p in (path, other_path)]
+
+    _check_metadata(meta, other_meta)
+    if meta.header.loop_addr:
+        rows = [_loop_row(e, m.header.loop_addr)
+                for e, m in [(events, meta), (other_events, other_meta)]]
+        if None in rows:
+            raise EquivalenceError(f'loop_addr is not at a command: {rows}')
+        loop_times = [int(e['time'][row]) for e, row in zip([events, other_events], rows)]
+        if loop_times[0] != loop_times[1]:
+            raise EquivalenceError(f'loop time differs: {loop_times[0]} != {loop_times[1]}')
+        _check_equal('YM2612 writes after loop', _effective_writes(events[rows[0]:]),
+                     _effective_writes(other_events[rows[1]:]))
+
+    _check_equal('YM2612 writes', _effective_writes(events),
+                 _effective_writes(other_events))
+    _check_equal('PCM writes', pcm.pcm_writes(ptr, events, dac=False),
+                 pcm.pcm_writes(other_ptr, other_events, dac=False))
+
+    psg, other_psg = [columnar.keep_type(e, [vgm.PSGWrite])[['time', 'value']]
+                      for e in (events, other_events)]
+    _check_equal('PSG writes', psg, other_psg)
+
+
+def _parse(path: str) -> Tuple[VgmMetadata, columnar.EventArray, Pointer]:
+    ptr = Pointer(vgm.load_vgm(path), 0, ENDIAN)
+    meta = vgm.decode_metadata(ptr)
+    return meta, columnar.parse_body(ptr, meta.header), ptr
+
+
+def _check_metadata(meta: VgmMetadata, other: VgmMetadata) -> None:
+    for field in dataclasses.fields(VgmHeader):
+        if field.name in _ADDR_FIELDS:
+            continue
+        value, other_value = getattr(meta.header, field.name), \
+            getattr(other.header, field.name)
+        if value != other_value:
+            raise EquivalenceError(f'{field.name} differs: {value} != {other_value}')
+
+    if bool(meta.header.loop_addr) != bool(other.header.loop_addr):
+        raise EquivalenceError(f'loop differs: loop_addr {meta.header.loop_addr:#x} '
+                               f'!= {other.header.loop_addr:#x}')
+    if meta.gd3 != other.gd3:
+        raise EquivalenceError(f'GD3 tag differs: {meta.gd3} != {other.gd3}')
+    if meta.extra != other.extra:
+        raise EquivalenceError(f'extra header differs: {meta.extra} != {other.extra}')
+
+
+def _loop_row(events: columnar.EventArray, loop_addr: int) -> Optional[int]:
+    """ Row of the command at loop_addr, or None if no command starts there. """
+    row = int(np.searchsorted(events['offset'], loop_addr))
+    if row < len(events) and events['offset'][row] == loop_addr:
+        return row
+    return None
+
+
+def _effective_writes(events: columnar.EventArray) -> np.ndarray:
+    """ (time, slot, value) of YM2612 writes which change a register,
+    or write a register in KEEP_REGS. """
+    times, slots, values = register_writes(events)
+
+    # Compare each write with the previous write to the same slot.
+    order = np.argsort(slots, kind='stable')
+    sorted_slots = slots[order]
+    sorted_values = values[order]
+    changed = np.ones(len(order), bool)
+    changed[1:] = (sorted_slots[1:] != sorted_slots[:-1]) | \
+                  (sorted_values[1:] != sorted_values[:-1])
+
+    keep = np.empty(len(order), bool)
+    keep[order] = changed
+    keep |= np.isin(slots & 0xFF, list(KEEP_REGS))
+    return np.stack([times[keep], slots[keep], values[keep].astype(np.int64)], axis=1)
+
+
+def _check_equal(name: str, a: np.ndarray, b: np.ndarray) -> None:
+    if len(a) != len(b):
+        raise EquivalenceError(f'{name}: {len(a)} != {len(b)}')
+    (diff,) = np.nonzero(a != b if a.ndim == 1 else (a != b).any(axis=1))
+    if len(diff):
+        i = diff[0]
+        raise EquivalenceError(f'{name}: item {i} differs: {a[i]} != {b[i]}')
@@ -0,0 +1,71 @@
+"""
+Decode a single (large) VGM body in parallel.
+
+1. columnar.parse_body() finds every command's offset and time, using the
+command-length table (no Python objects per command).
+2. The commands are split into chunks, which are decoded into TimedEvents by a
+thread pool. Each chunk is timed from the time of its first command.
+
+The output equals vgm.timed_from_linear(vgm.parse_body(ptr, header, chips)).
+
+Decoding is pure Python, so chunks only decode in parallel on free-threaded
+(no-GIL) Python builds. With the GIL, this is no faster than vgm.parse_body()
+(see bench.parallel). Worker processes are not used: pickling the decoded events
+back to the parent costs more than decoding them. For speed with the GIL,
+use columnar.parse_body().
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Iterable
+
+import numpy as np
+
+from vgmviz import columnar
+from vgmviz.datastruct import event_decoder
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import VgmHeader, TimedEventList, iter_timed_from_linear
+
+
+def parse_body_parallel(
+        ptr: Pointer,
+        header: VgmHeader,
+        workers: Optional[int] = None,
+        nchunks: Optional[int] = None,
+        chips: Optional[Iterable[str]] = None,
+) -> TimedEventList:
+    """
+    :param workers: Number of threads (None = os.cpu_count()).
+    :param nchunks: Number of chunks (default 4 per worker).
+    :param chips: See vgm.parse_body().
+    """
+    workers = workers or os.cpu_count() or 1
+    nchunks = nchunks or 4 * workers
+
+    # Phase 1: command offsets and times.
+    table = columnar.parse_body(ptr, header, chips)
+    chunks = [chunk for chunk in np.array_split(table, nchunks) if len(chunk)]
+
+    # Phase 2: decode chunks.
+    with ThreadPoolExecutor(workers) as pool:
+        results = pool.map(
+            _decode_chunk, [ptr.data] * len(chunks), chunks, [ptr.endian] * len(chunks))
+        out: TimedEventList = []
+        for time_events in results:
+            out += time_events
+    return out
+
+
+def _decode_chunk(data, chunk: columnar.EventArray, endian: str) -> TimedEventList:
+    ptr = Pointer(data, 0, endian)
+    decoders = {}
+    events = []
+
+    for offset in chunk['offset'].tolist():
+        command = ptr.u8(offset)
+        try:
+            decode, command_offset = decoders[command]
+        except KeyError:
+            decode, command_offset = decoders[command] = event_decoder(command, endian)
+        events.append(decode(ptr, command_offset))
+
+    return list(iter_timed_from_linear(events, int(chunk['time'][0])))
@@ -0,0 +1,153 @@
+"""
+Vectorized PCM (YM2612 DAC) sample stream, from columnar.parse_body() output.
+
+VGM files play PCM through three commands:
+- DataBlock (0x67) appends a block to the data bank (type 0 blocks are concatenated).
+  Writes before a block cannot read it.
+- PCMSeek (0xE0) moves the bank cursor.
+- PCMWriteWait (0x8n) writes the byte at the cursor to the DAC (register 0x2A),
+  advances the cursor by 1, and waits n samples.
+
+Replaying this needs the cursor before every write. Here, the cursor is computed for
+all writes at once: the address of the last seek, plus the number of writes since
+that seek (a cumulative sum which restarts at each seek).
+"""
+from typing import Tuple, List
+
+import numpy as np
+
+from vgmviz import columnar, vgm
+from vgmviz.columnar import EventArray
+from vgmviz.pointer import Pointer
+
+DacValue = 0x2A  # 8-bit unsigned PCM sample
+DacEnable = 0x2B  # bit 7: channel 6 plays DAC instead of FM
+
+# Value of reads past the end of the data bank (silence).
+DAC_CENTER = 0x80
+
+PCM_DTYPE = np.dtype([
+    ('time', np.int64),
+    ('value', np.uint8),
+])
+
+
+def data_bank(ptr: Pointer, events: EventArray) -> np.ndarray:
+    """ Concatenated contents of type 0 (YM2612 PCM) data blocks, as uint8. """
+    _, blocks = _bank_blocks(ptr, events)
+    if not blocks:
+        return np.zeros(0, np.uint8)
+    return np.concatenate(blocks)
+
+
+def _bank_blocks(ptr: Pointer, events: EventArray) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """ Returns (rows, blocks): the row of each type 0 data block in `events`,
+    and its contents. """
+    rows = np.flatnonzero(np.isin(events['command'],
+                                  columnar._commands_of([vgm.DataBlock])))
+    decoded = columnar.decode_rows(ptr, events[rows])
+    is_bank = np.array([block.typ == 0 for block in decoded], bool)
+    blocks = [np.frombuffer(block.file, np.uint8)
+              for block in decoded if block.typ == 0]
+    return rows[is_bank], blocks
+
+
+def pcm_cursors(events: EventArray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Returns (rows, cursors): the row of each PCMWriteWait in `events`,
+    and the data bank address it reads. """
+    commands = events['command']
+    is_seek = np.isin(commands, columnar._commands_of([vgm.PCMSeek]))
+    is_write = np.isin(commands, columnar._commands_of([vgm.PCMWriteWait]))
+
+    rows = np.flatnonzero(is_seek | is_write)
+    is_seek = is_seek[rows]
+    is_write = is_write[rows]
+
+    # Last seek at or before each row (-1 if none).
+    last_seek = np.maximum.accumulate(np.where(is_seek, np.arange(len(rows)), -1))
+    base = np.where(last_seek >= 0, events['value'][rows][last_seek], 0)
+
+    # Writes before each row, minus writes before the last seek.
+    writes_before = np.cumsum(is_write) - is_write
+    since_seek = writes_before - np.where(last_seek >= 0, writes_before[last_seek], 0)
+
+    cursors = base.astype(np.int64) + since_seek
+    return rows[is_write], cursors[is_write]
+
+
+def pcm_writes(ptr: Pointer, events: EventArray, dac: bool = True) -> np.ndarray:
+    """ Every DAC write, as a PCM_DTYPE array in file order.
+
+    :param dac: If True, include direct DacValue register writes (YM2612Port0 0x2A)
+        as well as PCMWriteWait.
+    """
+    block_rows, blocks = _bank_blocks(ptr, events)
+    bank = np.concatenate(blocks) if blocks else np.zeros(0, np.uint8)
+    rows, cursors = pcm_cursors(events)
+
+    # A write only reads blocks which come before it in the file.
+    bank_ends = np.cumsum([0] + [len(block) for block in blocks])
+    bank_size = bank_ends[np.searchsorted(block_rows, rows)]
+
+    values = np.full(len(rows), DAC_CENTER, np.uint8)
+    valid = cursors < bank_size
+    values[valid] = bank[cursors[valid]]
+
+    if dac:
+        dac_rows = np.flatnonzero(_is_port0_write(events, DacValue))
+        order = np.argsort(np.concatenate([rows, dac_rows]), kind='stable')
+        rows = np.concatenate([rows, dac_rows])[order]
+        values = np.concatenate([values, events['value'][dac_rows]])[order]
+
+    out = np.empty(len(rows), PCM_DTYPE)
+    out['time'] = events['time'][rows]
+    out['value'] = values
+    return out
+
+
+def dac_enables(events: EventArray) -> np.ndarray:
+    """ Every DacEnable write, as a PCM_DTYPE array (value is 1 if enabled). """
+    rows = np.flatnonzero(_is_port0_write(events, DacEnable))
+    out = np.empty(len(rows), PCM_DTYPE)
+    out['time'] = events['time'][rows]
+    out['value'] = events['value'][rows] >> 7
+    return out
+
+
+def _is_port0_write(events: EventArray, reg: int) -> np.ndarray:
+    return (events['command'] == vgm.YM2612Port0.base_command) & (events['reg'] == reg)
+
+
+# Per-sample DAC output
+
+def dac_levels(writes: np.ndarray, enables: np.ndarray, nsamp: int) -> np.ndarray:
+    """ DAC output for samples [0, nsamp), as (value - 128) / 128 (float32).
+    NaN while the DAC is disabled. The DAC starts disabled, at DAC_CENTER.
+
+    :param writes: PCM_DTYPE DAC writes, sorted by time (see pcm_writes()).
+    :param enables: PCM_DTYPE DacEnable writes, sorted by time (see dac_enables()).
+    """
+    value = _hold(writes, DAC_CENTER, nsamp)
+    enabled = _hold(enables, 0, nsamp).astype(bool)
+
+    out = _LEVELS[value]
+    out[~enabled] = np.nan
+    return out
+
+
+# Float level of each uint8 DAC value.
+_LEVELS = (np.arange(0x100, dtype=np.float32) - 128) / 128
+
+
+def _hold(writes: np.ndarray, initial: int, nsamp: int) -> np.ndarray:
+    """ Value of each sample in [0, nsamp): the last write at or before it.
+    Each write's value is repeated until the next write's time
+    (writes at the same time repeat 0 times, so the last one wins). """
+    values = np.append(np.uint8(initial), writes['value'])
+    bounds = np.clip(np.concatenate([[0], writes['time'], [nsamp]]), 0, nsamp)
+    return np.repeat(values, np.diff(bounds))
+
+
+def dac_stream(ptr: Pointer, events: EventArray, nsamp: int) -> np.ndarray:
+    """ See dac_levels(). """
+    return dac_levels(pcm_writes(ptr, events), dac_enables(events), nsamp)
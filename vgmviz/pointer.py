@@ -1,4 +1,6 @@
 import io
+import mmap
+import struct
 from binascii import unhexlify
 from typing import ByteString, AnyStr, IO
 
@@ -9,27 +11,44 @@ class MagicError(ValueError):
     pass
 
 
+class EndOfFileError(ValueError):
+    """ Read past the end of data (eg. a truncated file, or one still being written).
+    """
+    pass
+
+
 Endian = str
 
 
 class Pointer:
-    data: bytes
+    """ Reads from bytes, bytearray, memoryview or mmap.
+
+    bytes_() returns a slice of `data`. If `data` is a memoryview (or mmap),
+    the slice is a zero-copy memoryview into the same buffer,
+    which keeps the buffer alive (and an mmap open) as long as it is referenced.
+    """
+    data: ByteString
     addr: int
 
     def __init__(self,
-                 data: bytes,
+                 data: ByteString,
                  addr: int,
                  endian: Endian) -> None:
 
-        if not isinstance(data, ByteString):
-            raise TypeError('Pointer() requires bytes or bytearray (buffer API)')
+        if isinstance(data, mmap.mmap):
+            data = memoryview(data)
+        if isinstance(data, memoryview):
+            data = data.cast('B')
+
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError('Pointer() requires bytes, bytearray, memoryview or mmap')
 
         self.data = data
         self.endian = endian
         self.seek(addr)
 
     @classmethod
-    def create(cls, data: bytes, endian: Endian):
+    def create(cls, data: ByteString, endian: Endian):
         return cls(data,
                    addr=0,
                    endian=endian)
@@ -49,7 +68,7 @@ class Pointer:
 
     # **** READ ****
 
-    def bytes_(self, length: int, addr: int = None) -> bytes:
+    def bytes_(self, length: int, addr: int = None) -> ByteString:
         if addr is not None:
             self.addr = addr
         begin = self.addr
@@ -59,12 +78,25 @@ class Pointer:
         if length <= 0:
             raise ValueError('bytes() call, length %s (<= 0)' % length)
         if end > len(self.data):
-            raise ValueError('end of file')
+            raise EndOfFileError('end of file')
 
         # Read data and increment pointer
         self.addr = end
         return self.data[begin:end]
 
+    def unpack(self, st: struct.Struct, addr: int = None) -> tuple:
+        """ Read several fields at once, using a precompiled struct. """
+        if addr is not None:
+            self.addr = addr
+        begin = self.addr
+        end = begin + st.size
+
+        if end > len(self.data):
+            raise EndOfFileError('end of file')
+
+        self.addr = end
+        return st.unpack_from(self.data, begin)
+
     def vlq(self):
         out = 0
 
@@ -87,26 +119,39 @@ class Pointer:
 
         read = self.bytes_(len(magic), addr)
         if read != magic:
-            raise MagicError(f'Invalid magic at {pos}: read={read} expected={magic}')
+            raise MagicError(
+                f'Invalid magic at {pos}: read={bytes(read)} expected={magic}')
 
-        return read
+        # Equal to `read`, but never a memoryview.
+        return magic
 
     def hexmagic(self, hexmagic: AnyStr) -> bytes:
         return self.magic(unhexlify(hexmagic))
 
     # Integer getters
 
-    def _IntegerGetter(bits, signed):
+    def _IntegerGetter(bits, signed, endian=None):
         nbytes = bits // 8
 
         def get_integer(self: 'Pointer', addr: int = None) -> int:
             data = self.bytes_(nbytes, addr)
-            return int.from_bytes(data, self.endian, signed=signed)
+            return int.from_bytes(data, endian or self.endian, signed=signed)
 
         return get_integer
 
     # The VGM file format assumes unsigned ints.
-    u8 = _IntegerGetter(8, signed=False)
+    def u8(self, addr: int = None) -> int:
+        # Hot path (every VGM command ID). Equivalent to _IntegerGetter(8, False).
+        if addr is not None:
+            self.addr = addr
+        addr = self.addr
+
+        if addr >= len(self.data):
+            raise EndOfFileError('end of file')
+
+        self.addr = addr + 1
+        return self.data[addr]
+
     u16 = _IntegerGetter(16, signed=False)
     u24 = _IntegerGetter(24, signed=False)
     u32 = _IntegerGetter(32, signed=False)
@@ -116,6 +161,9 @@ class Pointer:
     s24 = _IntegerGetter(24, signed=True)
     s32 = _IntegerGetter(32, signed=True)
 
+    # Big-endian regardless of self.endian (eg. VGM "mmll" operands).
+    u16be = _IntegerGetter(16, signed=False, endian='big')
+
     del _IntegerGetter
 
     # 32-bit pointer offsets.
@@ -132,6 +180,13 @@ class Pointer:
         offset = self.PTR_GETTER(addr)
         return addr + offset
 
+    def nullable_offset(self, addr: int = None) -> int:
+        """ Like offset(), but an offset of 0 (eg. "no GD3 tag") reads as address 0. """
+        addr = coalesce(addr, self.addr)
+
+        offset = self.PTR_GETTER(addr)
+        return addr + offset if offset else 0
+
 
 class Writer:
     file: io.BytesIO
@@ -147,31 +202,36 @@ class Writer:
         self.file = file
         self.endian = endian
 
-        def _IntegerSetter(bits, signed):
-            nbytes = bits // 8
+    # Integer setters
 
-            def set_integer(value: int, addr: int = None) -> None:
-                try:
-                    data = value.to_bytes(nbytes, self.endian, signed=signed)
-                    self.bytes_(data, addr)
-                except Exception as e:
-                    import sys
-                    raise type(e)(f'bits={bits}, signed={signed}')
+    def _IntegerSetter(bits, signed, endian=None):
+        nbytes = bits // 8
 
+        def set_integer(self: 'Writer', value: int, addr: int = None) -> None:
+            try:
+                data = value.to_bytes(nbytes, endian or self.endian, signed=signed)
+                self.bytes_(data, addr)
+            except Exception as e:
+                import sys
+                raise type(e)(f'bits={bits}, signed={signed}')
 
-            return set_integer
+        return set_integer
 
-        self.u8 = _IntegerSetter(8, signed=False)
-        self.u16 = _IntegerSetter(16, signed=False)
-        self.u24 = _IntegerSetter(24, signed=False)
-        self.u32 = _IntegerSetter(32, signed=False)
+    u8 = _IntegerSetter(8, signed=False)
+    u16 = _IntegerSetter(16, signed=False)
+    u24 = _IntegerSetter(24, signed=False)
+    u32 = _IntegerSetter(32, signed=False)
 
-        self.s8 = _IntegerSetter(8, signed=True)
-        self.s16 = _IntegerSetter(16, signed=True)
-        self.s24 = _IntegerSetter(24, signed=True)
-        self.s32 = _IntegerSetter(32, signed=True)
+    s8 = _IntegerSetter(8, signed=True)
+    s16 = _IntegerSetter(16, signed=True)
+    s24 = _IntegerSetter(24, signed=True)
+    s32 = _IntegerSetter(32, signed=True)
 
-        self.PTR_SETTER = self.s32
+    u16be = _IntegerSetter(16, signed=False, endian='big')
+
+    del _IntegerSetter
+
+    PTR_SETTER = s32
 
     @classmethod
     def create(cls, endian: Endian):
@@ -193,6 +253,10 @@ class Writer:
 
     magic = bytes_
 
+    def pack(self, st: struct.Struct, *values) -> None:
+        """ Write several fields at once, using a precompiled struct. """
+        self.bytes_(st.pack(*values))
+
     def hexmagic(self, hexmagic: AnyStr):
         self.magic(unhexlify(hexmagic))
 
@@ -206,3 +270,85 @@ class Writer:
 
         offset = star - addr
         self.PTR_SETTER(offset, addr)
+
+    def nullable_offset(self, star: int, addr: int = None) -> None:
+        """ Like offset(), but address 0 is written as an offset of 0. """
+        addr = coalesce(addr, self.addr)
+
+        offset = star - addr if star else 0
+        self.PTR_SETTER(offset, addr)
+
+
+class BufferWriter(Writer):
+    """ Writer which appends to a preallocated bytearray, instead of a file.
+
+    Fields are written with struct.pack_into (no intermediate bytes objects).
+    Writing at an earlier `addr` (eg. header fields) patches the buffer in place.
+    flush() writes the whole buffer to a file in one call.
+    """
+    buf: bytearray
+    size: int  # Number of bytes written (high-water mark)
+
+    def __init__(self, endian: Endian, capacity: int = 0x10000) -> None:
+        super().__init__(file=None, endian=endian)
+        self.buf = bytearray(max(capacity, 1))
+        self.size = 0
+        self._addr = 0
+
+    @classmethod
+    def create(cls, endian: Endian, capacity: int = 0x10000):
+        return cls(endian, capacity)
+
+    @property
+    def addr(self):
+        return self._addr
+
+    def seek(self, addr: int):
+        if addr < 0:
+            raise ValueError(f'Invalid address {addr}')
+        self._addr = addr
+        return addr
+
+    def seek_rel(self, offset):
+        return self.seek(self._addr + offset)
+
+    def _grow(self, end: int) -> None:
+        """ Ensure the buffer can hold `end` bytes. """
+        self.buf.extend(bytes(max(end, 2 * len(self.buf)) - len(self.buf)))
+
+    # **** WRITE ****
+
+    def bytes_(self, data: bytes, addr: int = None) -> None:
+        if addr is not None:
+            self.seek(addr)
+        begin = self._addr
+        end = begin + len(data)
+
+        if end > len(self.buf):
+            self._grow(end)
+        self.buf[begin:end] = data
+
+        self._addr = end
+        if end > self.size:
+            self.size = end
+
+    magic = bytes_
+
+    def pack(self, st: struct.Struct, *values) -> None:
+        # Hot path (every fixed-size event). Same as bytes_(st.pack(*values)).
+        begin = self._addr
+        end = begin + st.size
+
+        if end > len(self.buf):
+            self._grow(end)
+        st.pack_into(self.buf, begin, *values)
+
+        self._addr = end
+        if end > self.size:
+            self.size = end
+
+    def getvalue(self) -> memoryview:
+        return memoryview(self.buf)[:self.size]
+
+    def flush(self, file: IO[bytes]) -> None:
+        file.write(self.getvalue())
@@ -0,0 +1,225 @@
+"""
+Opt-in profiling of the decode pipeline.
+
+    with profiling.Profiler() as prof:
+        vgm.parse_vgm(path)
+    print(prof.summary())  # or prof.to_dict(), prof.to_json()
+
+Records:
+- Per opcode: count, bytes, and decode time (vgm.iter_body and columnar.parse_body).
+- Per stage (eg. 'vgm.parse_body', 'ym2612.bound_ev_time'): calls and time.
+  Stages nest, and times are inclusive (a stage includes the stages it calls).
+  For generators (eg. 'ym2612.iter_ev_unpack'), time spent producing items is
+  included, which includes the time of the input iterator.
+- Peak traced memory (tracemalloc), if memory=True.
+
+When no Profiler is active, instrumented functions check one global per call,
+and vgm.iter_body checks once per opcode (not per event).
+"""
+import functools
+import json
+import time
+import tracemalloc
+from typing import Optional, Dict, Callable, TypeVar, Iterator, Any
+
+from vgmviz.datastruct import Command, cmd2event
+
+_profiler: Optional['Profiler'] = None
+
+_Func = TypeVar('_Func', bound=Callable)
+
+
+def active() -> Optional['Profiler']:
+    """ The active Profiler, or None. """
+    return _profiler
+
+
+class OpcodeStats:
+    __slots__ = ('count', 'nbytes', 'ns')
+
+    def __init__(self):
+        self.count = 0
+        self.nbytes = 0
+        self.ns = 0
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'nbytes': self.nbytes, 'ns': self.ns}
+
+
+class StageStats:
+    __slots__ = ('calls', 'ns')
+
+    def __init__(self):
+        self.calls = 0
+        self.ns = 0
+
+    def to_dict(self) -> dict:
+        return {'calls': self.calls, 'ns': self.ns}
+
+
+class Profiler:
+    """
+    :param memory: Trace peak memory with tracemalloc (slows down allocation).
+        Ignored if tracemalloc is already tracing.
+
+    Only one Profiler can be active at a time.
+    """
+
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.opcodes: Dict[Command, OpcodeStats] = {}
+        self.stages: Dict[str, StageStats] = {}
+        self.peak_memory: Optional[int] = None
+        self.ns = 0
+        self._start_ns = 0
+        self._traced = False
+
+    def __enter__(self) -> 'Profiler':
+        global _profiler
+        if _profiler is not None:
+            raise RuntimeError('a Profiler is already active')
+        _profiler = self
+
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._traced = True
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _profiler
+        self.ns += time.perf_counter_ns() - self._start_ns
+        if self._traced:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self._traced = False
+        _profiler = None
+
+    # Recording
+
+    def opcode(self, command: Command) -> OpcodeStats:
+        try:
+            return self.opcodes[command]
+        except KeyError:
+            stats = self.opcodes[command] = OpcodeStats()
+            return stats
+
+    def stage(self, name: str) -> StageStats:
+        try:
+            return self.stages[name]
+        except KeyError:
+            stats = self.stages[name] = StageStats()
+            return stats
+
+    # Output
+
+    def to_dict(self) -> dict:
+        classes: Dict[str, OpcodeStats] = {}
+        for command, stats in self.opcodes.items():
+            total = classes.setdefault(_class_name(command), OpcodeStats())
+            total.count += stats.count
+            total.nbytes += stats.nbytes
+            total.ns += stats.ns
+
+        return {
+            'ns': self.ns,
+            'peak_memory': self.peak_memory,
+            'stages': {name: s.to_dict() for name, s in self.stages.items()},
+            'opcodes': {f'{command:#04x}': dict(s.to_dict(), cls=_class_name(command))
+                        for command, s in sorted(self.opcodes.items())},
+            'classes': {name: s.to_dict() for name, s in classes.items()},
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def summary(self) -> str:
+        """ Table of stages and event classes, slowest first. """
+        d = self.to_dict()
+        lines = [f'total {d["ns"] / 1e6:.1f} ms']
+        if self.peak_memory is not None:
+            lines[0] += f', peak memory {self.peak_memory / 1e6:.1f} MB'
+
+        lines += ['', f'{"stage":<32} {"calls":>10} {"ms":>10}']
+        for name, s in sorted(d['stages'].items(), key=lambda kv: -kv[1]['ns']):
+            lines.append(f'{name:<32} {s["calls"]:>10} {s["ns"] / 1e6:>10.1f}')
+
+        lines += ['', f'{"event class":<32} {"count":>10} {"bytes":>10} {"ms":>10}']
+        for name, s in sorted(d['classes'].items(), key=lambda kv: -kv[1]['ns']):
+            lines.append(f'{name:<32} {s["count"]:>10} {s["nbytes"]:>10} '
+                         f'{s["ns"] / 1e6:>10.1f}')
+        return '\n'.join(lines)
+
+
+def _class_name(command: Command) -> str:
+    cls = cmd2event.get(command)
+    return cls.__name__ if cls is not None else f'unknown {command:#04x}'
+
+
+# Instrumentation hooks
+
+def timed(name: str) -> Callable[[_Func], _Func]:
+    """ Decorator recording calls to a function as stage `name`. """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            prof = _profiler
+            if prof is None:
+                return func(*args, **kwargs)
+
+            stats = prof.stage(name)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.calls += 1
+                stats.ns += time.perf_counter_ns() - start
+        return wrapper
+    return decorator
+
+
+def timed_iter(name: str) -> Callable[[_Func], _Func]:
+    """ Decorator recording time spent in a generator function as stage `name`.
+    Each call counts once, and each next() adds to its time. """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            it = func(*args, **kwargs)
+            prof = _profiler
+            if prof is None:
+                return it
+            return _timed_iter(prof.stage(name), it)
+        return wrapper
+    return decorator
+
+
+def _timed_iter(stats: StageStats, it: Iterator) -> Iterator:
+    stats.calls += 1
+    perf_counter_ns = time.perf_counter_ns
+    while True:
+        start = perf_counter_ns()
+        try:
+            item = next(it)
+        except StopIteration:
+            stats.ns += perf_counter_ns() - start
+            return
+        stats.ns += perf_counter_ns() - start
+        yield item
+
+
+def wrap_decoder(command: Command, decode: Callable) -> Callable:
+    """ Wrap a decoder from datastruct.event_decoder(), to record opcode stats.
+    The ptr passed to decode() points after the command ID. """
+    stats = _profiler.opcode(command)
+    perf_counter_ns = time.perf_counter_ns
+
+    def profiled_decode(ptr, command_offset: int) -> Any:
+        addr = ptr.addr
+        start = perf_counter_ns()
+        event = decode(ptr, command_offset)
+        stats.ns += perf_counter_ns() - start
+        stats.count += 1
+        stats.nbytes += ptr.addr - addr + 1
+        return event
+
+    return profiled_decode
@@ -0,0 +1,388 @@
+"""
+HTTP service: parse uploaded VGM files, and serve their timelines as JSON.
+
+python -m vgmviz serve [--host HOST] [--port PORT] [--max-songs N]
+
+Each endpoint takes a VGM/VGZ file as the POST body, or a previously uploaded file
+as GET ?key=<sha256 of the file>:
+
+POST /parse     Header, GD3 tag and event counts (JSON).
+POST /timeline  Events as JSON lines: {"time", "type", <fields>...}.
+                ?begin=&end= (samples) keep events with begin <= time < end.
+                ?type=YM2612Port0 (repeatable) keeps events of these classes.
+                Blob fields (eg. DataBlock.file) are replaced by <name>_nbytes,
+                and magic fields are omitted.
+POST /state     YM2612 register writes in [begin, end), preceded by the state at begin
+                and followed by the state at end (ym2612.bound_ev_time()).
+                JSON lines: {"time", "chan", "op", "param", "value"}.
+POST /frames    YM2612 operator parameters at ?fps= (keyframes.param_frames()).
+                The first JSON line describes the frames, then one line per frame.
+GET  /stats     Cache statistics.
+
+Line-based responses are streamed (Transfer-Encoding: chunked).
+
+Parsed files are kept in an in-memory LRU cache (SongCache), keyed by the file's
+SHA-256. Concurrent requests for a file which is being parsed wait for that parse,
+instead of parsing it again.
+"""
+import dataclasses
+import functools
+import gzip
+import hashlib
+import itertools
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Iterator, Dict, List, Callable
+from urllib.parse import urlsplit, parse_qs
+
+from vgmviz import vgm, ym2612
+from vgmviz.keyframes import param_frames
+from vgmviz.pointer import Pointer
+from vgmviz.vgm import VgmHeader, Gd3Tag, LinearEventList, TimedEventList, ENDIAN
+
+DEFAULT_PORT = 8000
+DEFAULT_MAX_SONGS = 8
+MAX_UPLOAD_BYTES = 0x4000000  # 64 MiB
+
+_CHUNK_SIZE = 0x10000  # Bytes per chunk of a streamed response
+
+
+# Parsed files
+
+class Song:
+    """ A parsed VGM file. """
+
+    def __init__(self, key: str, data: bytes):
+        """ :param key: SHA-256 of `data` (see song_key()). """
+        if data.startswith(vgm.GZIP_MAGIC):
+            data = gzip.decompress(data)
+        ptr = Pointer(data, 0, ENDIAN)
+
+        self.key = key
+        self.header: VgmHeader
+        self.gd3: Optional[Gd3Tag]
+        self.header, self.gd3, _ = vgm.decode_metadata(ptr)
+        self.events: LinearEventList = vgm.parse_body(ptr, self.header)
+        self.time_events: TimedEventList = vgm.timed_from_linear(self.events)
+
+    @functools.cached_property
+    def ym2612_writes(self) -> TimedEventList:
+        return vgm.keep_type(self.time_events, [vgm.YM2612Port0, vgm.YM2612Port1])
+
+    @functools.cached_property
+    def ym2612_index(self) -> ym2612.TimedEventIndex:
+        unpacked = vgm.keep_type(
+            vgm.map_ev(self.ym2612_writes, ym2612.ev_unpack), [ym2612.UnpackedEvent])
+        return ym2612.TimedEventIndex(unpacked)
+
+
+def song_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class SongCache:
+    """ LRU cache of parsed Songs, which parses each file once at a time.
+    Thread-safe. """
+
+    def __init__(self, max_songs: int = DEFAULT_MAX_SONGS,
+                 parse: Callable[[str, bytes], Song] = Song):
+        self.max_songs = max_songs
+        self.parse = parse
+        self._lock = threading.Lock()
+        self._songs: 'OrderedDict[str, Song]' = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+
+        self.hits = 0
+        self.misses = 0  # Parses
+        self.coalesced = 0  # Requests which waited for another request's parse
+
+    def get(self, key: str) -> Optional[Song]:
+        with self._lock:
+            song = self._songs.get(key)
+            if song is not None:
+                self._songs.move_to_end(key)
+                self.hits += 1
+            return song
+
+    def get_or_parse(self, data: bytes) -> Song:
+        """ Raises the parse error (to every waiting request) if parsing fails.
+        Failed parses are not cached. """
+        key = song_key(data)
+        with self._lock:
+            song = self._songs.get(key)
+            if song is not None:
+                self._songs.move_to_end(key)
+                self.hits += 1
+                return song
+
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            song = self.parse(key, data)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._songs[key] = song
+            while len(self._songs) > self.max_songs:
+                self._songs.popitem(last=False)
+            del self._pending[key]
+        future.set_result(song)
+        return song
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(songs=len(self._songs), parsing=len(self._pending),
+                        hits=self.hits, misses=self.misses, coalesced=self.coalesced)
+
+
+# JSON encoding
+
+_BLOB_TYPES = (bytes, bytearray, memoryview)
+
+
+def header_json(header: VgmHeader) -> dict:
+    return {name: value for name, value in dataclasses.asdict(header).items()
+            if name != 'magic'}
+
+
+def event_json(time: int, event) -> dict:
+    out = {'time': time, 'type': type(event).__name__}
+    for f in dataclasses.fields(event):
+        if f.name == 'magic':
+            continue
+        value = getattr(event, f.name)
+        if isinstance(value, _BLOB_TYPES):
+            out[f'{f.name}_nbytes'] = len(value)
+        else:
+            out[f.name] = value
+    return out
+
+
+def state_json(time: int, event: ym2612.UnpackedEvent) -> dict:
+    reg = event.unpack
+    return dict(time=time, chan=reg.chan, op=reg.op, param=reg.param, value=event.value)
+
+
+# HTTP
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# Invalid VGM/VGZ files, or unsupported commands.
+_PARSE_ERRORS = (ValueError, NotImplementedError, EOFError, gzip.BadGzipFile, zlib.error)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Needed for chunked responses
+    server: 'VgmServer'
+
+    def do_GET(self):
+        self._handle(post=False)
+
+    def do_POST(self):
+        self._handle(post=True)
+
+    def _handle(self, post: bool) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        try:
+            # Always read the upload, so the connection can be reused after errors.
+            data = self._read_upload() if post else None
+
+            if url.path == '/stats' and not post:
+                self._send_json(self.server.songs.stats())
+                return
+
+            endpoint = _ENDPOINTS.get(url.path)
+            if endpoint is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f'no endpoint {url.path}')
+            song = self._song(data, query)
+            out = endpoint(song, query)
+        except HTTPError as e:
+            self._send_error(e.status, str(e))
+            return
+        except _PARSE_ERRORS as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, f'{type(e).__name__}: {e}')
+            return
+
+        if isinstance(out, dict):
+            self._send_json(out)
+        else:
+            self._send_lines(out)
+
+    def _read_upload(self) -> bytes:
+        nbytes = int(self.headers.get('Content-Length', 0))
+        if nbytes > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            f'upload exceeds {MAX_UPLOAD_BYTES} bytes')
+        return self.rfile.read(nbytes)
+
+    def _song(self, data: Optional[bytes], query: Dict[str, List[str]]) -> Song:
+        if data is not None:
+            if not data:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, 'empty upload')
+            return self.server.songs.get_or_parse(data)
+
+        key = _query_arg(query, 'key', str)
+        if key is None:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'GET requires ?key=')
+        song = self.server.songs.get(key)
+        if song is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f'no song {key} (upload it with POST)')
+        return song
+
+    # Responses
+
+    def _send_json(self, obj, status: HTTPStatus = HTTPStatus.OK) -> None:
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: HTTPStatus, message: str) -> None:
+        self._send_json({'error': message}, status)
+
+    def _send_lines(self, lines: Iterator[dict]) -> None:
+        """ Stream JSON lines, as chunks of about _CHUNK_SIZE bytes. """
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        buf = []
+        nbytes = 0
+        for line in lines:
+            data = (json.dumps(line) + '\n').encode()
+            buf.append(data)
+            nbytes += len(data)
+            if nbytes >= _CHUNK_SIZE:
+                self._write_chunk(b''.join(buf))
+                buf.clear()
+                nbytes = 0
+        if buf:
+            self._write_chunk(b''.join(buf))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b'%X\r\n%s\r\n' % (len(data), data))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def _query_arg(query: Dict[str, List[str]], name: str, type_, default=None):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return type_(values[-1])
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f'invalid {name}={values[-1]!r}')
+
+
+def _window(query: Dict[str, List[str]]):
+    return _query_arg(query, 'begin', int, 0), _query_arg(query, 'end', int, None)
+
+
+# Endpoints: (song, query) -> JSON object, or iterator of JSON lines.
+# Arguments are checked before returning, since errors can't be sent once streaming.
+
+def _parse(song: Song, query) -> dict:
+    return dict(
+        key=song.key,
+        header=header_json(song.header),
+        gd3=song.gd3 and dataclasses.asdict(song.gd3),
+        chips=sorted(song.header.chips()),
+        nevents=len(song.events),
+        ntimed=len(song.time_events),
+    )
+
+
+def _timeline(song: Song, query) -> Iterator[dict]:
+    begin, end = _window(query)
+    time_events = song.time_events
+
+    names = query.get('type')
+    if names:
+        classes = {cls.__name__: cls for cls in vgm.cmd2event.values()}
+        unknown = [name for name in names if name not in classes]
+        if unknown:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'unknown event types {unknown}')
+        time_events = vgm.iter_keep_type(time_events, [classes[name] for name in names])
+
+    return (event_json(time, event) for time, event in vgm.iter_filter_ev_time(
+        time_events, begin, float('inf') if end is None else end))
+
+
+def _state(song: Song, query) -> Iterator[dict]:
+    begin, end = _window(query)
+    index = song.ym2612_index
+    if not len(index):
+        return iter([])
+    events = index.bound_ev_time(begin, float('inf') if end is None else end)
+    return (state_json(time, event) for time, event in events)
+
+
+def _frames(song: Song, query) -> Iterator[dict]:
+    fps = _query_arg(query, 'fps', float, 60.)
+    if not fps > 0:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f'invalid fps={fps}')
+    frames = param_frames(song.ym2612_writes, song.header.nsamp, fps)
+
+    info = dict(fps=fps, params=list(ym2612.PARAMS), shape=list(frames.shape))
+    return itertools.chain([info], (frame.tolist() for frame in frames))
+
+
+_ENDPOINTS = {
+    '/parse': _parse,
+    '/timeline': _timeline,
+    '/state': _state,
+    '/frames': _frames,
+}
+
+
+class VgmServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', DEFAULT_PORT),
+                 songs: SongCache = None, verbose: bool = False):
+        """ :param address: (host, port). Port 0 picks a free port (see server_port).
+        """
+        super().__init__(address, Handler)
+        self.songs = songs if songs is not None else SongCache()
+        self.verbose = verbose
+
+
+def serve(host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+          max_songs: int = DEFAULT_MAX_SONGS) -> None:
+    with VgmServer((host, port), SongCache(max_songs), verbose=True) as server:
+        print(f'Serving on http://{host}:{server.server_port}/', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,423 @@
+"""
+YM2612 FM synthesis (NumPy), for oscilloscope-style visualization.
+
+Audio is rendered block-wise. Between two register writes, each operator's phase
+and envelope are closed-form functions of time, so a block is computed with array
+operations over all its samples, instead of one sample at a time.
+
+This is not a cycle-accurate emulator. Approximations:
+- Envelopes change at the average rate of the chip's envelope generator,
+  instead of in its stepped increments. SSG-EG is not emulated.
+- Operator 1 feedback depends on its previous 2 output samples, which cannot be
+  vectorized. It is solved by fixed-point iteration over the block
+  (fb_iterations passes; the first k samples are exact after k passes).
+- Modulation uses the current sample of each modulator (the chip delays some
+  connections by 1 sample).
+- LFO (AM/PM), channel 3 special mode, and stereo panning are not emulated.
+- DAC (PCM) writes are rendered separately from FM, so that PCM playback
+  (a write every few samples) does not split FM blocks.
+"""
+import math
+from typing import List, Tuple, Optional
+
+import numpy as np
+
+from vgmviz import vgm, pcm
+from vgmviz.pcm import DacValue, DacEnable, DAC_CENTER, PCM_DTYPE
+from vgmviz.vgm import YM2612Port0, YM2612Port1
+from vgmviz.ym2612 import NCHAN, NOP, DetHarm, Atten, TrebAttack, AMDecay1, Decay2, \
+    KneeRelease, FeedbackAlgo, FnumLo, FnumHiBlock, KeyOn
+
+# Output rate of VGM files.
+RATE = 44100
+
+# The chip's sample rate is clock / 144.
+_CHIP_DIVIDER = 144
+
+# Attenuation is 10 bits, in units of 96/1024 dB. ATT_MAX is silent.
+ATT_MAX = 1023
+_DB_PER_ATT = 96 / 1024
+
+# Modulator output (1.0 = full scale) -> phase offset of the modulated operator, in cycles.
+_MOD_CYCLES = 4.0
+
+# fnum bits 10-7 -> low 2 bits of key code.
+_FN_NOTE = (0, 0, 0, 0, 0, 0, 0, 1, 2, 3, 3, 3, 3, 3, 3, 3)
+
+# Detune phase increment, by [detune & 3][key code]. From MAME (fm.c dt_tab).
+DT_TABLE = np.array([
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+     0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2,
+     2, 3, 3, 3, 4, 4, 4, 5, 5, 6, 6, 7, 8, 8, 8, 8],
+    [1, 1, 1, 1, 2, 2, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5,
+     5, 6, 6, 7, 8, 8, 9, 10, 11, 12, 13, 14, 16, 16, 16, 16],
+    [2, 2, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 6, 6, 7,
+     8, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 20, 22, 22, 22, 22],
+], np.int64)
+
+# Operators are numbered S1-S4 in the algorithm diagrams, but registers are ordered
+# S1, S3, S2, S4 (Register.op). _SLOT_OPS[slot] = Register.op.
+_SLOT_OPS = (0, 2, 1, 3)
+
+# Per algorithm: (modulators of each slot, output slots).
+ALGORITHMS: List[Tuple[Tuple[Tuple[int, ...], ...], Tuple[int, ...]]] = [
+    (((), (0,), (1,), (2,)), (3,)),  # S1 -> S2 -> S3 -> S4
+    (((), (), (0, 1), (2,)), (3,)),  # (S1 + S2) -> S3 -> S4
+    (((), (), (1,), (0, 2)), (3,)),  # (S1 + (S2 -> S3)) -> S4
+    (((), (0,), (), (1, 2)), (3,)),  # ((S1 -> S2) + S3) -> S4
+    (((), (0,), (), (2,)), (1, 3)),  # (S1 -> S2) + (S3 -> S4)
+    (((), (0,), (0,), (0,)), (1, 2, 3)),  # S1 -> (S2 + S3 + S4)
+    (((), (0,), (), ()), (1, 2, 3)),  # (S1 -> S2) + S3 + S4
+    (((), (), (), ()), (0, 1, 2, 3)),  # S1 + S2 + S3 + S4
+]
+
+# Envelope stages
+ATTACK, DECAY1, DECAY2, RELEASE, OFF = range(5)
+
+
+def rate_speed(rate: int) -> float:
+    """ Effective envelope rate (0-63) -> attenuation units per chip sample.
+
+    The chip updates the envelope every 3 samples, once every 2**(11 - rate//4)
+    updates (for rate < 48), by 0.5-0.875 units depending on rate % 4
+    (and by multiples of these for rate >= 48).
+    """
+    if rate <= 0:
+        return 0.0
+    return (4 + (rate & 3)) * 2.0 ** ((rate >> 2) - 11) / 24
+
+
+class YM2612Synth:
+    """
+    :param clock: YM2612 clock (VgmHeader.ym2612_clock).
+    :param rate: Output sample rate. VGM times are at 44100 Hz.
+    :param fb_iterations: Fixed-point iterations for operator 1 feedback.
+    :param block_size: Maximum samples rendered at once.
+    """
+
+    def __init__(
+            self,
+            clock: int = vgm.YM2612_CLOCK,
+            rate: int = RATE,
+            fb_iterations: int = 4,
+            block_size: int = 4096,
+    ):
+        self.clock = clock
+        self.rate = rate
+        self.fb_iterations = fb_iterations
+        self.block_size = block_size
+
+        # Chip samples per output sample.
+        self._chip_ratio = clock / _CHIP_DIVIDER / rate
+        self.reset()
+
+    def reset(self) -> None:
+        self.regs = np.zeros((2, 0x100), np.uint8)
+        self.fnum = [0] * NCHAN
+        self.block = [0] * NCHAN
+        self._fnum_latch = [0] * NCHAN
+
+        # Indexed by [chan][Register.op]
+        self.phase = np.zeros((NCHAN, NOP))  # cycles
+        self.att = np.full((NCHAN, NOP), float(ATT_MAX))
+        self.stage = np.full((NCHAN, NOP), OFF, np.int8)
+        self.fb_history = np.zeros((NCHAN, 2))  # S1 outputs at t-2, t-1
+
+    # Rendering
+
+    def render(self, time_events: 'vgm.TimedEventList', nsamp: int,
+               dac: Optional[np.ndarray] = None) -> np.ndarray:
+        """ Render samples [0, nsamp) of a timed event list.
+        Returns float32[NCHAN, nsamp], where 1.0 is one operator at full scale.
+        Channel index 5 plays the DAC while it is enabled.
+
+        :param dac: Precomputed DAC output (eg. pcm.dac_stream()). If given,
+            PCM events in `time_events` are skipped instead of replayed.
+
+        Starts from the chip's reset state (see reset()).
+        """
+        self.reset()
+        out = np.zeros((NCHAN, nsamp), np.float32)
+
+        writes = []
+        dac_events = []
+        for t_e in time_events:
+            if t_e.time >= nsamp:
+                break
+            e = t_e.event
+            if isinstance(e, (YM2612Port0, YM2612Port1)) and not (
+                    e.port == 0 and e.reg in (DacValue, DacEnable)):
+                writes.append((t_e.time, e.port, e.reg, e.value))
+            elif dac is None:
+                dac_events.append(t_e)
+
+        # FM: render up to each write time, then apply writes.
+        time = 0
+        for write_time, port, reg, value in writes:
+            if write_time > time:
+                self._render_fm(out, time, min(write_time, nsamp))
+                time = write_time
+                if time >= nsamp:
+                    break
+            self.write(port, reg, value)
+        if time < nsamp:
+            self._render_fm(out, time, nsamp)
+
+        # DAC
+        if dac is None:
+            dac = dac_stream(dac_events, nsamp)
+        enabled = ~np.isnan(dac)
+        out[5][enabled] = dac[enabled]
+        return out
+
+    def _render_fm(self, out: np.ndarray, begin: int, end: int) -> None:
+        for block_begin in range(begin, end, self.block_size):
+            block_end = min(block_begin + self.block_size, end)
+            for chan in range(NCHAN):
+                self._render_channel(chan, out[chan, block_begin:block_end])
+
+    def _render_channel(self, chan: int, out: np.ndarray) -> None:
+        n = len(out)
+        if (self.stage[chan] == OFF).all():
+            return
+
+        port, reg_chan = divmod(chan, 3)
+        regs = self.regs[port]
+        feedback_algo = int(regs[FeedbackAlgo + reg_chan])
+        modulators, carriers = ALGORITHMS[feedback_algo & 7]
+        feedback = (feedback_algo >> 3) & 7
+
+        t = np.arange(n)
+        slot_out = [None] * 4
+        for slot, op in enumerate(_SLOT_OPS):
+            reg = reg_chan + 4 * op
+            inc = self._phase_inc(chan, int(regs[DetHarm + reg]))
+            phase = self.phase[chan, op] + inc * t
+            self.phase[chan, op] = (self.phase[chan, op] + inc * n) % 1.0
+
+            env = self._envelope(chan, op, n, regs, reg)
+            att = env + (int(regs[Atten + reg]) & 0x7F) * 8
+            gain = np.where(att < ATT_MAX, 10.0 ** (att * (-_DB_PER_ATT / 20)), 0.0)
+
+            if slot == 0 and feedback:
+                slot_out[slot] = self._feedback(chan, phase, gain, feedback)
+                continue
+
+            if modulators[slot]:
+                phase = phase + _MOD_CYCLES * sum(slot_out[m] for m in modulators[slot])
+            slot_out[slot] = np.sin(2 * np.pi * phase) * gain
+
+        if not feedback:
+            self.fb_history[chan] = _last2(self.fb_history[chan], slot_out[0])
+
+        out += np.clip(sum(slot_out[s] for s in carriers), -1, 1)
+
+    def _feedback(self, chan: int, phase: np.ndarray, gain: np.ndarray, feedback: int) \
+            -> np.ndarray:
+        """ S1 output, where S1 is modulated by its previous 2 outputs. """
+        n = len(phase)
+        scale = 2.0 ** (feedback - 7)  # (out[t-1] + out[t-2]) -> cycles
+        history = self.fb_history[chan]
+
+        y = np.sin(2 * np.pi * phase) * gain
+        prev = np.empty(n + 2)
+        prev[:2] = history
+        for _ in range(self.fb_iterations):
+            prev[2:] = y
+            y = np.sin(2 * np.pi * (phase + scale * (prev[1:-1] + prev[:-2]))) * gain
+
+        self.fb_history[chan] = _last2(history, y)
+        return y
+
+    def _phase_inc(self, chan: int, det_harm: int) -> float:
+        """ Phase increment in cycles per output sample. """
+        fnum = self.fnum[chan]
+        block = self.block[chan]
+        key_code = (block << 2) | _FN_NOTE[fnum >> 7]
+
+        detune = (det_harm >> 4) & 7
+        dt = int(DT_TABLE[detune & 3, key_code])
+        if detune & 4:
+            dt = -dt
+
+        inc = (((fnum << block) >> 1) + dt) & 0x1FFFF
+        multiple = det_harm & 0x0F
+        inc = inc * multiple if multiple else inc / 2
+        return inc / (1 << 20) * self._chip_ratio
+
+    # Envelope generator
+
+    def _rates(self, chan: int, regs: np.ndarray, reg: int) -> Tuple[float, ...]:
+        """ (attack, decay1, decay2, release) speeds in units per output sample. """
+        key_code = (self.block[chan] << 2) | _FN_NOTE[self.fnum[chan] >> 7]
+        treb_attack = int(regs[TrebAttack + reg])
+        key_scale = key_code >> (3 - (treb_attack >> 6))
+
+        def speed(rate: int) -> float:
+            if rate == 0:
+                return 0.0
+            return rate_speed(min(2 * rate + key_scale, 63)) * self._chip_ratio
+
+        attack = treb_attack & 0x1F
+        if attack and 2 * attack + key_scale >= 62:
+            attack_speed = math.inf
+        else:
+            attack_speed = speed(attack)
+
+        return (
+            attack_speed,
+            speed(int(regs[AMDecay1 + reg]) & 0x1F),
+            speed(int(regs[Decay2 + reg]) & 0x1F),
+            speed((int(regs[KneeRelease + reg]) & 0x0F) * 2 + 1),
+        )
+
+    def _envelope(self, chan: int, op: int, n: int, regs: np.ndarray, reg: int) \
+            -> np.ndarray:
+        """ Envelope attenuation for the next n samples (and advance the envelope). """
+        stage = int(self.stage[chan, op])
+        att = float(self.att[chan, op])
+        if stage == OFF:
+            return np.full(n, float(ATT_MAX))
+
+        attack, decay1, decay2, release = self._rates(chan, regs, reg)
+        knee = int(regs[KneeRelease + reg]) >> 4
+        sustain = 992 if knee == 15 else knee * 32
+
+        out = np.empty(n)
+        pos = 0
+        while pos < n:
+            remaining = n - pos
+            t = None
+
+            if stage == ATTACK:
+                # att += -(att + 1) * speed / 16 per sample.
+                if attack == math.inf or att <= 0:
+                    att = 0.0
+                    stage = DECAY1
+                    continue
+                a = attack / 16
+                if a == 0:
+                    out[pos:] = att
+                    break
+                length = min(remaining, math.ceil(math.log(att + 1) / a))
+                t = np.arange(length)
+                out[pos:pos + length] = (att + 1) * np.exp(-a * t) - 1
+                att = (att + 1) * math.exp(-a * length) - 1
+                if att <= 0:
+                    att = 0.0
+                    stage = DECAY1
+
+            elif stage in (DECAY1, DECAY2, RELEASE):
+                # Linear increase up to `target`.
+                speed, target = {
+                    DECAY1: (decay1, sustain),
+                    DECAY2: (decay2, ATT_MAX),
+                    RELEASE: (release, ATT_MAX),
+                }[stage]
+                if att >= target or speed == 0:
+                    if att >= target and stage == DECAY1:
+                        stage = DECAY2
+                        continue
+                    if att >= target and stage == RELEASE:
+                        stage = OFF
+                    out[pos:] = min(att, ATT_MAX)
+                    break
+                length = min(remaining, math.ceil((target - att) / speed))
+                t = np.arange(length)
+                out[pos:pos + length] = att + speed * t
+                att = min(att + speed * length, target)
+
+            else:  # OFF
+                out[pos:] = ATT_MAX
+                break
+
+            pos += len(t)
+
+        if stage == RELEASE and att >= ATT_MAX:
+            stage = OFF
+        self.stage[chan, op] = stage
+        self.att[chan, op] = att
+        return np.minimum(out, ATT_MAX)
+
+    # Register writes
+
+    def write(self, port: int, reg: int, value: int) -> None:
+        self.regs[port, reg] = value
+
+        if port == 0 and reg == KeyOn:
+            chan = value & 7
+            if chan & 3 == 3:
+                return
+            chan = chan - 1 if chan >= 4 else chan
+            for slot, op in enumerate(_SLOT_OPS):
+                self._key(chan, op, bool(value & (0x10 << slot)))
+            return
+
+        if reg & 3 == 3:
+            return
+        chan = (reg & 3) + 3 * port
+        if reg & ~3 == FnumHiBlock:
+            self._fnum_latch[chan] = value
+        elif reg & ~3 == FnumLo:
+            latch = self._fnum_latch[chan]
+            self.fnum[chan] = ((latch & 0x07) << 8) | value
+            self.block[chan] = (latch >> 3) & 0x07
+
+    def _key(self, chan: int, op: int, on: bool) -> None:
+        stage = self.stage[chan, op]
+        is_on = stage in (ATTACK, DECAY1, DECAY2)
+        if on and not is_on:
+            self.stage[chan, op] = ATTACK
+            self.phase[chan, op] = 0.0
+        elif not on and is_on:
+            self.stage[chan, op] = RELEASE
+
+
+def _last2(history: np.ndarray, y: Optional[np.ndarray]) -> np.ndarray:
+    """ The last 2 samples of (history, y). """
+    if y is None:
+        return history
+    return np.concatenate([history, y])[-2:]
+
+
+# DAC
+
+def dac_stream(time_events: 'vgm.TimedEventList', nsamp: int) -> np.ndarray:
+    """ DAC output for samples [0, nsamp), as (value - 128) / 128.
+    NaN while the DAC is disabled.
+
+    Handles DataBlock (the PCM data bank), PCMSeek, PCMWriteWait
+    and direct DacValue/DacEnable writes. Other events are ignored.
+    (pcm.dac_stream() computes the same from a columnar EventArray, without a loop.)
+    """
+    bank = bytearray()
+    pos = 0
+    writes = []
+    enables = []
+
+    for time, e in time_events:
+        if time >= nsamp:
+            break
+        if isinstance(e, vgm.PCMWriteWait):
+            writes.append((time, bank[pos] if pos < len(bank) else DAC_CENTER))
+            pos += 1
+        elif isinstance(e, YM2612Port0):
+            if e.reg == DacValue:
+                writes.append((time, e.value))
+            elif e.reg == DacEnable:
+                enables.append((time, e.value >> 7))
+        elif isinstance(e, vgm.PCMSeek):
+            pos = e.address
+        elif isinstance(e, vgm.DataBlock) and e.typ == 0:
+            bank += e.file
+
+    return pcm.dac_levels(
+        np.array(writes, PCM_DTYPE), np.array(enables, PCM_DTYPE), nsamp)
+
+
+def render(time_events: 'vgm.TimedEventList', nsamp: int,
+           clock: int = vgm.YM2612_CLOCK, dac: Optional[np.ndarray] = None,
+           **kwargs) -> np.ndarray:
+    """ See YM2612Synth.render(). """
+    return YM2612Synth(clock, **kwargs).render(time_events, nsamp, dac)
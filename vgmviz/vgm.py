@@ -1,12 +1,23 @@
+import bisect
 import copy
-from typing import Any, List, Callable, Type, TypeVar, Tuple, NamedTuple
+import gzip
+import itertools
+import math
+import mmap as _mmap
+import struct
+import zlib
+from array import array
+from typing import Any, List, Callable, Type, TypeVar, Tuple, NamedTuple, Dict, \
+    ClassVar, ByteString, Iterator, Iterable, Optional, IO, AbstractSet, FrozenSet, \
+    Sequence, Union
 
 import dataclasses
-from dataclasses import dataclass
+from dataclasses import dataclass, Field
 
 from vgmviz.datastruct import DataStruct, EventStruct, cmd2event, register_cmd2event, \
-    meta
-from vgmviz.pointer import Pointer, Writer
+    meta, event_decoder, event_layout, encode_events, event_dataclass, Command
+from vgmviz import profiling
+from vgmviz.pointer import Pointer, Writer, BufferWriter, EndOfFileError
 
 
 T = TypeVar('T', bound='Event')
@@ -24,17 +35,126 @@ EVENT_TERMINATOR = 0x66
 
 # Parse VGM
 
-def parse_vgm(path: str) -> Tuple['VgmHeader', LinearEventList]:
-    with open(path, 'rb') as f:
-        ptr = Pointer(f.read(), 0, ENDIAN)
+_Chips = Optional[Iterable[str]]
+
+
+@profiling.timed('vgm.parse_vgm')
+def parse_vgm(path: str, mmap: bool = False, chips: _Chips = None) \
+        -> Tuple['VgmHeader', LinearEventList]:
+    """
+    :param mmap: If True, memory-map the file instead of reading it.
+        DataBlock.file (and other blob fields) become zero-copy memoryview slices
+        into the mapping (which stays open while they are referenced).
+    :param chips: See parse_body().
+    """
+    ptr = Pointer(load_vgm(path, mmap), 0, ENDIAN)
 
     header = VgmHeader.decode(ptr)
-    events = parse_body(ptr, header)
+    events = parse_body(ptr, header, chips)
     return header, events
 
 
+@profiling.timed('vgm.load_vgm')
+def load_vgm(path: str, mmap: bool = False) -> ByteString:
+    """ Returns the contents of a VGM file, as bytes or a read-only memoryview.
+
+    VGZ (gzip-compressed) files are decompressed. With mmap=True, they are decompressed
+    once into an anonymous memory map (a scratch buffer outside the Python heap).
+    """
+    with open(path, 'rb') as f:
+        if is_vgz(f):
+            if mmap:
+                return _decompress_to_mmap(f)
+            return gzip.decompress(f.read())
+
+        if mmap:
+            return memoryview(_mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ))
+        return f.read()
+
+
+# VGZ (gzip-compressed VGM)
+
+GZIP_MAGIC = b'\x1f\x8b'
+_GZIP_WBITS = 16 + zlib.MAX_WBITS  # zlib.decompressobj() argument for gzip format
+_CHUNK_SIZE = 0x10000
+
+
+def is_vgz(f: IO[bytes]) -> bool:
+    """ Check for gzip magic, without moving the file position. """
+    pos = f.tell()
+    magic = f.read(len(GZIP_MAGIC))
+    f.seek(pos)
+    return magic == GZIP_MAGIC
+
+
+def iter_decompress(f: IO[bytes], chunk_size: int = _CHUNK_SIZE) -> Iterator[bytes]:
+    """ Incrementally decompress a gzip file (which may have several members).
+    Yields chunks of at most chunk_size bytes. """
+    decompressor = zlib.decompressobj(_GZIP_WBITS)
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        while data:
+            out = decompressor.decompress(data, chunk_size)
+            if out:
+                yield out
+            if decompressor.eof:
+                # Start of next gzip member.
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(_GZIP_WBITS)
+            else:
+                data = decompressor.unconsumed_tail
+
+    out = decompressor.flush()
+    if out:
+        yield out
+
+
+def _decompress_to_mmap(f: IO[bytes]) -> memoryview:
+    # The gzip trailer holds the uncompressed size (mod 2**32).
+    pos = f.tell()
+    f.seek(-4, 2)
+    size = int.from_bytes(f.read(4), 'little')
+    f.seek(pos)
+
+    buf = _mmap.mmap(-1, max(size, 1))
+    nbytes = 0
+    for chunk in iter_decompress(f):
+        end = nbytes + len(chunk)
+        if end > len(buf):
+            # The size was wrong (eg. several gzip members).
+            # Don't resize(), which is unreliable for anonymous maps.
+            old, buf = buf, _mmap.mmap(-1, max(end, 2 * len(buf)))
+            buf[:nbytes] = old[:nbytes]
+            old.close()
+        buf[nbytes:end] = chunk
+        nbytes = end
+    return memoryview(buf)[:nbytes]
+
+
+# Header bytes at or after the VGM data (or after HEADER_SIZE) read as 0.
+HEADER_SIZE = 0x100
+_MIN_HEADER_SIZE = 0x40
+
+
+def _clock(addr: int) -> Field:
+    """ Chip clock in Hz (0 if the chip is unused).
+    Bit 31 is set if there are two chips. Some chips use bit 30 to select a variant. """
+    return meta('u32', addr=addr, default=0)
+
+
+def _u8(addr: int) -> Field:
+    return meta('u8', addr=addr, default=0)
+
+
 @dataclass
 class VgmHeader(DataStruct):
+    """ VGM header (up to version 1.71).
+
+    Offset fields are absolute addresses. gd3_addr, loop_addr and extra_addr are 0
+    if the file has no GD3 tag, loop, or extra header.
+    """
     nbytes: int = meta('offset', addr=0x04)
     version: int = meta('u32', addr=0x08)
     nsamp: int = meta('u32', addr=0x18)
@@ -44,26 +164,356 @@ class VgmHeader(DataStruct):
     # default arguments
     data_addr: int = meta('offset', addr=0x34)
 
+    sn76489_clock: int = _clock(0x0C)
+    ym2413_clock: int = _clock(0x10)
+    gd3_addr: int = meta('nullable_offset', addr=0x14, default=0)
+    loop_addr: int = meta('nullable_offset', addr=0x1C, default=0)
+    loop_nsamp: int = meta('u32', addr=0x20, default=0)
+    rate: int = meta('u32', addr=0x24, default=0)  # Playback rate in Hz (eg. 50, 60)
+    sn76489_feedback: int = meta('u16', addr=0x28, default=0)
+    sn76489_shift_width: int = _u8(0x2A)
+    sn76489_flags: int = _u8(0x2B)
+    ym2151_clock: int = _clock(0x30)
+    segapcm_clock: int = _clock(0x38)
+    segapcm_interface: int = meta('u32', addr=0x3C, default=0)
+
+    # Version 1.51+
+    rf5c68_clock: int = _clock(0x40)
+    ym2203_clock: int = _clock(0x44)
+    ym2608_clock: int = _clock(0x48)
+    ym2610_clock: int = _clock(0x4C)
+    ym3812_clock: int = _clock(0x50)
+    ym3526_clock: int = _clock(0x54)
+    y8950_clock: int = _clock(0x58)
+    ymf262_clock: int = _clock(0x5C)
+    ymf278b_clock: int = _clock(0x60)
+    ymf271_clock: int = _clock(0x64)
+    ymz280b_clock: int = _clock(0x68)
+    rf5c164_clock: int = _clock(0x6C)
+    pwm_clock: int = _clock(0x70)
+    ay8910_clock: int = _clock(0x74)
+    ay8910_type: int = _u8(0x78)
+    ay8910_flags: int = _u8(0x79)
+    ym2203_ay8910_flags: int = _u8(0x7A)
+    ym2608_ay8910_flags: int = _u8(0x7B)
+    volume_modifier: int = _u8(0x7C)
+    loop_base: int = meta('s8', addr=0x7E, default=0)
+    loop_modifier: int = _u8(0x7F)
+
+    # Version 1.61+
+    gb_dmg_clock: int = _clock(0x80)
+    nes_apu_clock: int = _clock(0x84)
+    multipcm_clock: int = _clock(0x88)
+    upd7759_clock: int = _clock(0x8C)
+    okim6258_clock: int = _clock(0x90)
+    okim6258_flags: int = _u8(0x94)
+    k054539_flags: int = _u8(0x95)
+    c140_type: int = _u8(0x96)
+    okim6295_clock: int = _clock(0x98)
+    k051649_clock: int = _clock(0x9C)
+    k054539_clock: int = _clock(0xA0)
+    huc6280_clock: int = _clock(0xA4)
+    c140_clock: int = _clock(0xA8)
+    k053260_clock: int = _clock(0xAC)
+    pokey_clock: int = _clock(0xB0)
+    qsound_clock: int = _clock(0xB4)
+
+    # Version 1.70+
+    scsp_clock: int = _clock(0xB8)
+    extra_addr: int = meta('nullable_offset', addr=0xBC, default=0)
+
+    # Version 1.71+
+    wonderswan_clock: int = _clock(0xC0)
+    vsu_clock: int = _clock(0xC4)
+    saa1099_clock: int = _clock(0xC8)
+    es5503_clock: int = _clock(0xCC)
+    es5506_clock: int = _clock(0xD0)
+    es5503_channels: int = _u8(0xD4)
+    es5506_channels: int = _u8(0xD5)
+    c352_divider: int = _u8(0xD6)
+    x1_010_clock: int = _clock(0xD8)
+    c352_clock: int = _clock(0xDC)
+    ga20_clock: int = _clock(0xE0)
+
     # magic values become default arguments
     magic: bytes = meta('magic', arg=b'Vgm ', addr=0x00)
 
     @classmethod
+    @profiling.timed('VgmHeader.decode')
     def decode(cls, ptr: Pointer) -> 'VgmHeader':
-        # do I also have to call super().decode in superclass? Maybe.
-        obj: VgmHeader = super().decode(ptr)
+        # Fields past the end of the header (which varies by version and data_addr)
+        # read as 0, so decode a zero-padded copy.
+        size = _header_size(ptr.u32(0x08), ptr.nullable_offset(0x34))
+        data = bytes(ptr.bytes_(max(min(size, len(ptr.data)), _MIN_HEADER_SIZE), 0))
+        obj: VgmHeader = super().decode(
+            Pointer(data.ljust(HEADER_SIZE, b'\0'), 0, ptr.endian))
 
         if obj.version < 0x150:
             obj.data_addr = 0x40
+        if obj.version < 0x110:
+            # The YM2413 clock field used to apply to all FM chips.
+            obj.ym2612_clock = obj.ym2151_clock = obj.ym2413_clock
 
         return obj
 
+    def encode(self, wrt: Writer) -> None:
+        """ Writes only the header's own bytes (up to data_addr). """
+        buf = BufferWriter(wrt.endian, HEADER_SIZE)
+        super().encode(buf)
+        wrt.bytes_(bytes(buf.getvalue()[:self.size]).ljust(self.size, b'\0'), 0)
 
-def parse_body(ptr: Pointer, header: VgmHeader) -> LinearEventList:
-    events: LinearEventList = []
+    @property
+    def size(self) -> int:
+        return _header_size(self.version, self.data_addr)
+
+    def chips(self) -> FrozenSet[str]:
+        """ Names of chips with a nonzero clock (see CHIPS, parse_body(chips)),
+        plus 'dac_stream' if there are any (DAC streams can write to any chip). """
+        chips = {chip for chip in CHIPS
+                 if getattr(self, f'{chip}_clock', 0) & _CLOCK_MASK}
+        if chips:
+            chips.add('dac_stream')
+        return frozenset(chips)
+
+
+_CLOCK_MASK = 0x3FFFFFFF
+
+
+def _header_size(version: int, data_addr: int) -> int:
+    if version < 0x150 or data_addr < _MIN_HEADER_SIZE:
+        return _MIN_HEADER_SIZE
+    return min(data_addr, HEADER_SIZE)
+
+
+# GD3 tag and extra header
+
+GD3_VERSION = 0x100
+_GD3_NSTRINGS = 11
+
+
+@dataclass
+class Gd3Tag:
+    """ GD3 tag: track metadata, usually stored after the VGM data.
+    Strings are stored as null-terminated UTF-16. Most have an English and a
+    Japanese version ('' if absent).
+    """
+    title: str = ''
+    title_jp: str = ''
+    game: str = ''
+    game_jp: str = ''
+    system: str = ''
+    system_jp: str = ''
+    author: str = ''
+    author_jp: str = ''
+    date: str = ''
+    ripper: str = ''
+    notes: str = ''
+    version: int = GD3_VERSION
+
+    MAGIC: ClassVar[bytes] = b'Gd3 '
+
+    @classmethod
+    def decode(cls, ptr: Pointer) -> 'Gd3Tag':
+        ptr.magic(cls.MAGIC)
+        version = ptr.u32()
+        nbytes = ptr.u32()
+
+        # Decode all strings at once, rather than scanning for each terminator.
+        text = ''
+        if nbytes:
+            text = bytes(ptr.bytes_(nbytes)).decode('utf-16-le', errors='replace')
+        strings = text.split('\0')[:_GD3_NSTRINGS]
+        return cls(*strings, version=version)
+
+    def encode(self, wrt: Writer) -> None:
+        strings = [getattr(self, f.name) for f in dataclasses.fields(self)]
+        data = ''.join(
+            string + '\0' for string in strings[:_GD3_NSTRINGS]).encode('utf-16-le')
+
+        wrt.bytes_(self.MAGIC)
+        wrt.u32(self.version)
+        wrt.u32(len(data))
+        wrt.bytes_(data)
+
+
+@dataclass
+class ExtraHeader:
+    """ Extra header (version 1.70+), with clocks and volumes of individual chips.
+
+    Chip IDs count the header's clock fields from sn76489_clock (0) up,
+    skipping fields which are not clocks. Bit 7 of a chip ID selects the second chip.
+    """
+    clocks: List[Tuple[int, int]]  # (chip ID, clock)
+    volumes: List[Tuple[int, int, int]]  # (chip ID, flags, volume)
+
+    @classmethod
+    def decode(cls, ptr: Pointer) -> 'ExtraHeader':
+        begin = ptr.addr
+        size = ptr.u32()
+        clock_addr = ptr.nullable_offset(begin + 4) if size >= 8 else 0
+        volume_addr = ptr.nullable_offset(begin + 8) if size >= 12 else 0
+
+        clocks = []
+        if clock_addr:
+            for _ in range(ptr.u8(clock_addr)):
+                clocks.append((ptr.u8(), ptr.u32()))
+
+        volumes = []
+        if volume_addr:
+            for _ in range(ptr.u8(volume_addr)):
+                volumes.append((ptr.u8(), ptr.u8(), ptr.u16()))
+
+        return cls(clocks, volumes)
+
+
+class VgmMetadata(NamedTuple):
+    header: VgmHeader
+    gd3: Optional[Gd3Tag]
+    extra: Optional[ExtraHeader]
+
+
+def decode_metadata(ptr: Pointer) -> VgmMetadata:
+    """ Decode the header, GD3 tag and extra header, by seeking to each.
+    The VGM data is never read. """
+    header = VgmHeader.decode(ptr)
+
+    gd3 = None
+    if header.gd3_addr:
+        ptr.seek(header.gd3_addr)
+        gd3 = Gd3Tag.decode(ptr)
+
+    extra = None
+    if header.extra_addr:
+        ptr.seek(header.extra_addr)
+        extra = ExtraHeader.decode(ptr)
+
+    return VgmMetadata(header, gd3, extra)
+
+
+@profiling.timed('vgm.read_metadata')
+def read_metadata(path: str) -> VgmMetadata:
+    """ Metadata of a VGM/VGZ file, without parsing its events (see decode_metadata()).
+
+    VGM files are memory-mapped, so only the pages holding the header and GD3 tag
+    are read from disk. VGZ files are still decompressed in full.
+    """
+    return decode_metadata(Pointer(load_vgm(path, mmap=True), 0, ENDIAN))
+
+
+@profiling.timed('vgm.parse_body')
+def parse_body(ptr: Pointer, header: VgmHeader, chips: _Chips = None) \
+        -> LinearEventList:
+    """
+    :param chips: Names of chips (see CHIPS) whose events are decoded.
+        Other chips' events are skipped by size, without creating objects.
+        Waits and chip-independent events (DataBlock...) are always decoded.
+        None decodes every chip.
+
+    Reserved commands (RESERVED_SIZES) are always skipped.
+    """
+    return list(iter_body(ptr, header, chips))
+
+
+def is_materialized(cls: Type[EventStruct], chips: Optional[AbstractSet[str]]) -> bool:
+    """ Whether parse_body(chips=chips) decodes events of type `cls`. """
+    return chips is None or cls.chip is None or cls.chip in chips or \
+        issubclass(cls, IWait)
+
+
+def _check_chips(chips: _Chips) -> Optional[FrozenSet[str]]:
+    if chips is None:
+        return None
+    chips = frozenset(chips)
+    if not chips <= CHIPS:
+        raise ValueError(f'unknown chips {sorted(chips - CHIPS)}')
+    return chips
+
+
+def _decoder_entry(command: Command, endian: str, chips: Optional[AbstractSet[str]]) \
+        -> Tuple[Optional[Callable], int]:
+    """ Returns (decode, command_offset) (see event_decoder()),
+    or (None, size) for commands which are skipped (size excludes the command ID).
+    """
+    cls = cmd2event.get(command)
+    if cls is None:
+        if command in RESERVED_SIZES:
+            return None, RESERVED_SIZES[command] - 1
+        raise VgmNotImplemented(f"Unhandled VGM command {command:#2x}")
+    if not is_materialized(cls, chips):
+        return None, event_layout(cls).size - 1
+
+    decode, command_offset = event_decoder(command, endian)
+    if profiling.active() is not None:
+        decode = profiling.wrap_decoder(command, decode)
+    return decode, command_offset
+
+
+# Streaming parser
+
+def iter_vgm(path: str, timed: bool = False) -> Iterator[EventStruct]:
+    """ Lazily parse a VGM file (memory-mapped, so memory use is bounded).
+
+    :param timed: If True, yield TimedEvent (see iter_timed_from_linear).
+
+    VGZ files are decompressed incrementally, so events are yielded before
+    the whole file is decompressed.
+    """
+    with open(path, 'rb') as f:
+        vgz = is_vgz(f)
+
+    if vgz:
+        events = iter_vgz_body(path)
+    else:
+        ptr = Pointer(load_vgm(path, mmap=True), 0, ENDIAN)
+        header = VgmHeader.decode(ptr)
+        events = iter_body(ptr, header)
+
+    if timed:
+        events = iter_timed_from_linear(events)
+    yield from events
+
+
+def iter_vgz_body(path: str, chunk_size: int = _CHUNK_SIZE) -> Iterator[EventStruct]:
+    """ Streaming parse of a VGZ file's events.
+    Decompressed chunks are fed to an IncrementalParser. """
+    parser = IncrementalParser()
+    with open(path, 'rb') as f:
+        for chunk in iter_decompress(f, chunk_size):
+            yield from parser.feed_linear(chunk)
+            if parser.done:
+                return
+
+    raise EndOfFileError(
+        f'{path}: VGM body has no terminator (command {EVENT_TERMINATOR:#x})')
+
+
+def iter_playlist(paths: Iterable[str]) -> Iterator['TimedEvent']:
+    """ Concatenate several VGM files into one TimedEvent stream.
+    Each file starts after the previous file's header.nsamp. """
+    time = 0
+    for path in paths:
+        ptr = Pointer(load_vgm(path, mmap=True), 0, ENDIAN)
+        header = VgmHeader.decode(ptr)
+
+        yield from iter_timed_from_linear(iter_body(ptr, header), time)
+        time += header.nsamp
+
+
+def iter_body(ptr: Pointer, header: VgmHeader, chips: _Chips = None) \
+        -> Iterator[EventStruct]:
+    """ See parse_body(). """
+    chips = _check_chips(chips)
+    # command -> (compiled decoder, command_offset) or (None, size to skip),
+    # filled on first use.
+    decoders: Dict[Command, tuple] = {}
 
+    nbytes = header.nbytes
     ptr.seek(header.data_addr)
     while True:
-        assert ptr.addr < header.nbytes
+        if ptr.addr >= nbytes:
+            raise EndOfFileError(
+                f'no end-of-data command before end of file ({nbytes:#x}) '
+                f'at {ptr.addr:#x}')
         command = ptr.u8()
 
         if command == EVENT_TERMINATOR:
@@ -72,12 +522,161 @@ def parse_body(ptr: Pointer, header: VgmHeader) -> LinearEventList:
             #     f"ptr.addr={ptr.addr} doesn't match header.nbytes={header.nbytes}"
             break
 
-        if command in cmd2event:
-            events.append(cmd2event[command].decode(ptr, command))
-        else:
-            raise VgmNotImplemented(f"Unhandled VGM command {command:#2x}")
+        try:
+            decode, command_offset = decoders[command]
+        except KeyError:
+            # Profiling is checked here (once per opcode), so when disabled,
+            # it costs nothing per event.
+            decode, command_offset = decoders[command] = \
+                _decoder_entry(command, ptr.endian, chips)
 
-    return events
+        if decode is None:
+            ptr.addr += command_offset
+            continue
+        yield decode(ptr, command_offset)
+
+
+class _BufferPointer(Pointer):
+    """ Pointer over a memoryview of IncrementalParser.buf.
+
+    bytes_() returns a copy, so blob fields do not reference the buffer.
+    On reading past the end, `need` is set to the end address of the read.
+    """
+    need = 0
+
+    def bytes_(self, length: int, addr: int = None) -> bytes:
+        try:
+            return bytes(super().bytes_(length, addr))
+        except EndOfFileError:
+            self.need = self.addr + length
+            raise
+
+    def unpack(self, st: struct.Struct, addr: int = None) -> tuple:
+        try:
+            return super().unpack(st, addr)
+        except EndOfFileError:
+            self.need = self.addr + st.size
+            raise
+
+
+class IncrementalParser:
+    """ Parse a VGM file which is still being written (eg. captured live).
+
+    Each feed() decodes only the new bytes (plus any incomplete command left over
+    from the previous feed), and returns the new events. An incomplete command
+    (eg. a large DataBlock) is only decoded again once the bytes it needs have arrived.
+    header.nbytes is ignored, since it may not be written until the file is complete.
+
+    Concatenating the output of every feed() equals
+    timed_from_linear(parse_body(...)) of the complete file.
+
+    :param chips: See parse_body().
+    """
+
+    header: Optional['VgmHeader']
+    addr: int  # File address of the first undecoded byte (start of buf)
+    time: int  # Time of the next event
+    done: bool  # True once the end-of-data command is read
+
+    def __init__(self, endian: str = ENDIAN, chips: _Chips = None):
+        self.endian = endian
+        self.chips = _check_chips(chips)
+        self.buf = bytearray()
+        self.header = None
+        self.addr = 0
+        self.time = 0
+        self.done = False
+        self._decoders: Dict[Command, tuple] = {}
+        # Length of buf needed to complete the incomplete command at its start.
+        self._need = 0
+
+    def feed(self, data: ByteString) -> 'TimedEventList':
+        """ Append data, and return the TimedEvents it completes. """
+        out = []
+        time = self.time
+        for event in self.feed_linear(data):
+            if not isinstance(event, PureWait):
+                out.append(TimedEvent(time, event))
+            if isinstance(event, IWait):
+                time += event.delay
+        self.time = time
+        return out
+
+    def feed_linear(self, data: ByteString) -> LinearEventList:
+        """ Append data, and return the events it completes (including waits).
+        Use either feed() or feed_linear() on one parser, since only feed() tracks time.
+        """
+        if self.done:
+            return []
+        self.buf += data
+
+        if self.header is None and not self._parse_header():
+            return []
+        if len(self.buf) < self._need:
+            # Still incomplete. Don't decode (or copy) the tail again.
+            return []
+
+        decoders = self._decoders
+        events = []
+        end = 0  # End of the last complete command
+        nbytes = len(self.buf)
+        view = memoryview(self.buf)
+        ptr = _BufferPointer(view, 0, self.endian)
+        try:
+            while ptr.addr < nbytes:
+                command = ptr.u8()
+                if command == EVENT_TERMINATOR:
+                    self.done = True
+                    end = ptr.addr
+                    break
+
+                try:
+                    decode, command_offset = decoders[command]
+                except KeyError:
+                    try:
+                        entry = _decoder_entry(command, self.endian, self.chips)
+                    except VgmNotImplemented as e:
+                        raise VgmNotImplemented(
+                            f'{e} at {self.addr + ptr.addr - 1:#x}') from None
+                    decode, command_offset = decoders[command] = entry
+
+                if decode is None:
+                    if ptr.addr + command_offset > nbytes:
+                        ptr.need = ptr.addr + command_offset
+                        break  # Incomplete
+                    ptr.addr += command_offset
+                else:
+                    events.append(decode(ptr, command_offset))
+                end = ptr.addr
+        except EndOfFileError:
+            # The last command is incomplete. Decode it once more data arrives.
+            pass
+        finally:
+            # Release the buffer, so it can be resized.
+            ptr.data.release()
+            view.release()
+
+        self._need = ptr.need - end
+        self._consume(end)
+        return events
+
+    def _parse_header(self) -> bool:
+        """ Returns True once the header and everything up to data_addr has arrived.
+        """
+        try:
+            header = VgmHeader.decode(Pointer(self.buf, 0, self.endian))
+        except EndOfFileError:
+            return False
+        if len(self.buf) < header.data_addr:
+            return False
+
+        self.header = header
+        self._consume(header.data_addr)
+        return True
+
+    def _consume(self, nbytes: int) -> None:
+        del self.buf[:nbytes]
+        self.addr += nbytes
 
 
 # Write VGM
@@ -90,53 +689,166 @@ def write_vgm(
         path: str,
         events: LinearEventList,
         orig_header: VgmHeader = None,
+        ym2612_clock: int = None,
+        buffered: bool = True,
+        compresslevel: Optional[int] = None,
+) -> None:
+    """
+    :param buffered: If True (default), encode into memory (BufferWriter),
+        packing fixed-size events in batches, then write the file in one call.
+        If False, encode each event directly to the file.
+    :param compresslevel: If not None, write a gzip-compressed VGZ file,
+        with compression level 0-9 (1 is fastest, 9 is smallest).
+        Defaults to 9 if path ends with .vgz. Compressed files are always buffered.
+    """
+    if compresslevel is None and path.lower().endswith('.vgz'):
+        compresslevel = 9
+
+    if compresslevel is not None or buffered:
+        save_vgm(path, encode_vgm(events, orig_header, ym2612_clock), compresslevel)
+    else:
+        with open(path, 'wb') as f:
+            _write_vgm(Writer(f, ENDIAN), events, orig_header, ym2612_clock)
+
+
+def save_vgm(path: str, data: ByteString, compresslevel: Optional[int] = None) -> None:
+    """ Write the contents of a VGM file (eg. from encode_vgm()).
+    :param compresslevel: See write_vgm().
+    """
+    if compresslevel is None and path.lower().endswith('.vgz'):
+        compresslevel = 9
+
+    if compresslevel is not None:
+        with gzip.open(path, 'wb', compresslevel) as f:
+            f.write(data)
+    else:
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def encode_vgm(
+        events: LinearEventList,
+        orig_header: VgmHeader = None,
+        ym2612_clock: int = None
+) -> memoryview:
+    """ Returns the contents of a VGM file.
+    `events` may be any iterable (it is read once).
+    """
+    # The buffer grows as needed.
+    wrt = BufferWriter(ENDIAN)
+    _write_vgm(wrt, events, orig_header, ym2612_clock)
+    return wrt.getvalue()
+
+
+def _write_vgm(
+        wrt: Writer,
+        events: LinearEventList,
+        orig_header: VgmHeader = None,
         ym2612_clock: int = None
 ) -> None:
-    with open(path, 'wb') as f:
-        wrt = Writer(f, ENDIAN)
+    data_addr = 0x40
+
+    # Write body
+    wrt.seek(data_addr)
+    nsamp = _write_events(wrt, events)
+    wrt.u8(EVENT_TERMINATOR)
+
+    # Write header (patched in place before the body).
+    nbytes = wrt.addr
+    header = VgmHeader(
+        nbytes=nbytes,
+        version=VGM_VERSION,
+        nsamp=nsamp,
+        ym2612_clock=YM2612_CLOCK,
+        data_addr=data_addr,
+    )
+
+    if orig_header:
+        header = dataclasses.replace(
+            header,
+            ym2612_clock=orig_header.ym2612_clock,
+        )
+
+    if ym2612_clock:
+        header.ym2612_clock = ym2612_clock
 
-        data_addr = 0x40
+    header.encode(wrt)
 
-        # Write body
-        wrt.seek(data_addr)
 
-        nsamp = 0
+def _write_events(wrt: Writer, events: Iterable[EventStruct]) -> int:
+    """ Encode events at wrt.addr, and return their total delay. """
+    # Sum delays while encoding, since `events` may be a one-shot iterator.
+    nsamp = 0
+
+    def count_delays(events):
+        nonlocal nsamp
         for event in events:
-            event.encode(wrt)
             if isinstance(event, IWait):
                 nsamp += event.delay
-        wrt.u8(EVENT_TERMINATOR)
-
-        # Write header
-        nbytes = wrt.addr
-        header = VgmHeader(
-            nbytes=nbytes,
-            version=VGM_VERSION,
-            nsamp=nsamp,
-            ym2612_clock=YM2612_CLOCK,
-            data_addr=data_addr,
-        )
+            yield event
+
+    if isinstance(wrt, BufferWriter):
+        encode_events(count_delays(events), wrt)
+    else:
+        for event in count_delays(events):
+            event.encode(wrt)
+    return nsamp
 
-        if orig_header:
-            header = dataclasses.replace(
-                header,
-                ym2612_clock=orig_header.ym2612_clock,
-            )
 
-        if ym2612_clock:
-            header.ym2612_clock = ym2612_clock
+def reencode_vgm(
+        data: ByteString,
+        events: Iterable[EventStruct],
+        loop_index: Optional[int] = None,
+) -> memoryview:
+    """ Returns the contents of a VGM file, with its VGM data replaced by `events`.
 
-        header.encode(wrt)
+    Every byte before data_addr is kept (the header, with chip clocks and options,
+    and any extra header), as is the GD3 tag (written after the new data).
+    nbytes, nsamp, gd3_addr, loop_addr and loop_nsamp are updated.
+
+    :param data: Contents of the original file (decompressed).
+    :param events: May be any iterable (it is read once).
+    :param loop_index: Position in `events` of the command the loop jumps back to.
+        If None, the output does not loop.
+    """
+    ptr = Pointer(data, 0, ENDIAN)
+    header, gd3, _ = decode_metadata(ptr)
+
+    wrt = BufferWriter(ENDIAN)
+    wrt.bytes_(bytes(ptr.bytes_(header.data_addr, 0)), 0)
+
+    events = iter(events)
+    loop_addr = loop_time = 0
+    if loop_index is not None:
+        loop_time = _write_events(wrt, itertools.islice(events, loop_index))
+        loop_addr = wrt.addr
+    nsamp = loop_time + _write_events(wrt, events)
+    wrt.u8(EVENT_TERMINATOR)
+
+    gd3_addr = 0
+    if gd3 is not None:
+        gd3_addr = wrt.addr
+        gd3.encode(wrt)
+    nbytes = wrt.addr
+
+    # Patch only these fields, so other header bytes are kept as-is.
+    wrt.offset(nbytes, 0x04)
+    wrt.nullable_offset(gd3_addr, 0x14)
+    wrt.u32(nsamp, 0x18)
+    wrt.nullable_offset(loop_addr, 0x1C)
+    wrt.u32(nsamp - loop_time if loop_addr else 0, 0x20)
+    return wrt.getvalue()
 
 
 # Event implementations
 
 class IWait(EventStruct):
+    __slots__ = ()
     delay: int
 
 
 class PureWait(IWait):
-    pass
+    __slots__ = ()
 
 
 # PCM
@@ -153,6 +865,19 @@ class PCMSeek(EventStruct):
     address: int = meta('u32')
 
 
+@register_cmd2event(0x68)
+class PCMRamWrite(EventStruct):
+    """0x68 0x66 tt ssssss dddddd llllll:
+    copy llllll bytes of data block type tt, from offset ssssss
+    to chip RAM offset dddddd. llllll=0 means 0x1000000 bytes.
+    """
+    magic: bytes = meta('hexmagic', '66')
+    typ: int = meta('u8')
+    read_offset: int = meta('u24')
+    write_offset: int = meta('u24')
+    nbytes: int = meta('u24')
+
+
 @register_cmd2event(*range(0x80, 0x90))
 class PCMWriteWait(IWait):
     """0x8n:
@@ -176,27 +901,507 @@ class Wait16Bit(PureWait):
     delay: int = meta('u16')
 
 
+@register_cmd2event(0x62)
+class Wait735(PureWait):
+    """0x62: wait 735 samples (1/60 of a second)."""
+    delay: ClassVar[int] = 735
+
+
+@register_cmd2event(0x63)
+class Wait882(PureWait):
+    """0x63: wait 882 samples (1/50 of a second)."""
+    delay: ClassVar[int] = 882
+
+
 # YM2612 FM
-@dataclass
+@event_dataclass
 class Write8as8(EventStruct):
     reg: int = meta('u8')
     value: int = meta('u8')
 
+    port: ClassVar[int] = 0
+
 
 @register_cmd2event(0x52)
 class YM2612Port0(Write8as8):
-    pass
+    chip = 'ym2612'
 
 
 @register_cmd2event(0x53)
 class YM2612Port1(Write8as8):
-    pass
+    chip = 'ym2612'
+    port = 1
 
 
+# SN76489 PSG
 @register_cmd2event(0x50)
 class PSGWrite(EventStruct):
     value: int = meta('u8')
 
+    chip: ClassVar[str] = 'sn76489'
+
+
+@register_cmd2event(0x4F)
+class GGStereo(EventStruct):
+    """0x4F: Game Gear PSG stereo, write value to port 0x06."""
+    value: int = meta('u8')
+
+    chip: ClassVar[str] = 'sn76489'
+
+
+@register_cmd2event(0x30)
+class PSGWrite2(EventStruct):
+    """0x30: PSGWrite to the second chip."""
+    value: int = meta('u8')
+
+    chip: ClassVar[str] = 'sn76489'
+
+
+@register_cmd2event(0x3F)
+class GGStereo2(EventStruct):
+    """0x3F: GGStereo to the second chip."""
+    value: int = meta('u8')
+
+    chip: ClassVar[str] = 'sn76489'
+
+
+@register_cmd2event(0x31)
+class AY8910StereoMask(EventStruct):
+    value: int = meta('u8')
+
+    chip: ClassVar[str] = 'ay8910'
+
+
+# Other chips: 0xaa 0xdd (write value dd to register aa)
+# 0xA1-0xAF write to the second chip of 0x51-0x5F (eg. YM2612Port0_2).
+# They are separate classes, so isinstance(e, YM2612Port0) only matches the first chip.
+
+@register_cmd2event(0x51)
+class YM2413(Write8as8):
+    chip = 'ym2413'
+
+
+@register_cmd2event(0x54)
+class YM2151(Write8as8):
+    chip = 'ym2151'
+
+
+@register_cmd2event(0x55)
+class YM2203(Write8as8):
+    chip = 'ym2203'
+
+
+@register_cmd2event(0x56)
+class YM2608Port0(Write8as8):
+    chip = 'ym2608'
+
+
+@register_cmd2event(0x57)
+class YM2608Port1(Write8as8):
+    chip = 'ym2608'
+    port = 1
+
+
+@register_cmd2event(0x58)
+class YM2610Port0(Write8as8):
+    chip = 'ym2610'
+
+
+@register_cmd2event(0x59)
+class YM2610Port1(Write8as8):
+    chip = 'ym2610'
+    port = 1
+
+
+@register_cmd2event(0x5A)
+class YM3812(Write8as8):
+    chip = 'ym3812'
+
+
+@register_cmd2event(0x5B)
+class YM3526(Write8as8):
+    chip = 'ym3526'
+
+
+@register_cmd2event(0x5C)
+class Y8950(Write8as8):
+    chip = 'y8950'
+
+
+@register_cmd2event(0x5D)
+class YMZ280B(Write8as8):
+    chip = 'ymz280b'
+
+
+@register_cmd2event(0x5E)
+class YMF262Port0(Write8as8):
+    chip = 'ymf262'
+
+
+@register_cmd2event(0x5F)
+class YMF262Port1(Write8as8):
+    chip = 'ymf262'
+    port = 1
+
+
+@register_cmd2event(0xA0)
+class AY8910(Write8as8):
+    chip = 'ay8910'
+
+
+@register_cmd2event(0xA1)
+class YM2413_2(Write8as8):
+    chip = 'ym2413'
+
+
+@register_cmd2event(0xA2)
+class YM2612Port0_2(Write8as8):
+    chip = 'ym2612'
+
+
+@register_cmd2event(0xA3)
+class YM2612Port1_2(Write8as8):
+    chip = 'ym2612'
+    port = 1
+
+
+@register_cmd2event(0xA4)
+class YM2151_2(Write8as8):
+    chip = 'ym2151'
+
+
+@register_cmd2event(0xA5)
+class YM2203_2(Write8as8):
+    chip = 'ym2203'
+
+
+@register_cmd2event(0xA6)
+class YM2608Port0_2(Write8as8):
+    chip = 'ym2608'
+
+
+@register_cmd2event(0xA7)
+class YM2608Port1_2(Write8as8):
+    chip = 'ym2608'
+    port = 1
+
+
+@register_cmd2event(0xA8)
+class YM2610Port0_2(Write8as8):
+    chip = 'ym2610'
+
+
+@register_cmd2event(0xA9)
+class YM2610Port1_2(Write8as8):
+    chip = 'ym2610'
+    port = 1
+
+
+@register_cmd2event(0xAA)
+class YM3812_2(Write8as8):
+    chip = 'ym3812'
+
+
+@register_cmd2event(0xAB)
+class YM3526_2(Write8as8):
+    chip = 'ym3526'
+
+
+@register_cmd2event(0xAC)
+class Y8950_2(Write8as8):
+    chip = 'y8950'
+
+
+@register_cmd2event(0xAD)
+class YMZ280B_2(Write8as8):
+    chip = 'ymz280b'
+
+
+@register_cmd2event(0xAE)
+class YMF262Port0_2(Write8as8):
+    chip = 'ymf262'
+
+
+@register_cmd2event(0xAF)
+class YMF262Port1_2(Write8as8):
+    chip = 'ymf262'
+    port = 1
+
+
+@register_cmd2event(0xB0)
+class RF5C68(Write8as8):
+    chip = 'rf5c68'
+
+
+@register_cmd2event(0xB1)
+class RF5C164(Write8as8):
+    chip = 'rf5c164'
+
+
+@register_cmd2event(0xB2)
+class PWM(Write8as8):
+    """0xB2 ad dd: write 12-bit value add & 0xFFF to register a.
+    (reg holds `ad`, value holds `dd`.)"""
+    chip = 'pwm'
+
+
+@register_cmd2event(0xB3)
+class GameBoyDMG(Write8as8):
+    chip = 'gb_dmg'
+
+
+@register_cmd2event(0xB4)
+class NESAPU(Write8as8):
+    chip = 'nes_apu'
+
+
+@register_cmd2event(0xB5)
+class MultiPCM(Write8as8):
+    chip = 'multipcm'
+
+
+@register_cmd2event(0xB6)
+class UPD7759(Write8as8):
+    chip = 'upd7759'
+
+
+@register_cmd2event(0xB7)
+class OKIM6258(Write8as8):
+    chip = 'okim6258'
+
+
+@register_cmd2event(0xB8)
+class OKIM6295(Write8as8):
+    chip = 'okim6295'
+
+
+@register_cmd2event(0xB9)
+class HuC6280(Write8as8):
+    chip = 'huc6280'
+
+
+@register_cmd2event(0xBA)
+class K053260(Write8as8):
+    chip = 'k053260'
+
+
+@register_cmd2event(0xBB)
+class Pokey(Write8as8):
+    chip = 'pokey'
+
+
+@register_cmd2event(0xBC)
+class WonderSwan(Write8as8):
+    chip = 'wonderswan'
+
+
+@register_cmd2event(0xBD)
+class SAA1099(Write8as8):
+    chip = 'saa1099'
+
+
+@register_cmd2event(0xBE)
+class ES5506(Write8as8):
+    chip = 'es5506'
+
+
+@register_cmd2event(0xBF)
+class GA20(Write8as8):
+    chip = 'ga20'
+
+
+# Other chips: 0xaaaa 0xdd (write value dd to address aaaa)
+
+@event_dataclass
+class Write16as8(EventStruct):
+    addr: int = meta('u16')
+    value: int = meta('u8')
+
+
+@register_cmd2event(0xC0)
+class SegaPCM(Write16as8):
+    chip = 'segapcm'
+
+
+@register_cmd2event(0xC1)
+class RF5C68Memory(Write16as8):
+    chip = 'rf5c68'
+
+
+@register_cmd2event(0xC2)
+class RF5C164Memory(Write16as8):
+    chip = 'rf5c164'
+
+
+@register_cmd2event(0xC3)
+class MultiPCMBank(EventStruct):
+    """0xC3 cc aaaa: set bank offset aaaa of channel cc."""
+    channel: int = meta('u8')
+    addr: int = meta('u16')
+
+    chip: ClassVar[str] = 'multipcm'
+
+
+@register_cmd2event(0xC4)
+class QSound(EventStruct):
+    """0xC4 mmll rr: write value mmll (big-endian) to register rr."""
+    value: int = meta('u16be')
+    reg: int = meta('u8')
+
+    chip: ClassVar[str] = 'qsound'
+
+
+# 0xmmll 0xdd: address is big-endian.
+@event_dataclass
+class Write16BEas8(EventStruct):
+    addr: int = meta('u16be')
+    value: int = meta('u8')
+
+
+@register_cmd2event(0xC5)
+class SCSP(Write16BEas8):
+    chip = 'scsp'
+
+
+@register_cmd2event(0xC6)
+class WonderSwanMemory(Write16BEas8):
+    chip = 'wonderswan'
+
+
+@register_cmd2event(0xC7)
+class VSU(Write16BEas8):
+    chip = 'vsu'
+
+
+@register_cmd2event(0xC8)
+class X1010(Write16BEas8):
+    chip = 'x1_010'
+
+
+# Other chips: 0xpp 0xaa 0xdd (write value dd to register aa of port pp)
+
+@event_dataclass
+class WritePort8as8(EventStruct):
+    port: int = meta('u8')
+    reg: int = meta('u8')
+    value: int = meta('u8')
+
+
+@register_cmd2event(0xD0)
+class YMF278B(WritePort8as8):
+    chip = 'ymf278b'
+
+
+@register_cmd2event(0xD1)
+class YMF271(WritePort8as8):
+    chip = 'ymf271'
+
+
+@register_cmd2event(0xD2)
+class SCC1(WritePort8as8):
+    chip = 'k051649'
+
+
+@register_cmd2event(0xD3)
+class K054539(WritePort8as8):
+    chip = 'k054539'
+
+
+@register_cmd2event(0xD4)
+class C140(WritePort8as8):
+    chip = 'c140'
+
+
+@register_cmd2event(0xD5)
+class ES5503(WritePort8as8):
+    chip = 'es5503'
+
+
+@register_cmd2event(0xD6)
+class ES5506Word(EventStruct):
+    """0xD6 aa ddee: write 16-bit value ddee (big-endian) to register aa."""
+    reg: int = meta('u8')
+    value: int = meta('u16be')
+
+    chip: ClassVar[str] = 'es5506'
+
+
+@register_cmd2event(0xE1)
+class C352(EventStruct):
+    """0xE1 mmll aadd: write value aadd to register mmll (both big-endian)."""
+    reg: int = meta('u16be')
+    value: int = meta('u16be')
+
+    chip: ClassVar[str] = 'c352'
+
+
+# DAC stream control (0x90-0x95): play data blocks through a chip register.
+
+@register_cmd2event(0x90)
+class DacStreamSetup(EventStruct):
+    stream: int = meta('u8')
+    chip_type: int = meta('u8')
+    port: int = meta('u8')
+    reg: int = meta('u8')  # Register written by the stream
+
+    chip: ClassVar[str] = 'dac_stream'
+
+
+@register_cmd2event(0x91)
+class DacStreamData(EventStruct):
+    stream: int = meta('u8')
+    bank: int = meta('u8')  # Data block type
+    step_size: int = meta('u8')
+    step_base: int = meta('u8')
+
+    chip: ClassVar[str] = 'dac_stream'
+
+
+@register_cmd2event(0x92)
+class DacStreamFrequency(EventStruct):
+    stream: int = meta('u8')
+    frequency: int = meta('u32')
+
+    chip: ClassVar[str] = 'dac_stream'
+
+
+@register_cmd2event(0x93)
+class DacStreamStart(EventStruct):
+    stream: int = meta('u8')
+    start: int = meta('u32')  # Data bank offset
+    length_mode: int = meta('u8')
+    length: int = meta('u32')
+
+    chip: ClassVar[str] = 'dac_stream'
+
+
+@register_cmd2event(0x94)
+class DacStreamStop(EventStruct):
+    stream: int = meta('u8')
+
+    chip: ClassVar[str] = 'dac_stream'
+
+
+@register_cmd2event(0x95)
+class DacStreamStartBlock(EventStruct):
+    stream: int = meta('u8')
+    block: int = meta('u16')
+    flags: int = meta('u8')
+
+    chip: ClassVar[str] = 'dac_stream'
+
+
+# Reserved commands, by size (including command ID). They are skipped when parsing.
+RESERVED_SIZES: Dict[Command, int] = {
+    **{command: 2 for command in range(0x32, 0x3F)},
+    **{command: 3 for command in range(0x40, 0x4F)},
+    **{command: 4 for command in [*range(0xC9, 0xD0), *range(0xD7, 0xE0)]},
+    **{command: 5 for command in range(0xE2, 0x100)},
+}
+
+# Every chip name used by EventStruct.chip.
+CHIPS = frozenset(cls.chip for cls in cmd2event.values() if cls.chip is not None)
+
 
 # **** Add timestamps to LinearEventList ****
 
@@ -209,17 +1414,20 @@ TimedEventList = List[TimedEvent]
 
 
 def timed_from_linear(events: LinearEventList) -> TimedEventList:
-    time = 0
-    time_events: TimedEventList = []
+    return list(iter_timed_from_linear(events))
+
 
+def iter_timed_from_linear(events: Iterable[EventStruct], time: int = 0) \
+        -> Iterator[TimedEvent]:
+    """
+    :param time: Time of the first event (used to concatenate files).
+    """
     for event in events:
         if not isinstance(event, PureWait):
-            time_events.append(TimedEvent(time, event))
+            yield TimedEvent(time, event)
         if isinstance(event, IWait):
             time += event.delay
 
-    return time_events
-
 
 time_event_list = timed_from_linear
 
@@ -258,11 +1466,7 @@ def _wait_for_time(duration: int) -> List[EventStruct]:
 
 
 def keep_type(time_events: TimedEventList, classes: List[type]) -> TimedEventList:
-    if not classes:
-        raise ValueError('empty classes')
-    return [
-        t_e for t_e in time_events if type(t_e.event) in classes
-    ]
+    return list(iter_keep_type(time_events, classes))
 
 
 _Condition = Callable[[EventStruct], bool]
@@ -273,15 +1477,11 @@ def filter_ev_type(
         cls: Type[T],
         cond: _Condition = lambda e: True
 ) -> TimedEventList:
-
-    # noinspection PyTypeHints
-    return [
-        t_e for t_e in time_events if isinstance(t_e.event, cls) and cond(t_e.event)
-    ]
+    return list(iter_filter_ev_type(time_events, cls, cond))
 
 
 def filter_ev(time_events: TimedEventList, cond: _Condition) -> TimedEventList:
-    return [t_e for t_e in time_events if cond(t_e.event)]
+    return list(iter_filter_ev(time_events, cond))
 
 
 def filter_ev_time(time_events: TimedEventList, begin=float('-inf'), end=float('inf')) \
@@ -293,9 +1493,218 @@ def map_ev(
         time_events: TimedEventList,
         func: Callable[[Any], Any]
 ) -> TimedEventList:
-    return [
+    return list(iter_map_ev(time_events, func))
+
+
+# Streaming versions: accept and return iterators, so they can be chained as a pipeline.
+# eg. iter_map_ev(iter_filter_ev_type(iter_vgm(path, timed=True), YM2612Port0), func)
+
+_TimedEvents = Iterable[TimedEvent]
+
+
+def iter_keep_type(time_events: _TimedEvents, classes: List[type]) \
+        -> Iterator[TimedEvent]:
+    if not classes:
+        raise ValueError('empty classes')
+    return (
+        t_e for t_e in time_events if type(t_e.event) in classes
+    )
+
+
+def iter_filter_ev_type(
+        time_events: _TimedEvents,
+        cls: Type[T],
+        cond: _Condition = lambda e: True
+) -> Iterator[TimedEvent]:
+
+    # noinspection PyTypeHints
+    return (
+        t_e for t_e in time_events if isinstance(t_e.event, cls) and cond(t_e.event)
+    )
+
+
+def iter_filter_ev(time_events: _TimedEvents, cond: _Condition) \
+        -> Iterator[TimedEvent]:
+    return (t_e for t_e in time_events if cond(t_e.event))
+
+
+def iter_filter_ev_time(
+        time_events: _TimedEvents, begin=float('-inf'), end=float('inf')
+) -> Iterator[TimedEvent]:
+    """ Stops reading input once time >= end (events are sorted by time). """
+    for t_e in time_events:
+        if t_e.time >= end:
+            break
+        if begin <= t_e.time:
+            yield t_e
+
+
+def iter_map_ev(
+        time_events: _TimedEvents,
+        func: Callable[[Any], Any]
+) -> Iterator[TimedEvent]:
+    return (
         TimedEvent(t_e.time, func(t_e.event))
         for t_e in time_events
-    ]
+    )
 
-    pass
+
+# **** Loops ****
+
+class LoopedTimeline(Sequence[TimedEvent]):
+    """ Read-only view of a TimedEventList, with its loop played `nloops` times.
+
+    Events at or after loop_time form the loop body. Past the first play-through,
+    position i maps to a body event (by divmod over the body length), delayed by
+    whole loop lengths. Nothing is copied, so memory does not depend on nloops.
+
+    The loop body starts at loop_index. from_header() finds it from the header's loop
+    offset, given the file offset of each event.
+    """
+
+    def __init__(
+            self,
+            time_events: Sequence[TimedEvent],
+            loop_time: int,
+            end_time: int,
+            nloops: int = 1,
+            times: Optional[Sequence[int]] = None,
+            loop_index: Optional[int] = None,
+    ):
+        """
+        :param loop_time: Time the loop starts.
+        :param end_time: Time the loop ends, and jumps back to loop_time.
+        :param nloops: Number of times the loop body plays (1 plays the song once).
+        :param times: Event times, if already computed (eg. TimedEventIndex.times).
+        :param loop_index: Position of the first event in the loop body.
+            Defaults to the first event at loop_time.
+        """
+        if nloops < 1:
+            raise ValueError(f'nloops must be >= 1, got {nloops}')
+        if not 0 <= loop_time <= end_time:
+            raise ValueError(f'invalid loop [{loop_time}, {end_time})')
+        if loop_time == end_time and nloops > 1:
+            raise ValueError('cannot repeat an empty loop')
+
+        self.time_events = time_events
+        if times is None:
+            times = array('q', (t_e.time for t_e in time_events))
+        self.times = times
+
+        self.loop_time = loop_time
+        self.end_time = end_time
+        self.nloops = nloops
+        self.loop_length = end_time - loop_time
+        if loop_index is None:
+            loop_index = bisect.bisect_left(times, loop_time)
+        elif not (0 <= loop_index <= len(times)
+                  and (loop_index == 0 or times[loop_index - 1] <= loop_time)
+                  and (loop_index == len(times) or times[loop_index] >= loop_time)):
+            raise ValueError(f'loop_index {loop_index} is not at loop_time {loop_time}')
+        self.loop_index = loop_index
+        self.body_len = len(time_events) - self.loop_index
+
+    @classmethod
+    def from_header(cls, source, header: VgmHeader, nloops: int = 1,
+                    offsets: Optional[Sequence[int]] = None):
+        """ Loop given by header.loop_addr and loop_nsamp. Songs without a loop play once.
+        :param source: First argument of the constructor.
+        :param offsets: File offset of each event in source (eg. the 'offset' column
+            of a columnar EventArray). The loop body starts at the event at
+            header.loop_addr. If None, it starts at the first event at the loop's time
+            (so events at that time which precede loop_addr are repeated too).
+        """
+        if not (header.loop_addr and header.loop_nsamp):
+            return cls(source, header.nsamp, header.nsamp)
+
+        loop_index = None
+        if offsets is not None:
+            loop_index = bisect.bisect_left(offsets, header.loop_addr)
+        return cls(source, header.nsamp - header.loop_nsamp, header.nsamp, nloops,
+                   loop_index=loop_index)
+
+    @property
+    def duration(self) -> int:
+        return self.end_time + (self.nloops - 1) * self.loop_length
+
+    def __len__(self):
+        return len(self.time_events) + (self.nloops - 1) * self.body_len
+
+    def locate(self, i: int) -> Tuple[int, int]:
+        """ Position i (0 <= i <= len) -> (loop iteration, position in time_events).
+        Iteration 0 is the first play-through, including the intro. """
+        if i < self.loop_index or not self.body_len:
+            return 0, i
+        k, j = divmod(i - self.loop_index, self.body_len)
+        return k, self.loop_index + j
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step == 1:
+                return self._slice(start, stop)
+            return [self[j] for j in range(start, stop, step)]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('LoopedTimeline index out of range')
+
+        k, j = self.locate(i)
+        t_e = self.time_events[j]
+        if not k:
+            return t_e
+        return TimedEvent(t_e.time + k * self.loop_length, t_e.event)
+
+    def _slice(self, start: int, stop: int) -> TimedEventList:
+        """ Copies one run of time_events per loop iteration. """
+        out = []
+        while start < stop:
+            k, j = self.locate(start)
+            n = min(stop - start, len(self.time_events) - j)
+            run = self.time_events[j:j + n]
+            if k:
+                delay = k * self.loop_length
+                run = [TimedEvent(time + delay, event) for time, event in run]
+            out += run
+            start += n
+        return out
+
+    def __iter__(self) -> Iterator[TimedEvent]:
+        yield from self.time_events
+        for k in range(1, self.nloops):
+            delay = k * self.loop_length
+            for time, event in itertools.islice(self.time_events, self.loop_index, None):
+                yield TimedEvent(time + delay, event)
+
+    # Time lookup
+
+    def index(self, time) -> int:
+        """ Position of the first event with t_e.time >= time. """
+        return self._bisect(time, right=False)
+
+    def index_after(self, time) -> int:
+        """ Position of the first event with t_e.time > time. """
+        return self._bisect(time, right=True)
+
+    def _bisect(self, time, right: bool) -> int:
+        bisect_ = bisect.bisect_right if right else bisect.bisect_left
+        if time < self.end_time or (time == self.end_time and not right):
+            return bisect_(self.times, time)
+        if time > self.duration or (time == self.duration and right):
+            return len(self)
+
+        # Find the iteration k whose times [loop_time, end_time] (shifted by
+        # k loop lengths) decide the position. Earlier iterations are all before.
+        if right:
+            k = (time - self.end_time) // self.loop_length + 1
+        else:
+            k = -(-(time - self.end_time) // self.loop_length)
+        k = int(k)
+        if k >= self.nloops:
+            return len(self)
+        local = time - k * self.loop_length
+        return bisect_(self.times, local, self.loop_index) + k * self.body_len
+
+    def window(self, begin=-math.inf, end=math.inf) -> TimedEventList:
+        """ Equivalent to filter_ev_time(list(self), begin, end). """
+        return self[self.index(begin):self.index(end)]
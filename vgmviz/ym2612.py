@@ -1,12 +1,14 @@
 import bisect
 import functools
 import math
-from typing import Union, Callable, List, TypeVar
+from array import array
+from typing import Union, Callable, List, TypeVar, Dict, Tuple, Optional
 
+import numpy as np
 from dataclasses import dataclass, replace
 
-from vgmviz import vgm
-from vgmviz.datastruct import EventStruct
+from vgmviz import vgm, profiling
+from vgmviz.datastruct import EventStruct, event_dataclass
 
 T = TypeVar('T')
 
@@ -51,7 +53,7 @@ class Register:
     param: int
 
 
-@dataclass
+@event_dataclass
 class UnpackedEvent:
     unpack: Register
     value: int
@@ -84,6 +86,79 @@ def reg_unpack(register: int) -> Register:
     return Register(chan, op, param)
 
 
+# Lookup tables
+
+NPORT = 2
+NCHAN = 6
+NOP = 4
+
+_PORT_CLASSES = (vgm.YM2612Port0, vgm.YM2612Port1)
+assert [cls.port for cls in _PORT_CLASSES] == list(range(NPORT))
+
+# _UNPACK[port][reg] = Register. Port0 maps to channels 0..2, Port1 maps to channels 3..5.
+# Each Register is created once, and shared by every event writing to it.
+_UNPACK: List[List[Register]] = [
+    [replace(reg_unpack(reg), chan=reg_unpack(reg).chan + 3 * port)
+     for reg in range(0x100)]
+    for port in range(NPORT)
+]
+
+# Register -> (port, reg), inverting ev_unpack (including registers reg_pack() rejects,
+# like 0x2B DAC enable).
+# ev_unpack is not one-to-one: Port0 registers with chan=3 collide with Port1 chan=0.
+# Global registers (< 0x30) only exist on Port0, and per-channel registers
+# with chan=3 don't exist, so collisions resolve to the register which exists.
+_UNPACK2PORT_REG: Dict[Register, Tuple[int, int]] = {}
+def _exists(port_reg: Tuple[int, int]) -> bool:
+    port, reg = port_reg
+    if reg < 0x30:
+        return port == 0
+    return reg & 0x03 != 0x03
+
+
+# Insert registers which exist last, so they overwrite collisions.
+for _port, _reg in sorted(((port, reg) for port in range(NPORT) for reg in range(0x100)),
+                          key=_exists):
+    _UNPACK2PORT_REG[_UNPACK[_port][_reg]] = (_port, _reg)
+del _port, _reg
+
+
+# Batch (NumPy) unpacking
+
+REGISTER_DTYPE = np.dtype([('chan', np.uint8), ('op', np.uint8), ('param', np.uint8)])
+
+# UNPACK_TABLE[port, reg] = (chan, op, param)
+UNPACK_TABLE = np.array([[(r.chan, r.op, r.param) for r in regs] for regs in _UNPACK],
+                        REGISTER_DTYPE)
+
+# PACK_TABLE[chan, op, param] = port * 0x100 + reg, or -1 if no register unpacks to it.
+# (chan goes up to 6, from Port1 registers with chan=3, which don't exist.)
+PACK_TABLE = np.full((NCHAN + 1, NOP, 0x100), -1, np.int16)
+for _unpack, (_port, _reg) in _UNPACK2PORT_REG.items():
+    PACK_TABLE[_unpack.chan, _unpack.op, _unpack.param] = _port * 0x100 + _reg
+del _unpack, _port, _reg
+
+
+def unpack_all(port: np.ndarray, reg: np.ndarray) -> np.ndarray:
+    """ Vectorized reg_unpack (with Port1 -> channels 3..5).
+    Returns an array of REGISTER_DTYPE, shaped like port and reg.
+
+    Works with columnar.EventArray columns: unpack_all(events['port'], events['reg']).
+    """
+    return UNPACK_TABLE[port, reg]
+
+
+def pack_all(chan: np.ndarray, op: np.ndarray, param: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """ Inverse of unpack_all(). Returns (port, reg) arrays. """
+    packed = PACK_TABLE[chan, op, param]
+    if (packed < 0).any():
+        bad = np.flatnonzero(packed < 0)[0]
+        raise ValueError(f'No register for chan={chan[bad]}, op={op[bad]}, '
+                         f'param={param[bad]:#x}')
+    return packed >> 8, packed & 0xFF
+
+
 # Packing and unpacking YM2612 registers
 
 _PackedRegEvent = Union['vgm.YM2612Port0', 'vgm.YM2612Port1']
@@ -108,13 +183,21 @@ def _(e) -> UnpackedEvent:
 
     Function is passed into map_ev. """
 
-    unpack = reg_unpack(e.reg)
+    return UnpackedEvent(_UNPACK[e.port][e.reg], e.value)
 
-    # YM2612 Port 1 accesses channels 3..5.
-    if isinstance(e, vgm.YM2612Port1):
-        unpack = replace(unpack, chan = unpack.chan + 3)
 
-    return UnpackedEvent(unpack, e.value)
+@profiling.timed_iter('ym2612.iter_ev_unpack')
+def iter_ev_unpack(time_events: 'vgm.TimedEventList'):
+    """ Streaming map_ev(time_events, ev_unpack).
+    time_events may be any iterable. Yields TimedEvents. """
+    # Skip singledispatch for the common case.
+    unpack = _UNPACK
+    TimedEvent = vgm.TimedEvent
+    for time, e in time_events:
+        if type(e) in _PORT_CLASSES:
+            yield TimedEvent(time, UnpackedEvent(unpack[e.port][e.reg], e.value))
+        else:
+            yield TimedEvent(time, ev_unpack(e))
 
 
 # Pack struct to port/register
@@ -126,17 +209,39 @@ def ev_pack(e: EventStruct) -> EventStruct:
 
 @ev_pack.register(UnpackedEvent)
 def _(e) -> _PackedRegEvent:
-    unpack = e.unpack
+    port, reg = _UNPACK2PORT_REG[e.unpack]
 
-    cls = vgm.YM2612Port0
-    if unpack.chan >= 3:
-        cls = vgm.YM2612Port1
-        unpack = replace(unpack, chan=unpack.chan-3)
+    # noinspection PyArgumentList
+    return _PORT_CLASSES[port](reg, e.value)
 
-    reg = reg_pack(unpack)
 
-    # noinspection PyArgumentList
-    return cls(reg, e.value)
+# Dense register state
+
+# Parameters stored by regfile_params(), in order.
+# FeedbackAlgo is per-channel, and is repeated for all 4 operators.
+PARAMS = (DetHarm, Atten, TrebAttack, AMDecay1, Decay2, KneeRelease, SSGEnvelope,
+          FeedbackAlgo)
+
+def _param_index() -> Tuple[np.ndarray, np.ndarray]:
+    """ (port, reg) arrays of shape (NCHAN, NOP, len(PARAMS)). """
+    port = np.empty((NCHAN, NOP, len(PARAMS)), np.intp)
+    reg = np.empty_like(port)
+
+    for chan in range(NCHAN):
+        for op in range(NOP):
+            for i, param in enumerate(PARAMS):
+                unpack = Register(chan, op if param < BEGIN_1OP else 0, param)
+                port[chan, op, i], reg[chan, op, i] = _UNPACK2PORT_REG[unpack]
+    return port, reg
+
+
+_PARAM_PORT, _PARAM_REG = _param_index()
+
+
+def regfile_params(regfile: np.ndarray) -> np.ndarray:
+    """ Register file uint8[..., 2 ports, 256 regs] -> uint8[..., NCHAN, NOP, PARAMS]
+    """
+    return regfile[..., _PARAM_PORT, _PARAM_REG]
 
 
 # Filter by register type
@@ -160,6 +265,7 @@ def reg_filter(chan=_wildcard, op=_wildcard, param=_wildcard) -> \
 TimedEventList = List['vgm.TimedEvent[T]']
 
 
+@profiling.timed('ym2612.bound_ev_time')
 def bound_ev_time(
         time_events: 'vgm.TimedEventList[UnpackedEvent]',
         begin=0,
@@ -169,50 +275,234 @@ def bound_ev_time(
     Filter by time (seconds).
     For each register ID, prepend the "previous state" at t=begin,
     and append the "ending state" at t=end.
+
+    To call this repeatedly on the same events, build a TimedEventIndex once
+    and call TimedEventIndex.bound_ev_time() instead.
     """
+    return TimedEventIndex(time_events).bound_ev_time(begin, end)
+
 
-    regs = sorted(set(t_e.event.unpack for t_e in time_events))
-    assert len(regs) < 0x100, '256+ registers, did you fail to deduplicate?'
+class TimedEventIndex:
+    """ Index over a TimedEventList[UnpackedEvent], built once in O(n).
+
+    Stores the sorted event times, and for each register, the sorted positions
+    of events writing to it. Time windows, register state at a time,
+    and bound_ev_time() are then binary searches instead of full passes.
+    """
 
-    # O(n) :(
-    times = [t_e.time for t_e in time_events]
+    @profiling.timed('TimedEventIndex.__init__')
+    def __init__(self, time_events: 'vgm.TimedEventList[UnpackedEvent]'):
+        self.time_events = time_events
+        self.times = array('q', (t_e.time for t_e in time_events))
 
-    i0 = bisect.bisect_left(times, begin)
-    i1 = bisect.bisect_left(times, end)
+        reg2positions = {}
+        for i, t_e in enumerate(time_events):
+            reg2positions.setdefault(t_e.event.unpack, array('q')).append(i)
 
-    # Find the "previous state" before t=begin.
-    before = time_events[:i0]
-    old_reg2event = {}
+        self.regs: List[Register] = sorted(reg2positions)
+        assert len(self.regs) < 0x100, '256+ registers, did you fail to deduplicate?'
 
-    for reg in regs:
-        old_reg2event[reg] = \
-            next((t_e.event for t_e in reversed(before) if t_e.event.unpack == reg),
-                 None)
+        self.reg2positions: Dict[Register, array] = {
+            reg: reg2positions[reg] for reg in self.regs}
 
-    # Find the "final state" at t=end.
-    during = time_events[i0:i1]
-    new_reg2event = {}
+    def __len__(self):
+        return len(self.time_events)
 
-    for reg in regs:
-        new_reg2event[reg] = \
-            next((t_e.event for t_e in reversed(during) if t_e.event.unpack == reg),
-                 old_reg2event[reg])
+    def __getitem__(self, i):
+        return self.time_events[i]
+
+    # Time lookup
+
+    def index(self, time) -> int:
+        """ Position of the first event with t_e.time >= time. """
+        return bisect.bisect_left(self.times, time)
+
+    def window(self, begin=-math.inf, end=math.inf) \
+            -> 'TimedEventList[UnpackedEvent]':
+        """ Equivalent to vgm.filter_ev_time(). """
+        return self.time_events[self.index(begin):self.index(end)]
+
+    # Register state
+
+    def last_events(self, i: int) -> Dict[Register, UnpackedEvent]:
+        """ For each register, the last event before position i
+        (omitting registers not written before i). """
+        out = {}
+        for reg, positions in self.reg2positions.items():
+            k = bisect.bisect_left(positions, i)
+            if k:
+                out[reg] = self.time_events[positions[k - 1]].event
+        return out
+
+    def state_before(self, time) -> Dict[Register, UnpackedEvent]:
+        """ Register state from events with t_e.time < time. """
+        return self.last_events(self.index(time))
+
+    def state_at(self, time) -> Dict[Register, UnpackedEvent]:
+        """ Register state from events with t_e.time <= time. """
+        return self.last_events(bisect.bisect_right(self.times, time))
+
+    @profiling.timed('TimedEventIndex.bound_ev_time')
+    def bound_ev_time(self, begin=0, end=math.inf) -> 'TimedEventList[UnpackedEvent]':
+        """ See module-level bound_ev_time(). """
+        return _bound_ev_time(self, begin, end)
+
+
+class LoopedEventIndex(vgm.LoopedTimeline):
+    """ TimedEventIndex over a looped song (see vgm.LoopedTimeline).
+
+    Each loop iteration starts with the register state at the end of the previous one.
+    Lookups reuse a TimedEventIndex of one play-through, so memory does not depend
+    on nloops.
+    """
+
+    def __init__(self, index: TimedEventIndex, loop_time: int, end_time: int,
+                 nloops: int = 1, loop_index: Optional[int] = None):
+        super().__init__(index.time_events, loop_time, end_time, nloops, index.times,
+                         loop_index)
+        self.event_index = index
+        # Register state at the end of each iteration.
+        self._end_state = index.last_events(len(index))
+
+    # Register state
+
+    def last_events(self, i: int) -> Dict[Register, UnpackedEvent]:
+        """ See TimedEventIndex.last_events(). """
+        k, j = self.locate(i)
+        index = self.event_index
+        if not k:
+            return index.last_events(j)
+
+        # State at the end of the song, updated by writes earlier in this iteration.
+        out = self._end_state.copy()
+        for reg, positions in index.reg2positions.items():
+            p = bisect.bisect_left(positions, j)
+            if p and positions[p - 1] >= self.loop_index:
+                out[reg] = index.time_events[positions[p - 1]].event
+        return out
+
+    def state_before(self, time) -> Dict[Register, UnpackedEvent]:
+        return self.last_events(self.index(time))
+
+    def state_at(self, time) -> Dict[Register, UnpackedEvent]:
+        return self.last_events(self.index_after(time))
+
+    @profiling.timed('LoopedEventIndex.bound_ev_time')
+    def bound_ev_time(self, begin=0, end=math.inf) -> 'TimedEventList[UnpackedEvent]':
+        """ See module-level bound_ev_time(). Windows may cross loop boundaries. """
+        return _bound_ev_time(self, begin, end)
+
+
+def _bound_ev_time(index: Union[TimedEventIndex, LoopedEventIndex], begin, end) \
+        -> 'TimedEventList[UnpackedEvent]':
+    i0 = index.index(begin)
+    i1 = index.index(end)
+
+    # The "previous state" before t=begin.
+    old_reg2event = index.last_events(i0)
+
+    # The "final state" at t=end. (If a register is not written during [i0, i1),
+    # this is the previous state.)
+    new_reg2event = index.last_events(i1)
 
     # Prepend old state, append new state.
     if end == math.inf:
-        end = times[-1]
+        end = index[-1].time
 
     def retime_events(time, reg2event):
         return [vgm.TimedEvent(time, event)
-                for event in reg2event.values()
-                if event is not None]
+                for event in reg2event.values()]
 
     out: TimedEventList[UnpackedEvent] = []
     out += retime_events(begin, old_reg2event)
-    out += during
+    out += index[i0:i1]
     out += retime_events(end, new_reg2event)
     return out
 
 
+# Channel timelines (vectorized over columnar.EventArray)
+
+FnumLo = 0xA0  # 8-bit frequency number low bits (writing it commits FnumHiBlock)
+FnumHiBlock = 0xA4  # 3-bit block (octave), 3-bit frequency number high bits (latched)
+KeyOn = 0x28  # 4-bit operator mask, 3-bit channel (Port0 only)
 
+# KeyOn channel field -> channel (values 3 and 7 are invalid)
+_KEY_CHANNELS = np.array([0, 1, 2, -1, 3, 4, 5, -1], np.int8)
 
+CHANNEL_DTYPE = np.dtype([
+    ('time', np.int64),
+    ('fnum', np.uint16),  # 11 bits
+    ('block', np.uint8),  # 3 bits
+    ('hz', np.float64),
+    ('key_on', np.uint8),  # Operator mask (bit 0 = operator 1 ... bit 3 = operator 4)
+])
+
+
+def fnum_to_hz(fnum, block, clock: int = vgm.YM2612_CLOCK):
+    """ Works on ints or arrays. """
+    return fnum * np.exp2(block) * (clock / 144 / (1 << 21))
+
+
+def channel_timelines(events: 'columnar.EventArray', clock: int = vgm.YM2612_CLOCK) \
+        -> List[np.ndarray]:
+    """ Per-channel pitch and key-on state, from columnar.parse_body() output.
+
+    Returns NCHAN arrays of CHANNEL_DTYPE. Each row is the channel state from `time`
+    until the next row's time, and differs from the previous row
+    (the first row is at time 0, state 0).
+    For a step plot: plt.step(ch['time'], ch['hz'], where='post').
+
+    Like the chip, a FnumHiBlock write is latched, and takes effect on the next
+    FnumLo write to that channel.
+    """
+    from vgmviz import columnar
+
+    events = columnar.keep_type(events, [vgm.YM2612Port0, vgm.YM2612Port1])
+    port = events['port'].astype(np.intp)
+    reg = events['reg'].astype(np.intp)
+    value = events['value'].astype(np.intp)
+
+    # Channel affected by each write (-1 if none).
+    reg_chan = np.where((reg & 3) != 3, (reg & 3) + 3 * port, -1)
+    is_lo = (reg & ~3) == FnumLo
+    is_hi = (reg & ~3) == FnumHiBlock
+    is_key = (reg == KeyOn) & (port == 0)
+    key_chan = _KEY_CHANNELS[value & 7]
+
+    return [_channel_timeline(events['time'], value,
+                              is_lo & (reg_chan == chan),
+                              is_hi & (reg_chan == chan),
+                              is_key & (key_chan == chan), clock)
+            for chan in range(NCHAN)]
+
+
+def _channel_timeline(time, value, is_lo, is_hi, is_key, clock) -> np.ndarray:
+    rows = np.flatnonzero(is_lo | is_hi | is_key)
+    time = time[rows]
+    # value[-1] (index -1) is the state before any write.
+    value = np.append(value[rows], 0)
+    is_lo, is_hi, is_key = is_lo[rows], is_hi[rows], is_key[rows]
+
+    def last(mask):
+        """ Position of the last True at or before each position (-1 if none). """
+        return np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+
+    lo_pos = last(is_lo)
+    # The latched FnumHiBlock, as of the last FnumLo write.
+    hi = np.append(value[last(is_hi)], 0)[lo_pos]
+    lo = value[lo_pos]
+    key = value[last(is_key)]
+
+    out = np.zeros(len(rows) + 1, CHANNEL_DTYPE)
+    out['time'][1:] = time
+    out['fnum'][1:] = ((hi & 0x07) << 8) | lo
+    out['block'][1:] = (hi >> 3) & 0x07
+    out['key_on'][1:] = key >> 4
+
+    # Keep the last row at each time, then drop rows that don't change state.
+    out = out[np.append(out['time'][1:] != out['time'][:-1], True)]
+    state = out[['fnum', 'block', 'key_on']]
+    out = out[np.append(True, state[1:] != state[:-1])]
+
+    out['hz'] = fnum_to_hz(out['fnum'], out['block'], clock)
+    return out